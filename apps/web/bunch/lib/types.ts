@@ -51,10 +51,12 @@ export interface Reaction {
   user: User
   emoji: string
   created_at: string
+  seq?: number
 }
 
 export interface Message {
   id: string
+  seq?: number // per channel, increasing
   channel: string // Channel ID
   author: Member // Actually returns expanded Member object
   content: string
@@ -102,10 +104,98 @@ export enum WSMessageTypeServer {
   CHAT_MESSAGE = "chat.message",
   REACTION_NEW = "reaction.new",
   REACTION_DELETE = "reaction.delete",
+  // message: the changed fields only, see MessageDelta
+  MESSAGE_UPDATED = "message.updated",
+  MESSAGE_DELETED = "message.deleted",
+  // fell too far behind, sent before the connection is closed (4008)
+  RESUME = "resume",
+  // bunch-wide events, sent to every member's connections
+  MEMBER_JOINED = "member.joined",
+  MEMBER_UPDATED = "member.updated",
+  MEMBER_LEFT = "member.left",
+  CHANNEL_CREATED = "channel.created",
+  CHANNEL_UPDATED = "channel.updated",
+  CHANNEL_DELETED = "channel.deleted",
+}
+
+// frame encodings: ?protocol=<name> or the "bunch.<name>" subprotocol.
+// Binary frames use COMPACT_KEYS and epoch-millis timestamps.
+export enum WSProtocol {
+  JSON = "json",
+  MSGPACK = "msgpack",
+  CBOR = "cbor",
+}
+
+// field -> key in binary frames (other fields keep their name)
+export const COMPACT_KEYS: Record<string, string> = {
+  type: "t",
+  seq: "s",
+  id: "i",
+  message: "m",
+  reaction: "r",
+  channel: "c",
+  author: "a",
+  bunch: "b",
+  user: "u",
+  username: "n",
+  role: "ro",
+  joined_at: "ja",
+  content: "co",
+  created_at: "ca",
+  updated_at: "ua",
+  edit_count: "ec",
+  deleted: "d",
+  deleted_at: "da",
+  reply_to_id: "ri",
+  reply_to_preview: "rp",
+  reply_count: "rc",
+  emoji: "e",
+  message_id: "mi",
+  channel_id: "ci",
+  bunch_id: "bi",
+  last_seq: "ls",
+  replayed: "rd",
+  resync: "rs",
+  timestamp: "ts",
+  server_time: "st",
+  channels: "cs",
+  denied: "dn",
+  member: "mb",
 }
 
 export interface WebSocketMessage {
   type: WSMessageTypeClient
-  message?: Message
+  message?: Message | MessageDelta
   reaction?: Reaction
+  seq?: number // channel seq of a broadcast event, resume with last_seq
+  last_seq?: Record<string, number> // resume: channel id -> last seq written
+  // batch subscribed/unsubscribed replies
+  channels?: ChannelSubscription[]
+  denied?: { bunch_id: string; channel_id: string | null }[]
+  // bunch-wide events
+  bunch_id?: string
+  channel_id?: string
+  member?: Member
+  channel?: Channel
+}
+
+// message.updated and message.deleted: patch the message with the same id
+export type MessageDelta = Pick<Message, "id"> & {
+  channel: string
+  content?: string
+  edit_count?: number
+  updated_at?: string
+  deleted?: boolean
+  deleted_at?: string
+}
+
+// subscribe/unsubscribe many channels in one frame: send `channels`, or
+// only a `bunch_id` for all of its channels
+export interface ChannelSubscription {
+  bunch_id: string
+  channel_id: string
+  last_seq?: number
+  // in subscribed replies
+  replayed?: number
+  resync?: boolean
 }
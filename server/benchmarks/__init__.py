@@ -0,0 +1,11 @@
+"""
+Micro and end-to-end benchmarks for orchard.
+
+Run them from the server directory, e.g.
+
+    uv run --env-file .env python -m benchmarks.auth
+
+Each benchmark creates (and drops) its own test database. Set
+``BENCH_SQLITE=True`` to use a throwaway in-memory sqlite database instead of
+the configured postgres one.
+"""
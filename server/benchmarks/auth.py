@@ -0,0 +1,112 @@
+"""
+Requests/sec of an authenticated REST call with local vs remote JWT checks.
+
+By default the remote mode uses a stand-in for supabase auth that sleeps for
+``--remote-latency-ms``; pass ``--live-token`` (a real access token for a user
+of the configured project) to hit supabase auth for real.
+
+    uv run --env-file .env python -m benchmarks.auth
+"""
+
+import argparse
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from benchmarks.common import measure, report, setup, temporary_database
+
+BENCH_JWT_KEY = "benchmark-jwt-secret-that-is-long-enough"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--remote-latency-ms", type=float, default=40.0)
+    parser.add_argument("--live-token", default=None)
+    args = parser.parse_args()
+
+    setup()
+
+    import jwt
+    from django.conf import settings
+    from django.test import Client, override_settings
+
+    from users.models import User
+
+    with temporary_database():
+        user = User.objects.create_user(
+            username="bench", email="bench@example.com", password=None
+        )
+
+        if args.live_token:
+            token = args.live_token
+            claims = jwt.decode(token, options={"verify_signature": False})
+            User.objects.filter(id=user.id).update(id=claims["sub"])
+            key_settings = {}
+        else:
+            token = jwt.encode(
+                {
+                    "sub": str(user.id),
+                    "email": user.email,
+                    "aud": "authenticated",
+                    "exp": int(time.time()) + 3600,
+                },
+                BENCH_JWT_KEY,
+                algorithm="HS256",
+            )
+            key_settings = {"SUPABASE_JWT_KEY": BENCH_JWT_KEY}
+
+        def remote_stand_in(self, jwt_token=None):
+            time.sleep(args.remote_latency_ms / 1000)
+            return SimpleNamespace(
+                user=SimpleNamespace(
+                    id=str(user.id), email=user.email, user_metadata={}
+                )
+            )
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        def call():
+            response = client.get("/api/v1/user/me/")
+            assert response.status_code == 200, response.status_code
+
+        rows = []
+        for mode, cache_size in (
+            ("local", 0),
+            ("remote", 0),
+            ("local", settings.AUTH_USER_CACHE_SIZE),
+            ("remote", settings.AUTH_USER_CACHE_SIZE),
+        ):
+            with override_settings(
+                SUPABASE_JWT_VERIFICATION=mode,
+                AUTH_USER_CACHE_SIZE=cache_size,
+                **key_settings,
+            ):
+                if args.live_token:
+                    calls, elapsed = measure(call, duration=args.duration)
+                else:
+                    with patch(
+                        "orchard.services.SupabaseService.get_user",
+                        new=remote_stand_in,
+                    ):
+                        calls, elapsed = measure(call, duration=args.duration)
+
+            rows.append(
+                (
+                    mode,
+                    "on" if cache_size else "off",
+                    calls,
+                    calls / elapsed,
+                    elapsed / calls * 1000,
+                )
+            )
+
+        report(
+            "GET /api/v1/user/me/",
+            ("mode", "user cache", "requests", "req/s", "ms/req"),
+            rows,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Throughput of websocket messages saved one by one vs write-behind batches.
+
+``--senders`` connections each send ``--messages`` messages to a channel as
+fast as they are acknowledged, as ChatConsumer handles ``message.new`` minus
+the broadcast. "single" is ChatConsumer._save_message, a transaction per
+message; "batched" is MessageBatcher.save at each ``--max-sizes`` bound and
+``--max-delay``, a transaction and bulk INSERT per batch.
+
+    uv run --env-file .env python -m benchmarks.batching
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import report, setup, temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument(
+        "--max-sizes", type=int, nargs="+", default=[10, 50, 100]
+    )
+    parser.add_argument("--max-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    setup()
+
+    from channels.db import database_sync_to_async
+
+    from bunch.batching import MessageBatcher
+    from bunch.consumers import ChatConsumer
+    from bunch.models import Bunch, Channel
+    from users.models import User
+
+    with temporary_database():
+        user = User.objects.create_user(
+            username="bench", email="bench@example.com", password=None
+        )
+        bunch = Bunch.objects.create(name="bench", owner=user)
+        channel = Channel.objects.create(bunch=bunch, name="general")
+        member = bunch.members.get(user=user)
+        member.user = user
+        channel_id = str(channel.id)
+
+        consumer = ChatConsumer()
+        save_message = database_sync_to_async(consumer._save_message)
+
+        async def single(content):
+            return await save_message(member, channel_id, content)
+
+        def batched(batcher):
+            async def save(content):
+                return await batcher.save(member, channel_id, content)
+
+            return save
+
+        async def sender(save):
+            for i in range(args.messages):
+                await save(f"message {i}")
+
+        async def run(save):
+            await asyncio.gather(*(sender(save) for _ in range(args.senders)))
+
+        total = args.senders * args.messages
+        rows = []
+        for label, save in (
+            ("single", single),
+            *(
+                (
+                    f"batched, max {size}",
+                    batched(MessageBatcher(size, args.max_delay)),
+                )
+                for size in args.max_sizes
+            ),
+        ):
+            asyncio.run(run(save))  # warm up
+
+            start = time.perf_counter()
+            asyncio.run(run(save))
+            elapsed = time.perf_counter() - start
+
+            rows.append((label, total / elapsed, elapsed / total * 1e6))
+
+    report(
+        f"message.new from {args.senders} senders, "
+        f"{args.messages} messages each",
+        ("saving", "messages/s", "us/message"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
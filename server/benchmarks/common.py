@@ -0,0 +1,95 @@
+import contextlib
+import logging
+import os
+import time
+from collections.abc import Callable, Iterator, Sequence
+
+
+def setup() -> None:
+    """Configure django for a standalone benchmark script."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orchard.settings")
+
+    import django
+    from django.conf import settings
+
+    if os.getenv("BENCH_SQLITE", "False") == "True":
+        settings.DATABASES["default"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": ":memory:",
+        }
+
+    django.setup()
+
+    # debug logging on the hot path would dominate every measurement
+    logging.disable(logging.INFO)
+
+
+@contextlib.contextmanager
+def temporary_database() -> Iterator[None]:
+    """Create a fresh test database for the duration of the block."""
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment,
+        teardown_test_environment,
+    )
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(
+    fn: Callable[[], object],
+    duration: float = 2.0,
+    warmup: int = 10,
+) -> tuple[int, float]:
+    """
+    Call ``fn`` repeatedly for about ``duration`` seconds.
+
+    Returns:
+        (number of calls, elapsed seconds)
+    """
+    for _ in range(warmup):
+        fn()
+
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while True:
+        fn()
+        calls += 1
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls, now - start
+
+
+def report(
+    title: str,
+    headers: Sequence[str],
+    rows: Sequence[Sequence[object]],
+) -> None:
+    """Print ``rows`` as a plain aligned table."""
+
+    def fmt(value: object) -> str:
+        if isinstance(value, float):
+            return f"{value:,.2f}"
+        if isinstance(value, int):
+            return f"{value:,}"
+        return str(value)
+
+    cells = [[fmt(v) for v in row] for row in rows]
+    widths = [
+        max([len(h), *(len(row[i]) for row in cells)])
+        for i, h in enumerate(headers)
+    ]
+
+    print(f"\n{title}")
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in cells:
+        print("  ".join(c.rjust(w) for c, w in zip(row, widths)))
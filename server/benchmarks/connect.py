@@ -0,0 +1,163 @@
+"""
+Authentication cost of a websocket connect storm.
+
+``--connects`` clients connect at once, each with its own token. "before"
+authenticates like ChatConsumer.connect used to, with the DRF authenticator
+behind ``database_sync_to_async`` (one shared thread for every connect);
+"after" resolves the scope user in SupabaseChannelsAuthMiddleware with
+``aauthenticate_token``. Remote mode uses a stand-in for supabase auth that
+sleeps for ``--remote-latency-ms``.
+
+"max stall" is the longest the event loop went without running a 1 ms ticker,
+i.e. how long every other socket on the worker was frozen.
+
+    uv run --env-file .env python -m benchmarks.connect
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from benchmarks.common import report, setup, temporary_database
+
+BENCH_JWT_KEY = "benchmark-jwt-secret-that-is-long-enough"
+
+
+async def storm(connect, tokens) -> tuple[float, float]:
+    """Run ``connect(token)`` for every token at once, (elapsed, max stall)."""
+    stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last - 0.001)
+            last = now
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(connect(token) for token in tokens))
+    elapsed = time.perf_counter() - start
+    done = True
+    await ticking
+
+    return elapsed, stall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connects", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--remote-latency-ms", type=float, default=40.0)
+    args = parser.parse_args()
+
+    setup()
+
+    import jwt
+    from channels.db import database_sync_to_async
+    from django.http import HttpRequest
+    from django.test import override_settings
+
+    from orchard.auth_cache import get_token_user_cache
+    from orchard.authentication import SupabaseJWTAuthentication
+    from orchard.middleware import SupabaseChannelsAuthMiddleware
+    from orchard.throttling import get_negative_token_cache
+    from users.models import User
+
+    with (
+        temporary_database(),
+        override_settings(SUPABASE_JWT_KEY=BENCH_JWT_KEY),
+    ):
+        users = User.objects.bulk_create(
+            User(username=f"bench{i}", email=f"bench{i}@example.com")
+            for i in range(args.users)
+        )
+        by_id = {str(user.id): user for user in users}
+        tokens = [
+            jwt.encode(
+                {
+                    "sub": str(users[i % len(users)].id),
+                    "email": users[i % len(users)].email,
+                    "aud": "authenticated",
+                    "exp": int(time.time()) + 3600,
+                    # unique tokens, so the user cache only helps per token
+                    "jti": str(i),
+                },
+                BENCH_JWT_KEY,
+                algorithm="HS256",
+            )
+            for i in range(args.connects)
+        ]
+
+        def remote_stand_in(self, jwt_token=None):
+            time.sleep(args.remote_latency_ms / 1000)
+            claims = jwt.decode(jwt_token, options={"verify_signature": False})
+            user = by_id[claims["sub"]]
+            return SimpleNamespace(
+                user=SimpleNamespace(
+                    id=str(user.id), email=user.email, user_metadata={}
+                )
+            )
+
+        async def before(token):
+            request = HttpRequest()
+            request.META["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+            request.META["REMOTE_ADDR"] = "127.0.0.1"
+            result = await database_sync_to_async(
+                SupabaseJWTAuthentication().authenticate
+            )(request)
+            assert result is not None
+
+        async def inner_app(scope, receive, send):
+            assert scope["user"].is_authenticated
+
+        middleware = SupabaseChannelsAuthMiddleware(inner_app)
+
+        async def after(token):
+            scope = {
+                "type": "websocket",
+                "query_string": f"token={token}".encode(),
+                "client": ("127.0.0.1", 1234),
+            }
+            await middleware(scope, None, None)
+
+        rows = []
+        for mode in ("local", "remote"):
+            for label, connect in (("before", before), ("after", after)):
+                get_token_user_cache().clear()
+                get_negative_token_cache().clear()
+
+                with (
+                    override_settings(SUPABASE_JWT_VERIFICATION=mode),
+                    patch(
+                        "orchard.services.SupabaseService.get_user",
+                        new=remote_stand_in,
+                    ),
+                ):
+                    elapsed, stall = asyncio.run(storm(connect, tokens))
+
+                rows.append(
+                    (
+                        mode,
+                        label,
+                        args.connects,
+                        args.connects / elapsed,
+                        elapsed * 1000,
+                        stall * 1000,
+                    )
+                )
+
+        report(
+            f"{args.connects} concurrent websocket connects",
+            ("mode", "path", "connects", "conn/s", "total ms", "max stall ms"),
+            rows,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+CPU per delivered message when a chat message is broadcast to a channel.
+
+Every subscriber's ChatConsumer.chat_message handler runs for one group
+event. "before" is an event carrying the message dict, which each consumer
+json-encodes for its socket, as all broadcasts used to; "after" carries the
+frame pre-encoded once by the sender (bunch.broadcast), which consumers write
+as is. The socket write itself is stubbed out.
+
+    uv run --env-file .env python -m benchmarks.fanout
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from benchmarks.common import report, setup
+
+
+def message_payload() -> dict:
+    now = "2025-01-01T12:00:00.000000+00:00"
+    return {
+        "id": str(uuid.uuid4()),
+        "channel": str(uuid.uuid4()),
+        "author": {
+            "id": str(uuid.uuid4()),
+            "bunch": str(uuid.uuid4()),
+            "user": {"id": str(uuid.uuid4()), "username": "someone"},
+            "role": "member",
+            "joined_at": now,
+        },
+        "content": "hello there, how is everyone doing today? " * 4,
+        "created_at": now,
+        "updated_at": now,
+        "edit_count": 0,
+        "deleted": False,
+        "deleted_at": None,
+        "reply_to_id": None,
+        "reply_to_preview": None,
+        "reply_count": 0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--subscribers", type=int, nargs="+", default=[100, 1_000, 10_000]
+    )
+    parser.add_argument("--broadcasts", type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+
+    from bunch.broadcast import chat_message_event
+    from bunch.consumers import ChatConsumer
+
+    async def discard(message):
+        pass
+
+    def make_consumer():
+        consumer = ChatConsumer()
+        consumer._is_connected = True
+        consumer.base_send = discard
+        return consumer
+
+    async def broadcast(consumers, make_event) -> float:
+        """CPU seconds to encode and deliver ``--broadcasts`` messages."""
+        start = time.process_time()
+        for _ in range(args.broadcasts):
+            event = make_event(message_payload())
+            for consumer in consumers:
+                await consumer.chat_message(event)
+        return time.process_time() - start
+
+    def before(message):
+        return {"type": "chat.message", "message": message}
+
+    rows = []
+    for subscribers in args.subscribers:
+        consumers = [make_consumer() for _ in range(subscribers)]
+        for label, make_event in (
+            ("before", before),
+            ("after", chat_message_event),
+        ):
+            # warm up
+            asyncio.run(broadcast(consumers[:10], make_event))
+            cpu = asyncio.run(broadcast(consumers, make_event))
+
+            delivered = subscribers * args.broadcasts
+            rows.append(
+                (
+                    subscribers,
+                    label,
+                    delivered,
+                    cpu / args.broadcasts * 1000,
+                    cpu / delivered * 1e6,
+                )
+            )
+
+    report(
+        "chat.message fan-out",
+        ("subscribers", "event", "delivered", "ms/broadcast", "us/delivery"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
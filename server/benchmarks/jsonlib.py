@@ -0,0 +1,112 @@
+"""
+Message list requests per second, by JSON backend.
+
+The message list endpoint (MessageViewSet.list) is asked for the newest
+page of ``--page-sizes`` messages of a channel, every other one with a few
+reactions, with each installed JSON_BACKEND (orchard.jsonlib). "render only"
+rows time the renderer alone, on the page's data.
+
+    uv run --env-file .env python -m benchmarks.jsonlib
+"""
+
+import argparse
+from functools import partial
+
+from benchmarks.common import measure, report, setup, temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument(
+        "--page-sizes", type=int, nargs="+", default=[100, 1000]
+    )
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.test import override_settings
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from bunch.models import Bunch, Channel, Message, Reaction
+    from bunch.views import MessageViewSet
+    from orchard.jsonlib import BACKENDS, available
+    from orchard.renderers import JSONRenderer
+    from users.models import User
+
+    with temporary_database():
+        users = [
+            User.objects.create_user(
+                username=f"bench{i}",
+                email=f"bench{i}@example.com",
+                password=None,
+            )
+            for i in range(20)
+        ]
+        bunch = Bunch.objects.create(name="bench", owner=users[0])
+        members = [bunch.members.get(user=users[0])] + [
+            bunch.members.create(user=user) for user in users[1:]
+        ]
+        channel = Channel.objects.create(bunch=bunch, name="general")
+        messages = Message.objects.bulk_create(
+            Message(
+                channel=channel,
+                author=members[i % len(members)],
+                content=f"message {i}, sounds good, see you there 👍",
+                seq=i + 1,
+            )
+            for i in range(args.messages)
+        )
+        # saved one by one, so the reaction counts are kept
+        for i, message in enumerate(messages[-max(args.page_sizes) :]):
+            if i % 2:
+                continue
+            for j, emoji in enumerate(("👍", "🎉", "👍")):
+                Reaction.objects.create(
+                    message=message,
+                    user=users[(i + j) % len(users)],
+                    emoji=emoji,
+                )
+
+        view = MessageViewSet.as_view({"get": "list"})
+        factory = APIRequestFactory()
+        renderer = JSONRenderer()
+        rows = []
+        for size in args.page_sizes:
+
+            def get(size=size):
+                request = factory.get(
+                    f"/api/v1/bunch/{bunch.id}/messages/",
+                    {"channel": str(channel.id), "page_size": size},
+                    HTTP_ACCEPT="application/json",
+                )
+                force_authenticate(request, user=users[0])
+                response = view(request, bunch_id=bunch.id)
+                response.render()
+                return response
+
+            for backend in BACKENDS:
+                if not available(backend):
+                    continue
+                with override_settings(JSON_BACKEND=backend):
+                    data = get().data
+                    calls, elapsed = measure(get, args.duration, warmup=1)
+                    rows.append((size, backend, "request", calls / elapsed))
+                    calls, elapsed = measure(
+                        partial(renderer.render, data),
+                        args.duration,
+                        warmup=1,
+                    )
+                    rows.append((size, backend, "render only", calls / elapsed))
+
+    report(
+        f"Message list pages of a channel of {args.messages:,}, by JSON "
+        "backend",
+        ("page size", "backend", "timed", "pages/s"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
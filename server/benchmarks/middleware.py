@@ -0,0 +1,96 @@
+"""
+Per-request overhead of the supabase auth + session middleware.
+
+"before" rebuilds two supabase clients for every SupabaseService, as the
+service used to; "after" uses the shared, pooled service client.
+
+    uv run --env-file .env python -m benchmarks.middleware
+"""
+
+import argparse
+import time
+from unittest.mock import patch
+
+from benchmarks.common import measure, report, setup, temporary_database
+
+BENCH_JWT_KEY = "benchmark-jwt-secret-that-is-long-enough"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    setup()
+
+    import jwt
+    from django.conf import settings
+    from django.contrib.auth.models import AnonymousUser
+    from django.http import HttpResponse
+    from django.test import RequestFactory, override_settings
+    from supabase import create_client
+
+    from orchard.middleware import (
+        SupabaseAuthMiddleware,
+        SupabaseSessionMiddleware,
+    )
+    from orchard.services import SupabaseService
+    from users.models import User
+
+    class EagerSupabaseService(SupabaseService):
+        """The old constructor: two fresh clients per instance."""
+
+        def __init__(self, session=None):
+            super().__init__(session)
+            self._supabase = create_client(
+                settings.SUPABASE_URL, settings.SUPABASE_SECRET_KEY
+            )
+            create_client(settings.SUPABASE_URL, settings.SUPABASE_SECRET_KEY)
+
+    with (
+        temporary_database(),
+        override_settings(SUPABASE_JWT_KEY=BENCH_JWT_KEY),
+    ):
+        user = User.objects.create_user(
+            username="bench", email="bench@example.com", password=None
+        )
+        token = jwt.encode(
+            {
+                "sub": str(user.id),
+                "email": user.email,
+                "aud": "authenticated",
+                "exp": int(time.time()) + 3600,
+            },
+            BENCH_JWT_KEY,
+            algorithm="HS256",
+        )
+
+        session_middleware = SupabaseSessionMiddleware(
+            lambda request: HttpResponse()
+        )
+        chain = SupabaseAuthMiddleware(session_middleware)
+        factory = RequestFactory()
+
+        def call():
+            request = factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+            request.user = AnonymousUser()
+            chain(request)
+
+        rows = []
+        for label, service in (
+            ("before", EagerSupabaseService),
+            ("after", SupabaseService),
+        ):
+            with patch("orchard.middleware.SupabaseService", service):
+                calls, elapsed = measure(call, duration=args.duration)
+            rows.append((label, calls, elapsed / calls * 1e6))
+
+        report(
+            "SupabaseAuthMiddleware + SupabaseSessionMiddleware",
+            ("client", "requests", "us/request"),
+            rows,
+        )
+
+
+if __name__ == "__main__":
+    main()
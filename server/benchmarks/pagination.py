@@ -0,0 +1,125 @@
+"""
+Latency of a message list page by how deep into the channel it is.
+
+A channel of ``--messages`` messages is paged through as MessageViewSet.list
+does. "before" is the old PageNumberPagination, which runs a COUNT(*) over
+the channel and OFFSETs to the page, over the old queryset counting replies
+with a ``Count("replies")`` aggregate of the whole channel; "after" is the
+keyset MessagePagination with the per-row reply_count subquery, asked for the
+same page with ``before=<id>`` of the message just after it, as a client
+scrolling back would.
+
+    uv run --env-file .env python -m benchmarks.pagination
+"""
+
+import argparse
+import datetime
+
+from benchmarks.common import measure, report, setup, temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=[0, 1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.db import models
+    from django.utils import timezone
+    from rest_framework.pagination import PageNumberPagination
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from bunch.models import Bunch, Channel, Message, reply_count
+    from bunch.pagination import MessagePagination
+    from users.models import User
+
+    class OffsetPagination(PageNumberPagination):
+        page_size_query_param = "page_size"
+        max_page_size = 1000
+
+    with temporary_database():
+        user = User.objects.create_user(
+            username="bench", email="bench@example.com", password=None
+        )
+        bunch = Bunch.objects.create(name="bench", owner=user)
+        channel = Channel.objects.create(bunch=bunch, name="general")
+        member = bunch.members.get(user=user)
+
+        # bulk_create would stamp every row with the same auto_now_add time
+        created_at = Message._meta.get_field("created_at")
+        created_at.auto_now_add = False
+        start = timezone.now() - datetime.timedelta(seconds=args.messages)
+        Message.objects.bulk_create(
+            (
+                Message(
+                    channel=channel,
+                    author=member,
+                    content=f"message {i}",
+                    seq=i + 1,
+                    created_at=start + datetime.timedelta(seconds=i),
+                )
+                for i in range(args.messages)
+            ),
+            batch_size=5000,
+        )
+        created_at.auto_now_add = True
+
+        messages = (
+            Message.objects.for_bunch(bunch.id)
+            .filter(channel=channel)
+            .select_related("author__user", "reply_to__author__user")
+        )
+        old_queryset = messages.annotate(
+            reply_count=models.Count("replies")
+        ).order_by("created_at")
+        queryset = messages.annotate(reply_count=reply_count()).order_by(
+            "created_at", "id"
+        )
+        newest_first = list(
+            messages.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        factory = APIRequestFactory()
+
+        def page(paginator, queryset, **params):
+            request = Request(
+                factory.get("/", {"page_size": args.page_size, **params})
+            )
+
+            def call():
+                rows = paginator.paginate_queryset(queryset, request)
+                assert len(rows) == args.page_size
+
+            return call
+
+        rows = []
+        for depth in args.depths:
+            # the page whose newest message is ``depth`` messages back
+            number = args.messages // args.page_size - depth // args.page_size
+            anchor = {"before": str(newest_first[depth - 1])} if depth else {}
+            for label, call in (
+                (
+                    "before",
+                    page(OffsetPagination(), old_queryset, page=number),
+                ),
+                ("after", page(MessagePagination(), queryset, **anchor)),
+            ):
+                calls, elapsed = measure(call, args.duration, warmup=3)
+                rows.append((depth, label, elapsed / calls * 1000))
+
+    report(
+        f"message page of {args.page_size} in a channel of "
+        f"{args.messages:,} messages",
+        ("depth", "pagination", "ms/page"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Websocket message payloads built per second, by how their rows are loaded.
+
+``--count`` messages of a channel (a quarter of them replies) are read and
+turned into chat.message payloads (bunch.projections). "lazy" is a plain
+message query, author, user and replied-to message loaded by the payload as
+it reads them, as the REST views used to; "select_related" is the message
+query with everything joined in, as model instances; "values" is one
+``.values(*MESSAGE_VALUES)`` query, no models, as replays past the buffer
+are read. "build only" rows time the payloads of rows already loaded.
+
+    uv run --env-file .env python -m benchmarks.payloads
+"""
+
+import argparse
+
+from benchmarks.common import measure, report, setup, temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--count", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    setup()
+
+    from bunch.models import Bunch, Channel, Message
+    from bunch.projections import (
+        MESSAGE_VALUES,
+        message_payload,
+        message_payload_from_values,
+        message_payloads,
+    )
+    from users.models import User
+
+    with temporary_database():
+        users = [
+            User.objects.create_user(
+                username=f"bench{i}",
+                email=f"bench{i}@example.com",
+                password=None,
+            )
+            for i in range(20)
+        ]
+        bunch = Bunch.objects.create(name="bench", owner=users[0])
+        members = [bunch.members.get(user=users[0])] + [
+            bunch.members.create(user=user) for user in users[1:]
+        ]
+        channel = Channel.objects.create(bunch=bunch, name="general")
+
+        messages: list[Message] = []
+        for i in range(args.messages):
+            message = Message(
+                channel=channel,
+                author=members[i % len(members)],
+                content=f"message {i}, sounds good, see you there",
+                seq=i + 1,
+                reply_to=messages[i - 3] if i % 4 == 3 else None,
+            )
+            messages.append(message)
+        # replies need their original saved first
+        Message.objects.bulk_create(
+            [message for message in messages if not message.reply_to]
+        )
+        Message.objects.bulk_create(
+            [message for message in messages if message.reply_to]
+        )
+
+        rows = []
+        for count in args.count:
+            latest = Message.objects.filter(channel=channel).order_by("-seq")[
+                :count
+            ]
+            joined = latest.select_related(
+                "author__user", "reply_to__author__user"
+            )
+            loaded = list(joined)
+            values = list(latest.values(*MESSAGE_VALUES))
+
+            def lazy(latest=latest):
+                for message in latest.all():
+                    message_payload(message)
+
+            def instances(joined=joined):
+                for message in joined.all():
+                    message_payload(message)
+
+            def from_values(latest=latest):
+                message_payloads(latest.values(*MESSAGE_VALUES))
+
+            def build_instances(loaded=loaded):
+                for message in loaded:
+                    message_payload(message)
+
+            def build_values(values=values):
+                for row in values:
+                    message_payload_from_values(row)
+
+            for label, call in (
+                ("lazy", lazy),
+                ("select_related", instances),
+                ("values", from_values),
+                ("build only, instances", build_instances),
+                ("build only, values", build_values),
+            ):
+                calls, elapsed = measure(call, args.duration, warmup=1)
+                rows.append((count, label, calls * count / elapsed))
+
+    report(
+        f"chat.message payloads of the latest messages of a channel of "
+        f"{args.messages:,}",
+        ("messages", "loaded by", "payloads/s"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
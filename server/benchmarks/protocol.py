@@ -0,0 +1,158 @@
+"""
+Bytes on the wire and encode CPU of the websocket protocols.
+
+A typical channel's traffic, chat messages (a quarter of them replies) and
+reactions, is encoded as each protocol would send it. "json" is the
+default text frame; "msgpack" and "cbor" are the binary protocols with
+compact keys and epoch-millis timestamps. "encode" is from the payload,
+"transcode" from the broadcast's pre-encoded JSON frame, as a binary
+connection does once per broadcast (bunch.codecs.transcode, uncached here).
+
+Binary frames save bytes only, about 39% of them; they cost more CPU to
+encode than JSON (here msgpack ~12 us and cbor ~19 us a frame, against
+~7 us), and transcoding a broadcast more still (~17 and ~30 us).
+
+    uv run --env-file .env python -m benchmarks.protocol
+"""
+
+import argparse
+import datetime
+import random
+import uuid
+
+from benchmarks.common import measure, report, setup
+
+
+def traffic(count: int) -> list[dict]:
+    """Frames of a channel, as ChatConsumer would send them."""
+    rng = random.Random(1)
+    users = [(str(uuid.uuid4()), f"user{i}") for i in range(20)]
+    bunch, channel = str(uuid.uuid4()), str(uuid.uuid4())
+    now = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    frames = []
+
+    for seq in range(1, count + 1):
+        user_id, username = rng.choice(users)
+        created = (now + datetime.timedelta(seconds=seq)).isoformat()
+        if seq % 4 == 0:
+            frames.append(
+                {
+                    "type": "reaction.new",
+                    "seq": seq,
+                    "reaction": {
+                        "id": str(uuid.uuid4()),
+                        "message_id": str(uuid.uuid4()),
+                        "user": {"id": user_id, "username": username},
+                        "emoji": "👍",
+                        "created_at": created,
+                        "seq": seq,
+                    },
+                }
+            )
+            continue
+
+        reply = seq % 3 == 0
+        message_id = str(uuid.uuid4())
+        frames.append(
+            {
+                "type": "chat.message",
+                "seq": seq,
+                "message": {
+                    "id": message_id,
+                    "seq": seq,
+                    "channel": channel,
+                    "author": {
+                        "id": str(uuid.uuid4()),
+                        "bunch": bunch,
+                        "user": {"id": user_id, "username": username},
+                        "role": "member",
+                        "joined_at": now.isoformat(),
+                    },
+                    "content": "sounds good, see you there "
+                    * rng.randint(1, 4),
+                    "created_at": created,
+                    "updated_at": created,
+                    "edit_count": 0,
+                    "deleted": False,
+                    "deleted_at": None,
+                    "reply_to_id": message_id if reply else None,
+                    "reply_to_preview": {
+                        "id": message_id,
+                        "content": "where are we meeting?",
+                        "created_at": created,
+                        "author": {"id": user_id, "username": username},
+                    }
+                    if reply
+                    else None,
+                    "reply_count": 0,
+                },
+            }
+        )
+    return frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    setup()
+
+    from bunch.codecs import encode, transcode
+    from bunch.constants import WSProtocol
+
+    frames = traffic(args.frames)
+    # as broadcast, see bunch.broadcast.encode_frame
+    json_frames = [encode(frame, WSProtocol.JSON) for frame in frames]
+    json_bytes = sum(len(frame.encode()) for frame in json_frames)
+
+    rows = []
+    for protocol in WSProtocol:
+
+        def encode_all(protocol=protocol):
+            for frame in frames:
+                encode(frame, protocol)
+
+        def transcode_all(protocol=protocol):
+            for frame in json_frames:
+                transcode.__wrapped__(frame, protocol)
+
+        encoded = [encode(frame, protocol) for frame in frames]
+        size = sum(
+            len(data.encode() if isinstance(data, str) else data)
+            for data in encoded
+        )
+        calls, elapsed = measure(encode_all, args.duration, warmup=1)
+        encode_us = elapsed / calls / args.frames * 1e6
+        if protocol == WSProtocol.JSON:
+            transcode_us = 0.0
+        else:
+            calls, elapsed = measure(transcode_all, args.duration, warmup=1)
+            transcode_us = elapsed / calls / args.frames * 1e6
+
+        rows.append(
+            (
+                str(protocol),
+                size / args.frames,
+                size / json_bytes * 100,
+                encode_us,
+                transcode_us,
+            )
+        )
+
+    report(
+        f"{args.frames:,} frames of a channel (3/4 messages, 1/4 reactions)",
+        (
+            "protocol",
+            "bytes/frame",
+            "% of json",
+            "encode us/frame",
+            "transcode us/frame",
+        ),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
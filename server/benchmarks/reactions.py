@@ -0,0 +1,145 @@
+"""
+Throughput of websocket reaction toggles.
+
+One user toggles a reaction on a message over and over, as ChatConsumer
+handles a ``reaction.toggle``, minus the broadcast. "before" is the old
+flow: an access check, a lookup of the existing reaction, then an add or
+remove that fetched the bunch, message and membership again, each step its
+own trip to the database thread. "after" is ChatConsumer._react, a single
+transaction settled by the unique constraint, in one trip.
+
+    uv run --env-file .env python -m benchmarks.reactions
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import report, setup, temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--toggles", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup()
+
+    from channels.db import database_sync_to_async
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+
+    from bunch.consumers import ChatConsumer
+    from bunch.models import Bunch, Channel, Message, Reaction
+    from users.models import User
+
+    with temporary_database():
+        user = User.objects.create_user(
+            username="bench", email="bench@example.com", password=None
+        )
+        bunch = Bunch.objects.create(name="bench", owner=user)
+        channel = Channel.objects.create(bunch=bunch, name="general")
+        message = Message.objects.create(
+            channel=channel,
+            author=bunch.members.get(user=user),
+            content="react to me",
+        )
+        bunch_id, channel_id = str(bunch.id), str(channel.id)
+        message_id, emoji = str(message.id), "👍"
+
+        def check_access():
+            bunch = Bunch.objects.get(id=bunch_id)
+            return bunch.members.filter(user=user).exists()
+
+        def existing_reaction():
+            return Reaction.objects.filter(
+                message_id=message_id, user=user, emoji=emoji
+            ).first()
+
+        def add():
+            bunch = Bunch.objects.get(id=bunch_id)
+            message = Message.objects.get(id=message_id, channel__bunch=bunch)
+            if not bunch.members.filter(user=user).exists():
+                return None
+            if Reaction.objects.filter(
+                message=message, user=user, emoji=emoji
+            ).exists():
+                return None
+            with transaction.atomic():
+                reaction = Reaction.objects.create(
+                    message=message, user=user, emoji=emoji
+                )
+                return reaction, Channel.allocate_seq(message.channel_id)
+
+        def remove():
+            bunch = Bunch.objects.get(id=bunch_id)
+            message = Message.objects.get(id=message_id, channel__bunch=bunch)
+            reaction = Reaction.objects.filter(
+                message=message, user=user, emoji=emoji
+            ).first()
+            if not reaction:
+                return None
+            with transaction.atomic():
+                reaction.delete()
+                return Channel.allocate_seq(message.channel_id)
+
+        async def before():
+            if not await database_sync_to_async(check_access)():
+                return
+            if await database_sync_to_async(existing_reaction)():
+                await database_sync_to_async(remove)()
+            else:
+                await database_sync_to_async(add)()
+
+        def before_queries():
+            check_access()
+            remove() if existing_reaction() else add()
+
+        consumer = ChatConsumer()
+
+        def react():
+            consumer._react(
+                user, bunch_id, channel_id, message_id, emoji, "toggle"
+            )
+
+        async def after():
+            await database_sync_to_async(react)()
+
+        async def run(toggle, count):
+            for _ in range(count):
+                await toggle()
+
+        rows = []
+        for label, toggle, sync_toggle in (
+            ("before", before, before_queries),
+            ("after", after, react),
+        ):
+            # warm up, leaving the reaction off
+            asyncio.run(run(toggle, 10))
+            # an add and a remove, on this thread to see the statements
+            with CaptureQueriesContext(connection) as queries:
+                sync_toggle()
+                sync_toggle()
+
+            start = time.perf_counter()
+            asyncio.run(run(toggle, args.toggles))
+            elapsed = time.perf_counter() - start
+
+            rows.append(
+                (
+                    label,
+                    len(queries) / 2,
+                    args.toggles / elapsed,
+                    elapsed / args.toggles * 1e6,
+                )
+            )
+
+    report(
+        "reaction.toggle",
+        ("flow", "statements/toggle", "toggles/s", "us/toggle"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Message list rows rendered per second, serializer against values.
+
+A page of ``--page-sizes`` messages of a channel (a quarter of them replies,
+every other one with a few reactions) is read and rendered to JSON as
+MessageViewSet.list does. "serializer" is the queryset with everything
+MessageSerializer reads loaded up front (``with_related``) and serialized,
+as lists used to be; "values" is one ``.values(*MESSAGE_LIST_VALUES)``
+query rendered by ``message_list_items``, as lists are now. Both give the
+same JSON (bunch.test_messages checks it).
+
+    uv run --env-file .env python -m benchmarks.rendering
+"""
+
+import argparse
+
+from benchmarks.common import measure, report, setup, temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument(
+        "--page-sizes", type=int, nargs="+", default=[100, 1000]
+    )
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    setup()
+
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from bunch.models import Bunch, Channel, Message, Reaction, reply_count
+    from bunch.projections import MESSAGE_LIST_VALUES, message_list_items
+    from bunch.serializers import MessageSerializer
+    from bunch.views import MessageViewSet
+    from users.models import User
+
+    with temporary_database():
+        users = [
+            User.objects.create_user(
+                username=f"bench{i}",
+                email=f"bench{i}@example.com",
+                password=None,
+            )
+            for i in range(20)
+        ]
+        bunch = Bunch.objects.create(name="bench", owner=users[0])
+        members = [bunch.members.get(user=users[0])] + [
+            bunch.members.create(user=user) for user in users[1:]
+        ]
+        channel = Channel.objects.create(bunch=bunch, name="general")
+
+        messages: list[Message] = []
+        for i in range(args.messages):
+            message = Message(
+                channel=channel,
+                author=members[i % len(members)],
+                content=f"message {i}, sounds good, see you there",
+                seq=i + 1,
+                reply_to=messages[i - 3] if i % 4 == 3 else None,
+            )
+            messages.append(message)
+        # replies need their original saved first
+        Message.objects.bulk_create(
+            [message for message in messages if not message.reply_to]
+        )
+        Message.objects.bulk_create(
+            [message for message in messages if message.reply_to]
+        )
+        # saved one by one, so the reaction counts are kept
+        for i, message in enumerate(messages[-max(args.page_sizes) :]):
+            if i % 2:
+                continue
+            for j, emoji in enumerate(("👍", "🎉", "👍")):
+                Reaction.objects.create(
+                    message=message,
+                    user=users[(i + j) % len(users)],
+                    emoji=emoji,
+                )
+
+        request = Request(APIRequestFactory().get("/"))
+        renderer = JSONRenderer()
+        latest = Message.objects.filter(channel=channel).order_by(
+            "-created_at", "-id"
+        )
+        rows = []
+        for size in args.page_sizes:
+
+            def serializer(size=size):
+                page = list(MessageViewSet().with_related(latest)[:size])
+                renderer.render(
+                    MessageSerializer(
+                        page, many=True, context={"request": request}
+                    ).data
+                )
+
+            def values(size=size):
+                page = list(
+                    latest.annotate(reply_count=reply_count()).values(
+                        *MESSAGE_LIST_VALUES
+                    )[:size]
+                )
+                renderer.render(message_list_items(page, request))
+
+            for label, call in (("serializer", serializer), ("values", values)):
+                calls, elapsed = measure(call, args.duration, warmup=1)
+                rows.append((size, label, calls * size / elapsed))
+
+    report(
+        f"Message list pages rendered, of a channel of {args.messages:,}",
+        ("page size", "rendered by", "rows/s"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
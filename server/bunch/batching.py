@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import defaultdict
+from functools import cache
+from typing import Any
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from bunch.models import Channel, Member, Message
+from bunch.projections import message_payload
+
+logger = logging.getLogger(__name__)
+
+
+def save_messages(messages: list[Message]) -> None:
+    """
+    Insert new messages in one transaction and one bulk INSERT, numbered in
+    list order with a single seq allocation per channel.
+    """
+    by_channel: dict[Any, list[Message]] = defaultdict(list)
+    for message in messages:
+        by_channel[message.channel_id].append(message)
+
+    with transaction.atomic():
+        # channels locked in a fixed order, so concurrent batches of the
+        # same channels can't deadlock
+        for channel_id in sorted(by_channel, key=str):
+            channel_messages = by_channel[channel_id]
+            last = Channel.allocate_seq(channel_id, len(channel_messages))
+            first = last - len(channel_messages) + 1
+            for seq, message in enumerate(channel_messages, first):
+                message.seq = seq
+        Message.objects.bulk_create(messages)
+
+
+class MessageBatcher:
+    """
+    Write-behind saving of websocket messages.
+
+    Messages arriving within ``max_delay`` seconds of the first one, up to
+    ``max_size`` of them, are saved together by :func:`save_messages`.
+    :meth:`save` returns only once its batch has committed, so nothing is
+    broadcast that isn't stored. If a batch fails its messages are retried
+    one by one, failing only the ones that can't be saved.
+    """
+
+    def __init__(self, max_size: int = 100, max_delay: float = 0.005):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        # batches are gathered per event loop, as futures belong to one
+        self._pending: dict[asyncio.AbstractEventLoop, list] = {}
+        self._timers: dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        self._writes: set[asyncio.Task] = set()
+
+    async def save(
+        self, member: Member, channel_id: str, content: str
+    ) -> dict[str, Any]:
+        """Save a message with the next batch, returning its payload."""
+        loop = asyncio.get_running_loop()
+        message = Message(content=content, author=member, channel_id=channel_id)
+        future = loop.create_future()
+
+        pending = self._pending.setdefault(loop, [])
+        pending.append((message, future))
+        if len(pending) >= self.max_size:
+            self._flush(loop)
+        elif len(pending) == 1:
+            self._timers[loop] = loop.call_later(
+                self.max_delay, self._flush, loop
+            )
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        timer = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(loop, [])
+        if batch:
+            task = loop.create_task(self._write(batch))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: list) -> None:
+        try:
+            await database_sync_to_async(save_messages)(
+                [message for message, _ in batch]
+            )
+        # whatever failed is retried or raised to the sender, whose future
+        # would otherwise never be resolved
+        except Exception as e:  # noqa: BLE001
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            logger.warning(
+                f"Saving a batch of {len(batch)} messages failed ({e}), "
+                "retrying them one by one"
+            )
+            for message, future in batch:
+                # a fresh instance, the failed one was given a seq and times
+                retry = Message(
+                    content=message.content,
+                    author=message.author,
+                    channel_id=message.channel_id,
+                )
+                await self._write([(retry, future)])
+            return
+
+        for message, future in batch:
+            # the sender may have disconnected meanwhile
+            if not future.done():
+                future.set_result(message_payload(message))
+
+
+@cache
+def get_message_batcher() -> MessageBatcher | None:
+    """The process-wide batcher, or ``None`` unless ``MESSAGE_BATCHING``."""
+    if not settings.MESSAGE_BATCHING:
+        return None
+    return MessageBatcher(
+        max_size=settings.MESSAGE_BATCH_MAX_SIZE,
+        max_delay=settings.MESSAGE_BATCH_MAX_DELAY,
+    )
+
+
+@receiver(setting_changed)
+def _reset_message_batcher(setting: str, **kwargs):
+    if setting.startswith("MESSAGE_BATCH"):
+        get_message_batcher.cache_clear()
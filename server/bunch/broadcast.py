@@ -0,0 +1,281 @@
+from typing import TYPE_CHECKING, Any
+
+from channels.layers import get_channel_layer
+
+from bunch.constants import WSMessageTypeServer
+from bunch.replay import get_replay_buffer
+from orchard import jsonlib
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+    from bunch.models import Channel, Member
+
+
+def channel_group(bunch_id, channel_id) -> str:
+    """Channel layer group of a channel's subscribers."""
+    return f"chat_{bunch_id}_{channel_id}"
+
+
+def bunch_group(bunch_id) -> str:
+    """Channel layer group of the connections of all of a bunch's members."""
+    return f"bunch_{bunch_id}"
+
+
+def user_group(user_id) -> str:
+    """Channel layer group of all of a user's connections."""
+    return f"user_{user_id}"
+
+
+def encode_frame(frame_type: str, **payload: Any) -> str:
+    """The websocket text frame ``{"type": frame_type, **payload}``."""
+    return jsonlib.dumps({"type": frame_type, **payload})
+
+
+def frame_event(handler: str, frame: str, seq: int | None = None) -> dict:
+    """
+    Channel layer event for consumer ``handler`` carrying a pre-encoded
+    websocket ``frame``.
+
+    The frame is serialized once by the sender and written verbatim by every
+    subscribed consumer, instead of each consumer encoding the same payload.
+    """
+    event: dict[str, Any] = {"type": handler, "frame": frame}
+    if seq is not None:
+        event["seq"] = seq
+    return event
+
+
+def member_payload(member: "Member") -> dict[str, Any]:
+    """A member as sent in bunch events."""
+    return {
+        "id": str(member.id),
+        "bunch": str(member.bunch_id),
+        "user": {"id": str(member.user.id), "username": member.user.username},
+        "role": member.role,
+        "nickname": member.nickname,
+        "joined_at": member.joined_at.isoformat(),
+    }
+
+
+def channel_payload(channel: "Channel") -> dict[str, Any]:
+    """A channel as sent in bunch events, like ChannelSerializer less url."""
+    return {
+        "id": str(channel.id),
+        "name": channel.name,
+        "type": channel.type,
+        "description": channel.description,
+        "bunch": str(channel.bunch_id),
+        "is_private": channel.is_private,
+        "position": channel.position,
+        "created_at": channel.created_at.isoformat(),
+    }
+
+
+def sequenced_event(
+    handler: str, frame_type: str, key: str, payload: dict[str, Any]
+) -> dict:
+    """
+    Event for ``handler`` sending ``{"type": frame_type, key: payload}``,
+    with the payload's ``seq`` (if any) at the top level of the frame so
+    clients can track the last event they saw without parsing the payload.
+    """
+    seq = payload.get("seq")
+    if seq is None:
+        return frame_event(handler, encode_frame(frame_type, **{key: payload}))
+    return frame_event(
+        handler, encode_frame(frame_type, seq=seq, **{key: payload}), seq
+    )
+
+
+def message_updated_event(
+    message_id,
+    channel_id,
+    seq: int,
+    content: str,
+    edit_count: int,
+    updated_at: "datetime",
+) -> dict:
+    """
+    Event of an edited message: only what changed, for clients to patch the
+    message they have.
+    """
+    delta = {
+        "id": str(message_id),
+        "channel": str(channel_id),
+        "content": content,
+        "edit_count": edit_count,
+        "updated_at": updated_at.isoformat(),
+    }
+    frame_type = WSMessageTypeServer.MESSAGE_UPDATED
+    return frame_event(
+        frame_type, encode_frame(frame_type, seq=seq, message=delta), seq
+    )
+
+
+def message_deleted_event(
+    message_id, channel_id, seq: int, deleted_at: "datetime"
+) -> dict:
+    """Event of a deleted message: its tombstone."""
+    tombstone = {
+        "id": str(message_id),
+        "channel": str(channel_id),
+        "deleted": True,
+        "deleted_at": deleted_at.isoformat(),
+    }
+    frame_type = WSMessageTypeServer.MESSAGE_DELETED
+    return frame_event(
+        frame_type, encode_frame(frame_type, seq=seq, message=tombstone), seq
+    )
+
+
+def chat_message_event(message: dict[str, Any]) -> dict:
+    return sequenced_event(
+        WSMessageTypeServer.CHAT_MESSAGE,
+        WSMessageTypeServer.CHAT_MESSAGE,
+        "message",
+        message,
+    )
+
+
+def reaction_added_event(reaction: dict[str, Any]) -> dict:
+    return sequenced_event(
+        WSMessageTypeServer.REACTION_ADDED,
+        WSMessageTypeServer.REACTION_NEW,
+        "reaction",
+        reaction,
+    )
+
+
+def reaction_removed_event(reaction: dict[str, Any]) -> dict:
+    return sequenced_event(
+        WSMessageTypeServer.REACTION_REMOVED,
+        WSMessageTypeServer.REACTION_DELETE,
+        "reaction",
+        reaction,
+    )
+
+
+async def abroadcast(bunch_id, channel_id, event: dict) -> None:
+    """
+    Send ``event`` to the channel's subscribers, keeping sequenced events in
+    the replay buffer for clients that reconnect.
+    """
+    if event.get("seq") is not None:
+        await get_replay_buffer().append(
+            str(channel_id), event["seq"], event["frame"]
+        )
+
+    channel_layer = get_channel_layer()
+    assert channel_layer is not None
+    # lets consumers track the last seq written per channel
+    event = {**event, "channel_id": str(channel_id)}
+    await channel_layer.group_send(channel_group(bunch_id, channel_id), event)
+
+
+async def agroup_send(group: str, event: dict) -> None:
+    """Send a control event to a bunch or user group, as is."""
+    channel_layer = get_channel_layer()
+    assert channel_layer is not None
+    await channel_layer.group_send(group, event)
+
+
+def notify(bunch_id, group: str, event: dict) -> None:
+    """
+    Send a control event to ``group`` through the outbox once the current
+    transaction commits, so consumers reacting to it read the new state,
+    without the request waiting on the channel layer.
+    """
+    # bunch.outbox sends through this module
+    from bunch.outbox import enqueue_group
+
+    enqueue_group(bunch_id, group, event)
+
+
+def membership_changed(user_id, bunch_id) -> None:
+    """The user joined, left, was removed from or got a new role in a bunch."""
+    notify(
+        bunch_id,
+        user_group(user_id),
+        {"type": "membership.changed", "bunch_id": str(bunch_id)},
+    )
+
+
+def bunch_event(bunch_id, frame_type: str, **payload: Any) -> None:
+    """
+    Send a frame to every connection of the bunch's members, on commit.
+    Sent to the ``bunch_{id}`` group once, rather than to each channel.
+    """
+    notify(
+        bunch_id,
+        bunch_group(bunch_id),
+        frame_event(
+            "bunch.event",
+            encode_frame(frame_type, bunch_id=str(bunch_id), **payload),
+        ),
+    )
+
+
+def member_joined(member: "Member") -> None:
+    membership_changed(member.user_id, member.bunch_id)
+    bunch_event(
+        member.bunch_id,
+        WSMessageTypeServer.MEMBER_JOINED,
+        member=member_payload(member),
+    )
+
+
+def member_updated(member: "Member") -> None:
+    membership_changed(member.user_id, member.bunch_id)
+    bunch_event(
+        member.bunch_id,
+        WSMessageTypeServer.MEMBER_UPDATED,
+        member=member_payload(member),
+    )
+
+
+def member_left(bunch_id, member_id, user_id) -> None:
+    """A member left or was removed (ids, as delete() clears the pk)."""
+    membership_changed(user_id, bunch_id)
+    bunch_event(
+        bunch_id,
+        WSMessageTypeServer.MEMBER_LEFT,
+        member={"id": str(member_id), "user": {"id": str(user_id)}},
+    )
+
+
+def channel_created(channel: "Channel") -> None:
+    bunch_event(
+        channel.bunch_id,
+        WSMessageTypeServer.CHANNEL_CREATED,
+        channel=channel_payload(channel),
+    )
+
+
+def channel_updated(channel: "Channel") -> None:
+    bunch_event(
+        channel.bunch_id,
+        WSMessageTypeServer.CHANNEL_UPDATED,
+        channel=channel_payload(channel),
+    )
+
+
+def channel_deleted(bunch_id, channel_id) -> None:
+    """
+    To the bunch's connections, which also drop the channel from their cache
+    and unsubscribe from it.
+    """
+    notify(
+        bunch_id,
+        bunch_group(bunch_id),
+        {
+            "type": "channel.deleted",
+            "bunch_id": str(bunch_id),
+            "channel_id": str(channel_id),
+            "frame": encode_frame(
+                WSMessageTypeServer.CHANNEL_DELETED,
+                bunch_id=str(bunch_id),
+                channel_id=str(channel_id),
+            ),
+        },
+    )
@@ -0,0 +1,118 @@
+import importlib.util
+import urllib.parse
+from datetime import datetime
+from functools import lru_cache
+from typing import Any
+
+from bunch.constants import COMPACT_KEYS, TIMESTAMP_FIELDS, WSProtocol
+from orchard import jsonlib
+
+SUBPROTOCOL_PREFIX = "bunch."
+
+_EXPANDED_KEYS = {short: key for key, short in COMPACT_KEYS.items()}
+_MODULES = {WSProtocol.MSGPACK: "msgpack", WSProtocol.CBOR: "cbor2"}
+
+
+def available(protocol: WSProtocol) -> bool:
+    """Whether the protocol's library is installed."""
+    module = _MODULES.get(protocol)
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def negotiate(scope) -> tuple[WSProtocol, str | None]:
+    """
+    The protocol a websocket client asked for, and the subprotocol to accept
+    it with. ``bunch.<name>`` subprotocols win over ``?protocol=<name>``;
+    unknown or unavailable protocols get JSON.
+    """
+    for subprotocol in scope.get("subprotocols") or ():
+        name = subprotocol.removeprefix(SUBPROTOCOL_PREFIX)
+        if (
+            subprotocol.startswith(SUBPROTOCOL_PREFIX)
+            and name in WSProtocol
+            and available(WSProtocol(name))
+        ):
+            return WSProtocol(name), subprotocol
+
+    query = urllib.parse.parse_qs(scope.get("query_string", b"").decode())
+    name = query.get("protocol", [WSProtocol.JSON])[0]
+    if name in WSProtocol and available(WSProtocol(name)):
+        return WSProtocol(name), None
+    return WSProtocol.JSON, None
+
+
+def compact(value: Any) -> Any:
+    """A frame's fields renamed by COMPACT_KEYS, with epoch-millis times."""
+    if type(value) is list:
+        return [compact(item) for item in value]
+    if type(value) is not dict:
+        return value
+
+    result = {}
+    for key, item in value.items():
+        if key in TIMESTAMP_FIELDS:
+            if type(item) is str:
+                item = _epoch_millis(item)
+        elif type(item) is dict or type(item) is list:
+            item = compact(item)
+        result[COMPACT_KEYS.get(key, key)] = item
+    return result
+
+
+def expand(value: Any) -> Any:
+    """Inverse of :func:`compact` for the field names, for client frames."""
+    if isinstance(value, dict):
+        return {
+            _EXPANDED_KEYS.get(key, key): expand(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    return value
+
+
+@lru_cache(maxsize=4096)
+def _epoch_millis(value: str) -> int:
+    # the same times recur: a member's joined_at, created_at == updated_at
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def encode(payload: dict[str, Any], protocol: WSProtocol) -> str | bytes:
+    """A frame in the protocol: JSON text, or compact binary."""
+    if protocol == WSProtocol.JSON:
+        return jsonlib.dumps(payload)
+    if protocol == WSProtocol.MSGPACK:
+        import msgpack
+
+        return msgpack.packb(compact(payload))
+    import cbor2
+
+    return cbor2.dumps(compact(payload))
+
+
+def decode(data: str | bytes, protocol: WSProtocol) -> dict[str, Any]:
+    """A client frame. Text frames are JSON whatever the protocol."""
+    if isinstance(data, str):
+        return jsonlib.loads(data)
+    if protocol == WSProtocol.MSGPACK:
+        import msgpack
+
+        return expand(msgpack.unpackb(data))
+    if protocol == WSProtocol.CBOR:
+        import cbor2
+
+        return expand(cbor2.loads(data))
+    raise ValueError("Binary frame on a JSON connection")
+
+
+@lru_cache(maxsize=1024)
+def transcode(frame: str, protocol: WSProtocol) -> bytes:
+    """
+    A pre-encoded JSON frame (see bunch.broadcast) in a binary protocol.
+
+    Cached, so a broadcast is transcoded once per process rather than once
+    per subscriber.
+    """
+    result = encode(jsonlib.loads(frame), protocol)
+    assert isinstance(result, bytes)
+    return result
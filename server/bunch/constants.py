@@ -35,3 +35,70 @@ class WSMessageTypeServer(StrEnum):
     REACTION_DELETE = "reaction.delete"
     REACTION_ADDED = "reaction_added"
     REACTION_REMOVED = "reaction_removed"
+    # deltas of an edited or deleted message, not the full message
+    MESSAGE_UPDATED = "message.updated"
+    MESSAGE_DELETED = "message.deleted"
+    # sent to a connection that fell too far behind, before closing it
+    RESUME = "resume"
+    # bunch-wide, to the connections of all members
+    MEMBER_JOINED = "member.joined"
+    MEMBER_UPDATED = "member.updated"
+    MEMBER_LEFT = "member.left"
+    CHANNEL_CREATED = "channel.created"
+    CHANNEL_UPDATED = "channel.updated"
+    CHANNEL_DELETED = "channel.deleted"
+
+
+class WSProtocol(StrEnum):
+    """
+    Frame encodings, asked for with ``?protocol=<name>`` or the
+    ``bunch.<name>`` websocket subprotocol. JSON text frames are the default;
+    the binary ones use COMPACT_KEYS and epoch-millis timestamps.
+    """
+
+    JSON = "json"
+    MSGPACK = "msgpack"
+    CBOR = "cbor"
+
+
+# field -> key in binary frames (other fields keep their name)
+COMPACT_KEYS = {
+    "type": "t",
+    "seq": "s",
+    "id": "i",
+    "message": "m",
+    "reaction": "r",
+    "channel": "c",
+    "author": "a",
+    "bunch": "b",
+    "user": "u",
+    "username": "n",
+    "role": "ro",
+    "joined_at": "ja",
+    "content": "co",
+    "created_at": "ca",
+    "updated_at": "ua",
+    "edit_count": "ec",
+    "deleted": "d",
+    "deleted_at": "da",
+    "reply_to_id": "ri",
+    "reply_to_preview": "rp",
+    "reply_count": "rc",
+    "emoji": "e",
+    "message_id": "mi",
+    "channel_id": "ci",
+    "bunch_id": "bi",
+    "last_seq": "ls",
+    "replayed": "rd",
+    "resync": "rs",
+    "timestamp": "ts",
+    "server_time": "st",
+    "channels": "cs",
+    "denied": "dn",
+    "member": "mb",
+}
+
+# fields holding ISO 8601 times, sent as epoch milliseconds in binary frames
+TIMESTAMP_FIELDS = frozenset(
+    {"joined_at", "created_at", "updated_at", "deleted_at"}
+)
@@ -1,20 +1,50 @@
-import json
+import asyncio
 import logging
 import time
 import typing
 import urllib.parse
+import uuid
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import (
     AsyncWebsocketConsumer,
 )
 from channels.layers import get_channel_layer
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpRequest
-
-from bunch.constants import WSMessageTypeClient, WSMessageTypeServer
-from bunch.models import Bunch, Channel, Message, Reaction
-from orchard.authentication import SupabaseJWTAuthentication
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from bunch.batching import get_message_batcher
+from bunch.broadcast import (
+    abroadcast,
+    bunch_group,
+    channel_group,
+    chat_message_event,
+    encode_frame,
+    message_deleted_event,
+    message_updated_event,
+    reaction_added_event,
+    reaction_removed_event,
+    user_group,
+)
+from bunch.codecs import decode, encode, negotiate, transcode
+from bunch.constants import (
+    WSMessageTypeClient,
+    WSMessageTypeServer,
+    WSProtocol,
+)
+from bunch.models import Channel, Member, Message, Reaction
+from bunch.presence import get_presence_store
+from bunch.projections import (
+    MESSAGE_VALUES,
+    message_payload,
+    message_payloads,
+)
+from bunch.replay import get_replay_buffer
+from bunch.send_queue import SendQueue
+from orchard.authentication import aauthenticate_token
 
 if typing.TYPE_CHECKING:
     from users.models import User as CustomUserModel
@@ -24,10 +54,14 @@ logger.setLevel(logging.INFO)
 
 User = get_user_model()
 
-# active connections with timestamps
-active_connections: dict[
-    str, dict[str, float]
-] = {}  # user_id -> {connection_id: timestamp}
+
+def _is_uuid(*values) -> bool:
+    try:
+        for value in values:
+            uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -38,6 +72,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.connection_id: str | None = None
         self.connection_time: float | None = None
         self.subscribed_channels = set()  # set of (bunch_id, channel_id)
+        # this connection's view of the database, kept current by
+        # membership.changed and channel.deleted events
+        self.memberships: dict[str, Member] = {}  # bunch_id -> own member
+        self.channel_bunches: dict[str, str] = {}  # channel_id -> bunch_id
+        self.bunch_groups: set[str] = set()  # bunch ids of joined bunch groups
+        # frames to write to the socket, once accepted
+        self.send_queue: SendQueue | None = None
+        self.protocol = WSProtocol.JSON
         self.last_ping_time: float | None = None
         self.ping_interval: float = 30.0  # seconds
         self._connection_established = False
@@ -64,61 +106,67 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.close(code=4001)
                 return
 
-            # accept the connection first to prevent timeouts
-            await self.accept()
-            self._connection_established = True
-            logger.info(
-                "WebSocket connection accepted, proceeding with authentication"
-            )
+            # resolved by SupabaseChannelsAuthMiddleware before we were called
+            if "auth" in self.scope:
+                result = self.scope["auth"]
+            else:
+                client = self.scope.get("client") or (None, None)
+                result = await aauthenticate_token(token, client[0])
 
-            # Authenticate user
-            try:
-                auth = SupabaseJWTAuthentication()
-                request = HttpRequest()
-                request.META["HTTP_AUTHORIZATION"] = f"Bearer {token}"
-                result = await database_sync_to_async(auth.authenticate)(
-                    request  # pyright: ignore
+            # reject clients stuck in a failing reconnect loop before accepting
+            if result.retry_after is not None:
+                logger.warning(
+                    f"Too many failed authentications: {result.error}"
                 )
-                if not result:
-                    logger.warning("Authentication failed - no user returned")
-                    await self.close(code=4002)
-                    return
+                await self.close(code=4029)
+                return
 
-                user, _ = result
+            # accept the connection first, so the client sees the close code
+            self.protocol, subprotocol = negotiate(self.scope)
+            await self.accept(subprotocol)
+            self._connection_established = True
+            self.send_queue = SendQueue(
+                self._write,
+                max_frames=settings.WS_SEND_QUEUE_SIZE,
+                policy=settings.WS_SEND_QUEUE_POLICY,
+                on_overflow=self._send_overflowed,
+            )
+            logger.info("WebSocket connection accepted")
 
-                self.user = user
-                self.connection_time = time.time()
+            if result.error:
+                logger.error(f"Authentication error: {result.error}")
+                await self.close(code=4003)
+                return
 
-                # Track active connections, clean old connections
-                await self._manage_active_connections(
-                    self.user, str(self.connection_id), self.connection_time
-                )
+            if result.user is None:
+                logger.warning("Authentication failed - no user returned")
+                await self.close(code=4002)
+                return
 
-                logger.info(
-                    f"User {self.user.username} authenticated successfully"
-                )
+            self.user = result.user
+            self.connection_time = time.time()
 
-            except Exception as e:
-                logger.error(f"Authentication error: {str(e)}")
-                await self.close(code=4003)
-                return
+            # Track active connections, clean old connections
+            await self._manage_active_connections(
+                self.user, str(self.connection_id), self.connection_time
+            )
+
+            logger.info(f"User {self.user.username} authenticated successfully")
 
             self._is_connected = True
             logger.info(
                 f"WebSocket connection fully established for user {self.user.username}"
             )
             # initial connection success message with more details
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": "connection_established",
-                        "connection_id": self.connection_id,
-                        "is_keepalive": self.is_keepalive,
-                        "server_time": time.time() * 1000,
-                        "message": "Successfully connected.\
+            await self._send_payload(
+                {
+                    "type": "connection_established",
+                    "connection_id": self.connection_id,
+                    "is_keepalive": self.is_keepalive,
+                    "server_time": time.time() * 1000,
+                    "message": "Successfully connected.\
                             Use subscribe/unsubscribe messages to join channels",
-                    }
-                )
+                }
             )
 
         except Exception as e:
@@ -126,6 +174,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if self._connection_established:
                 await self.close(code=4000)
 
+    @property
+    def presence_ttl(self) -> float:
+        if self.is_keepalive:
+            return settings.PRESENCE_KEEPALIVE_TTL
+        return settings.PRESENCE_TTL
+
     async def _manage_active_connections(
         self,
         user: "CustomUserModel",
@@ -134,80 +188,79 @@ class ChatConsumer(AsyncWebsocketConsumer):
     ):
         self.last_ping_time = time.time()
 
-        if str(user.id) in active_connections:
-            old_connections = active_connections[str(user.id)]
-            current_time = time.time()
-
-            filtered_connections: dict[str, float] = {}
-            # clean old connections (older than 10 minutes for keepalive,
-            # 2 minutes for regular)
-            for conn_id, timestamp in old_connections.items():
-                # is this is a keepalive connection
-                # for now just use the current connection's status
-                is_keepalive_conn = (
-                    conn_id == connection_id and self.is_keepalive
-                )
-
-                timeout = (
-                    600 if is_keepalive_conn else 120
-                )  # 10 minutes or 2 minutes
+        presence = get_presence_store()
+        presence.start_sweeper()
 
-                if current_time - timestamp < timeout:
-                    filtered_connections[conn_id] = timestamp
+        live_connections = await presence.connections(str(user.id))
+        logger.info(
+            f"Active connections for user {user.id}: {len(live_connections)}"
+        )
 
+        # the holy check that prevents the damn disconnect/reconnect cycle
+        # If this is a reconnection with the same connection_id,
+        # don't close other connections
+        if connection_id in live_connections:
             logger.info(
-                f"Active connections for user {user.id}: {len(filtered_connections)}"
+                f"Reconnection with same ID {connection_id} for user {user.username}"
             )
+        elif not self.is_keepalive:
+            channel_layer = get_channel_layer()
+            assert channel_layer is not None
+            # Only close other connections if this is a new connection ID
+            # and not a keepalive connection
+            for old_conn_id in live_connections:
+                # send a close event to old connections
+                await channel_layer.group_send(
+                    f"conn_{old_conn_id}",
+                    {
+                        "type": "close_connection",
+                        "connection_id": old_conn_id,
+                    },
+                )
 
-            # the holy check that prevents the damn disconnect/reconnect cycle
-            # If this is a reconnection with the same connection_id,
-            # don't close other connections
-            if connection_id in filtered_connections:
                 logger.info(
-                    f"Reconnection with same ID {connection_id} for user {user.username}"
+                    f"Closed old connection {old_conn_id} for user {user.username}"
                 )
-                # Update the timestamp for this connection
-                filtered_connections[connection_id] = connection_time
-                active_connections[str(user.id)] = filtered_connections
-            else:
-                if not self.is_keepalive:
-                    channel_layer = get_channel_layer()
-                    assert channel_layer is not None
-                    # Only close other connections if this is a new connection ID
-                    # and not a keepalive connection
-                    for old_conn_id in filtered_connections:
-                        if old_conn_id != connection_id:
-                            # send a close event to old connections
-                            await channel_layer.group_send(
-                                f"conn_{old_conn_id}",
-                                {
-                                    "type": "close_connection",
-                                    "connection_id": old_conn_id,
-                                },
-                            )
-
-                            logger.info(
-                                f"Closed old connection {old_conn_id} for user {user.username}"
-                            )
-
-                    filtered_connections[connection_id] = connection_time
-                    active_connections[str(user.id)] = filtered_connections
-                else:
-                    logger.info(
-                        f"Keepalive connection {connection_id} - not closing other connections"
-                    )
-                    filtered_connections[connection_id] = connection_time
-                    active_connections[str(user.id)] = filtered_connections
         else:
-            active_connections[str(user.id)] = {
-                str(connection_id): connection_time
-            }
+            logger.info(
+                f"Keepalive connection {connection_id} - not closing other connections"
+            )
+
+        async for member in Member.objects.filter(user=user):
+            member.user = user
+            self.memberships[str(member.bunch_id)] = member
+        await presence.connect(
+            str(user.id),
+            connection_id,
+            self.presence_ttl,
+            list(self.memberships),
+        )
 
         connection_group = f"conn_{connection_id}"
         await self.channel_layer.group_add(connection_group, self.channel_name)
+        await self.channel_layer.group_add(
+            user_group(user.id), self.channel_name
+        )
+        await self._join_bunch_groups(self.memberships)
+
+    async def _join_bunch_groups(self, bunch_ids):
+        """Join the bunch-wide event groups of the bunches, once each."""
+        new = [b for b in bunch_ids if b not in self.bunch_groups]
+        await asyncio.gather(
+            *(
+                self.channel_layer.group_add(
+                    bunch_group(bunch_id), self.channel_name
+                )
+                for bunch_id in new
+            )
+        )
+        self.bunch_groups.update(new)
 
     async def disconnect(self, close_code):
         try:
+            if self.send_queue is not None:
+                await self.send_queue.stop()
+
             for bunch_id, channel_id in self.subscribed_channels:
                 group_name = f"chat_{bunch_id}_{channel_id}"
                 await self.channel_layer.group_discard(
@@ -216,20 +269,32 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             self.subscribed_channels.clear()
 
+            await asyncio.gather(
+                *(
+                    self.channel_layer.group_discard(
+                        bunch_group(bunch_id), self.channel_name
+                    )
+                    for bunch_id in self.bunch_groups
+                )
+            )
+            self.bunch_groups.clear()
+
             if self.connection_id:
                 connection_group = f"conn_{self.connection_id}"
                 await self.channel_layer.group_discard(
                     connection_group, self.channel_name
                 )
 
+            if self.user:
+                await self.channel_layer.group_discard(
+                    user_group(self.user.id), self.channel_name
+                )
+
             # Remove from active connections if this is the current connection
-            if self.user and str(self.user.id) in active_connections:
-                if self.connection_id in active_connections[str(self.user.id)]:
-                    del active_connections[str(self.user.id)][
-                        self.connection_id
-                    ]
-                    if not active_connections[str(self.user.id)]:
-                        del active_connections[str(self.user.id)]
+            if self.user:
+                await get_presence_store().disconnect(
+                    str(self.user.id), str(self.connection_id)
+                )
 
             self._is_connected = False
             self._connection_established = False
@@ -256,11 +321,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 f"Ignoring close request for keepalive connection {self.connection_id}"
             )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
             assert self.user is not None
 
-            data: dict[str, str] = json.loads(text_data)
+            data: dict[str, str] = decode(
+                text_data if text_data is not None else bytes_data,
+                self.protocol,
+            )
             msg_type = data.get("type")
 
             logger.info(
@@ -269,50 +337,44 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
 
             if msg_type == WSMessageTypeClient.PING:
-                if self.user and str(self.user.id) in active_connections:
-                    if (
-                        self.connection_id
-                        in active_connections[str(self.user.id)]
-                    ):
-                        active_connections[str(self.user.id)][
-                            self.connection_id
-                        ] = time.time()
+                await get_presence_store().heartbeat(
+                    str(self.user.id),
+                    str(self.connection_id),
+                    self.presence_ttl,
+                )
 
                 timestamp = data.get("timestamp", time.time() * 1000)
                 #  pong!
-                await self.send(
-                    text_data=json.dumps(
-                        {
-                            "type": WSMessageTypeServer.PONG,
-                            "timestamp": timestamp,
-                            "server_time": time.time() * 1000,
-                        }
-                    )
+                await self._send_payload(
+                    {
+                        "type": WSMessageTypeServer.PONG,
+                        "timestamp": timestamp,
+                        "server_time": time.time() * 1000,
+                    }
                 )
 
             elif msg_type == WSMessageTypeClient.SUBSCRIBE:
                 bunch_id = data.get("bunch_id")
                 channel_id = data.get("channel_id")
+                if "channels" in data or (bunch_id and not channel_id):
+                    await self._subscribe_many(data)
+                    return
                 if not bunch_id or not channel_id:
-                    await self.send(
-                        text_data=json.dumps(
-                            {
-                                "type": WSMessageTypeServer.ERROR,
-                                "message": "Missing bunch_id or channel_id",
-                            }
-                        )
+                    await self._send_payload(
+                        {
+                            "type": WSMessageTypeServer.ERROR,
+                            "message": "Missing bunch_id or channel_id",
+                        }
                     )
                     return
 
-                has_access = await self.check_user_access(bunch_id, channel_id)
+                has_access = await self.has_channel_access(bunch_id, channel_id)
                 if not has_access:
-                    await self.send(
-                        json.dumps(
-                            {
-                                "type": WSMessageTypeServer.ERROR,
-                                "message": "Access denied to channel",
-                            }
-                        )
+                    await self._send_payload(
+                        {
+                            "type": WSMessageTypeServer.ERROR,
+                            "message": "Access denied to channel",
+                        }
                     )
                     return
 
@@ -329,28 +391,34 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
                 logger.info(f"{self.user.username} subscribed to {group_name}")
 
-                await self.send(
-                    json.dumps(
-                        {
-                            "type": WSMessageTypeServer.SUBSCRIBED,
-                            "bunch_id": bunch_id,
-                            "channel_id": channel_id,
-                            "message": "Subscribed to channel",
-                        }
-                    )
+                # resuming: send what was broadcast since the client's last seq
+                replayed, resync = await self._replay(
+                    channel_id, data.get("last_seq")
+                )
+
+                await self._send_payload(
+                    {
+                        "type": WSMessageTypeServer.SUBSCRIBED,
+                        "bunch_id": bunch_id,
+                        "channel_id": channel_id,
+                        "message": "Subscribed to channel",
+                        "replayed": replayed,
+                        "resync": resync,
+                    }
                 )
 
             elif msg_type == WSMessageTypeClient.UNSUBSCRIBE:
                 bunch_id = data.get("bunch_id")
                 channel_id = data.get("channel_id")
+                if "channels" in data or (bunch_id and not channel_id):
+                    await self._unsubscribe_many(data)
+                    return
                 if not bunch_id or not channel_id:
-                    await self.send(
-                        text_data=json.dumps(
-                            {
-                                "type": WSMessageTypeServer.ERROR,
-                                "message": "Missing bunch_id or channel_id",
-                            }
-                        )
+                    await self._send_payload(
+                        {
+                            "type": WSMessageTypeServer.ERROR,
+                            "message": "Missing bunch_id or channel_id",
+                        }
                     )
                     return
 
@@ -365,24 +433,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
                         f"{self.user.username} unsubscribed from {group_name}"
                     )
 
-                    await self.channel_layer.group_send(
-                        group_name,
+                    await self._send_payload(
                         {
                             "type": WSMessageTypeServer.UNSUBSCRIBED,
                             "bunch_id": bunch_id,
                             "channel_id": channel_id,
                             "message": "Unsubscribed from channel",
-                        },
+                        }
                     )
 
                 else:
-                    await self.send(
-                        json.dumps(
-                            {
-                                "type": WSMessageTypeServer.ERROR,
-                                "message": "Not subscribed to that channel",
-                            }
-                        )
+                    await self._send_payload(
+                        {
+                            "type": WSMessageTypeServer.ERROR,
+                            "message": "Not subscribed to that channel",
+                        }
                     )
 
             elif msg_type == WSMessageTypeClient.MESSAGE_NEW:
@@ -391,13 +456,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 content = data.get("content", "").strip()
 
                 if not bunch_id or not channel_id:
-                    await self.send(
-                        text_data=json.dumps(
-                            {
-                                "type": WSMessageTypeServer.ERROR,
-                                "message": "Missing bunch_id or channel_id",
-                            }
-                        )
+                    await self._send_payload(
+                        {
+                            "type": WSMessageTypeServer.ERROR,
+                            "message": "Missing bunch_id or channel_id",
+                        }
                     )
                     return
 
@@ -405,32 +468,49 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     return
 
                 if (bunch_id, channel_id) not in self.subscribed_channels:
-                    await self.send(
-                        json.dumps(
-                            {
-                                "type": WSMessageTypeServer.ERROR,
-                                "message": "Not subscribed to channel",
-                            }
-                        )
+                    await self._send_payload(
+                        {
+                            "type": WSMessageTypeServer.ERROR,
+                            "message": "Not subscribed to channel",
+                        }
                     )
                     return
 
-                message_data = await database_sync_to_async(self._save_message)(
-                    self.user, bunch_id, channel_id, content
-                )
+                member = self.memberships.get(bunch_id)
+                if member is None:
+                    # membership ended since subscribing
+                    await self._send_payload(
+                        {
+                            "type": WSMessageTypeServer.ERROR,
+                            "message": "Not a member of bunch",
+                        }
+                    )
+                    return
+
+                batcher = get_message_batcher()
+                if batcher is not None:
+                    # broadcast once the batch it was saved with commits
+                    message_data = await batcher.save(
+                        member, channel_id, content
+                    )
+                else:
+                    message_data = await database_sync_to_async(
+                        self._save_message
+                    )(member, channel_id, content)
                 logger.info(
                     f"Message created with ID: {message_data.get('id')}"
                 )
 
-                group_name = f"chat_{bunch_id}_{channel_id}"
-                await self.channel_layer.group_send(
-                    group_name,
-                    {
-                        "type": WSMessageTypeServer.CHAT_MESSAGE,
-                        "message": message_data,
-                    },
+                await abroadcast(
+                    bunch_id, channel_id, chat_message_event(message_data)
                 )
 
+            elif msg_type in (
+                WSMessageTypeClient.MESSAGE_UPDATE,
+                WSMessageTypeClient.MESSAGE_DELETE,
+            ):
+                await self._change_message(data)
+
             elif msg_type in (
                 WSMessageTypeClient.REACTION,
                 WSMessageTypeClient.REACTION_TOGGLE,
@@ -446,52 +526,349 @@ class ChatConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error in receive: {str(e)}")
             raise e
 
-    @database_sync_to_async
-    def check_user_access(self, bunch_id, channel_id) -> bool:
-        try:
-            bunch = Bunch.objects.get(id=bunch_id)
-            return bunch.members.filter(user=self.user).exists()
-        except Exception:
+    async def _member(self, bunch_id: str) -> Member | None:
+        """The user's member of the bunch, cached for the connection."""
+        member = self.memberships.get(bunch_id)
+        if member is None:
+            try:
+                member = await Member.objects.filter(
+                    bunch_id=bunch_id, user=self.user
+                ).afirst()
+            except ValidationError:  # not a uuid
+                return None
+            if member is not None:
+                member.user = self.user
+                self.memberships[bunch_id] = member
+                await self._join_bunch_groups([bunch_id])
+        return member
+
+    async def has_channel_access(self, bunch_id: str, channel_id: str) -> bool:
+        """
+        Whether the channel is in the bunch and the user is a member of it.
+        Answered from the connection's cache once it is known.
+        """
+        if await self._member(bunch_id) is None:
             return False
 
-    def _save_message(
-        self,
-        user: "CustomUserModel",
-        bunch_id: str,
-        channel_id: str,
-        content: str,
-    ):
-        bunch = Bunch.objects.get(id=bunch_id)
-        channel = Channel.objects.get(id=channel_id, bunch=bunch)
-        member = bunch.members.get(user=user)
+        if channel_id not in self.channel_bunches:
+            try:
+                exists = await Channel.objects.filter(
+                    id=channel_id, bunch_id=bunch_id
+                ).aexists()
+            except ValidationError:
+                return False
+            if not exists:
+                return False
+            self.channel_bunches[channel_id] = bunch_id
+        return self.channel_bunches[channel_id] == bunch_id
+
+    def _save_message(self, member: Member, channel_id: str, content: str):
+        # author and channel come from the connection's cache, the INSERT
+        # (with its seq) is the only query
+        message = Message(content=content, author=member, channel_id=channel_id)
+        message.save()
+
+        return message_payload(message)
+
+    @staticmethod
+    def _requested_channels(data) -> list[tuple[str, str, typing.Any]]:
+        """
+        ``(bunch_id, channel_id, last_seq)`` of a batch frame's ``channels``,
+        given as objects or ``[bunch_id, channel_id]`` pairs.
+        """
+        requested = []
+        for item in data.get("channels") or ():
+            if isinstance(item, dict):
+                bunch_id, channel_id = (
+                    item.get("bunch_id"),
+                    item.get("channel_id"),
+                )
+                last_seq = item.get("last_seq")
+            elif isinstance(item, list | tuple) and len(item) == 2:
+                (bunch_id, channel_id), last_seq = item, None
+            else:
+                continue
+            if bunch_id and channel_id:
+                requested.append((str(bunch_id), str(channel_id), last_seq))
+        return requested
+
+    async def _accessible_channels(
+        self, pairs: list[tuple[str, str]], bunch_ids: list[str]
+    ) -> list[tuple[str, str]]:
+        """
+        Those of ``pairs`` the user may subscribe to, and all channels of the
+        ``bunch_ids`` they are a member of.
+
+        Checked against the connection's cache, with one query for the
+        memberships it doesn't know and one for the channels.
+        """
+        pairs = [pair for pair in pairs if _is_uuid(*pair)]
+        bunch_ids = [bunch_id for bunch_id in bunch_ids if _is_uuid(bunch_id)]
+
+        unknown_bunches = {bunch_id for bunch_id, _ in pairs} | set(bunch_ids)
+        unknown_bunches -= self.memberships.keys()
+        if unknown_bunches:
+            async for member in Member.objects.filter(
+                user=self.user, bunch_id__in=unknown_bunches
+            ):
+                member.user = self.user
+                self.memberships[str(member.bunch_id)] = member
+            await self._join_bunch_groups(
+                unknown_bunches & self.memberships.keys()
+            )
 
-        message = Message.objects.create(
-            content=content, author=member, channel=channel
+        # a bunch's channels are listed every time, they may have been added
+        whole = [b for b in dict.fromkeys(bunch_ids) if b in self.memberships]
+        unknown_channels = [
+            channel_id
+            for bunch_id, channel_id in pairs
+            if bunch_id in self.memberships
+            and channel_id not in self.channel_bunches
+        ]
+        channels_of: dict[str, list[str]] = {bunch_id: [] for bunch_id in whole}
+        if whole or unknown_channels:
+            async for channel_id, bunch_id in Channel.objects.filter(
+                Q(id__in=unknown_channels) | Q(bunch_id__in=whole)
+            ).values_list("id", "bunch_id"):
+                channel_id, bunch_id = str(channel_id), str(bunch_id)
+                self.channel_bunches[channel_id] = bunch_id
+                if bunch_id in channels_of:
+                    channels_of[bunch_id].append(channel_id)
+
+        accessible = [
+            (bunch_id, channel_id)
+            for bunch_id, channel_id in pairs
+            if bunch_id in self.memberships
+            and self.channel_bunches.get(channel_id) == bunch_id
+        ]
+        for bunch_id, channel_ids in channels_of.items():
+            accessible += [(bunch_id, channel_id) for channel_id in channel_ids]
+        return list(dict.fromkeys(accessible))
+
+    async def _subscribe_many(self, data):
+        """
+        Subscribe to the frame's ``channels``, or to every channel of its
+        ``bunch_id``, with a single ``subscribed`` reply listing them.
+        """
+        requested = self._requested_channels(data)
+        last_seqs = {channel_id: seq for _, channel_id, seq in requested}
+        whole = [data["bunch_id"]] if "channels" not in data else []
+        accessible = await self._accessible_channels(
+            [(bunch_id, channel_id) for bunch_id, channel_id, _ in requested],
+            whole,
         )
 
-        # Eagerly load all related fields and prepare the message data
-        return {
-            "id": str(message.id),
-            "channel": str(channel.id),
-            "author": {
-                "id": str(member.id),
-                "bunch": str(bunch.id),
-                "user": {
-                    "id": str(member.user.id),
-                    "username": member.user.username,
-                },
-                "role": member.role,
-                "joined_at": member.joined_at.isoformat(),
-            },
-            "content": message.content,
-            "created_at": message.created_at.isoformat(),
-            "updated_at": message.updated_at.isoformat(),
-            "edit_count": message.edit_count,
-            "deleted": message.deleted,
-            "deleted_at": message.deleted_at.isoformat()
-            if message.deleted_at
-            else None,
-        }
+        new = [
+            pair for pair in accessible if pair not in self.subscribed_channels
+        ]
+        await asyncio.gather(
+            *(
+                self.channel_layer.group_add(
+                    channel_group(*pair), self.channel_name
+                )
+                for pair in new
+            )
+        )
+        self.subscribed_channels.update(new)
+        logger.info(f"{self.user.username} subscribed to {len(new)} channels")
+
+        # replays after all the group adds, see the single subscribe
+        channels = []
+        for bunch_id, channel_id in accessible:
+            replayed, resync = await self._replay(
+                channel_id, last_seqs.get(channel_id)
+            )
+            channels.append(
+                {
+                    "bunch_id": bunch_id,
+                    "channel_id": channel_id,
+                    "replayed": replayed,
+                    "resync": resync,
+                }
+            )
+
+        denied = [
+            {"bunch_id": bunch_id, "channel_id": channel_id}
+            for bunch_id, channel_id, _ in requested
+            if (bunch_id, channel_id) not in accessible
+        ]
+        if whole and whole[0] not in self.memberships:
+            denied.append({"bunch_id": whole[0], "channel_id": None})
+
+        await self._send_payload(
+            {
+                "type": WSMessageTypeServer.SUBSCRIBED,
+                "channels": channels,
+                "denied": denied,
+                "message": f"Subscribed to {len(channels)} channels",
+            }
+        )
+
+    async def _unsubscribe_many(self, data):
+        """
+        Unsubscribe from the frame's ``channels``, or from every subscribed
+        channel of its ``bunch_id``, with a single ``unsubscribed`` reply.
+        """
+        if "channels" in data:
+            requested = {
+                (bunch_id, channel_id)
+                for bunch_id, channel_id, _ in self._requested_channels(data)
+            }
+            pairs = [p for p in self.subscribed_channels if p in requested]
+        else:
+            pairs = [
+                pair
+                for pair in self.subscribed_channels
+                if pair[0] == str(data["bunch_id"])
+            ]
+
+        await asyncio.gather(
+            *(
+                self.channel_layer.group_discard(
+                    channel_group(*pair), self.channel_name
+                )
+                for pair in pairs
+            )
+        )
+        self.subscribed_channels.difference_update(pairs)
+        logger.info(
+            f"{self.user.username} unsubscribed from {len(pairs)} channels"
+        )
+
+        await self._send_payload(
+            {
+                "type": WSMessageTypeServer.UNSUBSCRIBED,
+                "channels": [
+                    {"bunch_id": bunch_id, "channel_id": channel_id}
+                    for bunch_id, channel_id in pairs
+                ],
+                "message": f"Unsubscribed from {len(pairs)} channels",
+            }
+        )
+
+    async def _replay(self, channel_id: str, last_seq) -> tuple[int, bool]:
+        """
+        Resuming from ``last_seq``: send what was broadcast to the channel
+        since. Call once subscribed, so nothing falls in between (clients drop
+        duplicates by seq). Returns ``(frames replayed, resync needed)``.
+        """
+        if last_seq is None:
+            return 0, False
+        if type(last_seq) is not int or last_seq < 0:
+            await self._send_error("last_seq must be a non-negative integer")
+            return 0, True
+        frames = await self._missed_frames(channel_id, last_seq)
+        if frames is None:
+            return 0, True
+        for frame in frames:
+            if self.protocol == WSProtocol.JSON:
+                await self.send(text_data=frame)
+            else:
+                await self.send(bytes_data=transcode(frame, self.protocol))
+        return len(frames), False
+
+    async def _missed_frames(self, channel_id: str, seq: int):
+        """
+        Frames broadcast to the channel after ``seq``, or ``None`` if they
+        can't all be recovered and the client has to refetch the channel.
+
+        Recent events come from the replay buffer. Past it, only messages
+        are stored, so they are read back from the database, up to
+        ``REPLAY_DB_LIMIT`` of them, as long as they are all that was
+        broadcast: reactions, edits and deletions take seqs too but can't
+        be replayed.
+        """
+        frames = await get_replay_buffer().since(channel_id, seq)
+        if frames is not None:
+            return frames
+        return await database_sync_to_async(self._missed_message_frames)(
+            channel_id, seq
+        )
+
+    def _missed_message_frames(self, channel_id: str, seq: int):
+        last_seq = (
+            Channel.objects.filter(id=channel_id)
+            .values_list("last_seq", flat=True)
+            .first()
+        )
+        if last_seq is None or last_seq - seq > settings.REPLAY_DB_LIMIT:
+            return None
+        rows = list(
+            Message.objects.filter(
+                channel_id=channel_id, seq__gt=seq, seq__lte=last_seq
+            )
+            .order_by("seq")
+            .values(*MESSAGE_VALUES)
+        )
+        # a seq without a message was another event, which is lost
+        if [row["seq"] for row in rows] != list(range(seq + 1, last_seq + 1)):
+            return None
+        return [
+            chat_message_event(payload)["frame"]
+            for payload in message_payloads(rows)
+        ]
+
+    async def _change_message(self, data):
+        """Edit (``message.update``) or delete (``message.delete``) a message."""
+        bunch_id = data.get("bunch_id")
+        channel_id = data.get("channel_id")
+        message_id = data.get("message_id")
+        content = (data.get("content") or "").strip()
+        deleting = data.get("type") == WSMessageTypeClient.MESSAGE_DELETE
+
+        if not bunch_id or not channel_id or not _is_uuid(message_id):
+            await self._send_error("Missing bunch_id, channel_id or message_id")
+            return
+        if not deleting and not content:
+            return
+        if (bunch_id, channel_id) not in self.subscribed_channels:
+            await self._send_error("Not subscribed to channel")
+            return
+        member = self.memberships.get(bunch_id)
+        if member is None:
+            await self._send_error("Not a member of bunch")
+            return
+
+        event = await database_sync_to_async(self._apply_change)(
+            member, channel_id, message_id, None if deleting else content
+        )
+        if event is None:
+            await self._send_error("Message not found")
+            return
+        await abroadcast(bunch_id, channel_id, event)
+
+    def _apply_change(
+        self,
+        member: Member,
+        channel_id: str,
+        message_id: str,
+        content: str | None,
+    ) -> dict | None:
+        """
+        Edit the member's message to ``content``, or delete it if ``None``.
+        Returns the event to broadcast, or ``None`` if the member has no such
+        message in the channel (or it is deleted).
+        """
+        conditions = {"channel_id": channel_id, "author_id": member.id}
+        with transaction.atomic():
+            if content is None:
+                deleted_at = Message.objects.soft_delete(
+                    message_id, **conditions
+                )
+                if deleted_at is None:
+                    return None
+                seq = Channel.allocate_seq(channel_id)
+                return message_deleted_event(
+                    message_id, channel_id, seq, deleted_at
+                )
+
+            edited = Message.objects.edit(message_id, content, **conditions)
+            if edited is None:
+                return None
+            seq = Channel.allocate_seq(channel_id)
+            return message_updated_event(
+                message_id, channel_id, seq, content, *edited
+            )
 
     async def _handle_reaction(self, data):
         """Handle reaction add/remove/toggle events."""
@@ -503,208 +880,231 @@ class ChatConsumer(AsyncWebsocketConsumer):
             emoji = data.get("emoji")
             bunch_id = data.get("bunch_id")
             channel_id = data.get("channel_id")
-            group_name = f"chat_{bunch_id}_{channel_id}"
 
             if not all([message_id, emoji, bunch_id, channel_id]):
                 logger.warning("Invalid reaction data received")
                 return
 
-            has_access = await self.check_user_access(bunch_id, channel_id)
-            if not has_access:
-                logger.warning(
-                    f"User {self.user.username} denied reaction access to\
-                    bunch {bunch_id} channel {channel_id}"
-                )
-                return
-
-            # reaction exists -> add/remove accordingly
             if (
                 data.get("type") == WSMessageTypeClient.REACTION_TOGGLE
                 or not action
             ):
-
-                def check_existing_reaction():
-                    return Reaction.objects.filter(
-                        message_id=message_id,
-                        user=self.user,
-                        emoji=emoji,
-                    ).first()
-
-                existing_reaction = await database_sync_to_async(
-                    check_existing_reaction
-                )()
-
-                if existing_reaction:
-                    reaction_data = await database_sync_to_async(
-                        self._remove_reaction
-                    )(self.user, bunch_id, message_id, emoji)
-
-                    if reaction_data:
-                        await self.channel_layer.group_send(
-                            group_name,
-                            {
-                                "type": WSMessageTypeServer.REACTION_REMOVED,
-                                "reaction": reaction_data,
-                            },
-                        )
-                else:
-                    reaction_data = await database_sync_to_async(
-                        self._add_reaction
-                    )(self.user, bunch_id, message_id, emoji)
-
-                    if reaction_data:
-                        # Broadcast
-                        await self.channel_layer.group_send(
-                            group_name,
-                            {
-                                "type": WSMessageTypeServer.REACTION_ADDED,
-                                "reaction": reaction_data,
-                            },
-                        )
+                action = "toggle"
+            elif action not in ("add", "remove"):
+                logger.warning(f"Invalid reaction action: {action}")
                 return
 
-            # Handle explicit add/remove actions
-            if action == "add":
-                reaction_data = await database_sync_to_async(
-                    self._add_reaction
-                )(self.user, bunch_id, message_id, emoji)
-
-                if reaction_data:
-                    # Broadcast reaction add event
-                    await self.channel_layer.group_send(
-                        group_name,
-                        {
-                            "type": WSMessageTypeServer.REACTION_ADDED,
-                            "reaction": reaction_data,
-                        },
-                    )
-
-            elif action == "remove":
-                reaction_data = await database_sync_to_async(
-                    self._remove_reaction
-                )(self.user, bunch_id, message_id, emoji)
+            # one thread hop and one transaction for the whole reaction
+            outcome = await database_sync_to_async(self._react)(
+                self.user, bunch_id, channel_id, message_id, emoji, action
+            )
+            if outcome is None:
+                return
 
-                if reaction_data:
-                    # Broadcast reaction remove event
-                    await self.channel_layer.group_send(
-                        group_name,
-                        {
-                            "type": WSMessageTypeServer.REACTION_REMOVED,
-                            "reaction": reaction_data,
-                        },
-                    )
+            added, reaction_data = outcome
+            make_event = (
+                reaction_added_event if added else reaction_removed_event
+            )
+            await abroadcast(bunch_id, channel_id, make_event(reaction_data))
 
         except Exception as e:
             logger.error(f"Error handling reaction: {str(e)}")
 
-    def _add_reaction(
+    def _react(
         self,
         user: "CustomUserModel",
         bunch_id: str,
+        channel_id: str,
         message_id: str,
         emoji: str,
-    ):
-        """Add a reaction to a message."""
-        try:
-            bunch = Bunch.objects.get(id=bunch_id)
-            message = Message.objects.get(id=message_id, channel__bunch=bunch)
-
-            # Check if user is a member of the bunch
-            if not bunch.members.filter(user=user).exists():
+        action: str,
+    ) -> tuple[bool, dict] | None:
+        """
+        Add (``"add"``), remove (``"remove"``) or toggle (``"toggle"``) the
+        user's ``emoji`` reaction on a message.
+
+        Returns whether the reaction was added or removed, with its data, or
+        ``None`` if nothing changed. The unique (message, user, emoji)
+        constraint decides between adding and removing: the reaction is
+        inserted, and removed if the insert hits an existing one. Removal
+        locks the row, so of two concurrent removals only one goes through.
+        """
+        with transaction.atomic():
+            # the message is in the channel, of a bunch the user is in
+            if not Message.objects.filter(
+                id=message_id,
+                channel_id=channel_id,
+                channel__bunch_id=bunch_id,
+                channel__bunch__members__user=user,
+            ).exists():
                 logger.warning(
-                    f"User {user.username} not a member of bunch {bunch.name}"
+                    f"User {user.username} denied reaction access to "
+                    f"message {message_id}"
                 )
                 return None
 
-            # Check if reaction already exists
-            if Reaction.objects.filter(
-                message=message, user=user, emoji=emoji
-            ).exists():
-                logger.info(
-                    f"Reaction already exists: {emoji} by {user.username}"
+            added = False
+            if action != "remove":
+                reaction = Reaction(
+                    message_id=message_id, user=user, emoji=emoji
                 )
-                return None
-
-            # Create the reaction
-            reaction = Reaction.objects.create(
-                message=message, user=user, emoji=emoji
-            )
-
-            logger.info(
-                f"Reaction added: {emoji} by {user.username} to message {message_id}"
-            )
+                try:
+                    with transaction.atomic():
+                        reaction.save()
+                    added = True
+                except IntegrityError:
+                    if action == "add":
+                        return None
+
+            if not added:
+                reaction = (
+                    Reaction.objects.select_for_update()
+                    .filter(message_id=message_id, user=user, emoji=emoji)
+                    .first()
+                )
+                if reaction is None:
+                    # never there, or removed by a concurrent request
+                    return None
 
-            return {
+            reaction_data = {
                 "id": str(reaction.id),
-                "message_id": str(message.id),
+                "message_id": str(message_id),
                 "user": {
                     "id": str(user.id),
                     "username": user.username,
                 },
                 "emoji": reaction.emoji,
                 "created_at": reaction.created_at.isoformat(),
+                "seq": Channel.allocate_seq(channel_id),
             }
+            if not added:
+                reaction.delete()
 
-        except (
-            Bunch.DoesNotExist,
-            Message.DoesNotExist,
-        ) as e:
-            logger.error(f"Error adding reaction: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error adding reaction: {str(e)}")
-            return None
-
-    def _remove_reaction(
-        self,
-        user: "CustomUserModel",
-        bunch_id: str,
-        message_id: str,
-        emoji: str,
-    ):
-        """Remove a reaction from a message."""
-        try:
-            bunch = Bunch.objects.get(id=bunch_id)
-            message = Message.objects.get(id=message_id, channel__bunch=bunch)
+        logger.info(
+            f"Reaction {'added' if added else 'removed'}: {emoji} by "
+            f"{user.username} on message {message_id}"
+        )
+        return added, reaction_data
+
+    async def membership_changed(self, event):
+        """
+        The user's membership of a bunch changed: reload it, and leave the
+        bunch's channels if it is gone.
+        """
+        bunch_id = event["bunch_id"]
+        self.memberships.pop(bunch_id, None)
+        if await self._member(bunch_id) is not None:
+            return
 
-            # Find the reaction
-            reaction = Reaction.objects.filter(
-                message=message, user=user, emoji=emoji
-            ).first()
+        if bunch_id in self.bunch_groups:
+            self.bunch_groups.discard(bunch_id)
+            await self.channel_layer.group_discard(
+                bunch_group(bunch_id), self.channel_name
+            )
+        for subscribed in list(self.subscribed_channels):
+            if subscribed[0] == bunch_id:
+                await self._drop_subscription(*subscribed, "Not a member")
+
+    async def channel_deleted(self, event):
+        self.channel_bunches.pop(event["channel_id"], None)
+        subscribed = (event["bunch_id"], event["channel_id"])
+        if subscribed in self.subscribed_channels:
+            await self._drop_subscription(*subscribed, "Channel deleted")
+        if self._is_connected and "frame" in event:
+            await self._send_frame(
+                event, WSMessageTypeServer.CHANNEL_DELETED, "channel_id"
+            )
 
-            if not reaction:
-                logger.warning(
-                    f"Reaction not found: {emoji} by {user.username}"
-                )
-                return None
+    async def bunch_event(self, event):
+        """A bunch-wide event (members, channels), written as is."""
+        if not self._is_connected:
+            return
+        await self._send_frame(event, event["type"], "")
 
-            reaction_data = {
-                "id": str(reaction.id),
-                "message_id": str(message.id),
-                "user": {
-                    "id": str(user.id),
-                    "username": user.username,
-                },
-                "emoji": reaction.emoji,
-                "created_at": reaction.created_at.isoformat(),
-            }
+    async def _drop_subscription(self, bunch_id, channel_id, reason: str):
+        """Unsubscribe the socket from a channel it may no longer see."""
+        self.subscribed_channels.discard((bunch_id, channel_id))
+        await self.channel_layer.group_discard(
+            channel_group(bunch_id, channel_id), self.channel_name
+        )
+        if self._is_connected:
+            await self._send_payload(
+                {
+                    "type": WSMessageTypeServer.UNSUBSCRIBED,
+                    "bunch_id": bunch_id,
+                    "channel_id": channel_id,
+                    "message": reason,
+                }
+            )
 
-            reaction.delete()
-            logger.info(
-                f"Reaction removed: {emoji} by {user.username} from message {message_id}"
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Write a frame, through the send queue once there is one."""
+        data = text_data if text_data is not None else bytes_data
+        if self.send_queue is None or data is None or close:
+            await super().send(
+                text_data=text_data, bytes_data=bytes_data, close=close
             )
+            return
+        await self.send_queue.put(data)
 
-            return reaction_data
+    async def _send_payload(self, payload: dict):
+        """Send a reply, encoded once in the connection's protocol."""
+        data = encode(payload, self.protocol)
+        if isinstance(data, bytes):
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
 
-        except (
-            Bunch.DoesNotExist,
-            Message.DoesNotExist,
-        ) as e:
-            logger.error(f"Error removing reaction: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error removing reaction: {str(e)}")
-            return None
+    async def _send_error(self, message: str):
+        await self._send_payload(
+            {"type": WSMessageTypeServer.ERROR, "message": message}
+        )
+
+    async def _write(self, data: str | bytes):
+        """Write a frame to the socket, past the send queue."""
+        if isinstance(data, bytes):
+            await super().send(bytes_data=data)
+        else:
+            await super().send(text_data=data)
+
+    async def _send_overflowed(self, delivered: dict[str, int]):
+        """
+        The client fell too far behind: tell it where each channel's events
+        stopped, to resubscribe from there with ``last_seq``, and close.
+        """
+        logger.warning(
+            f"Closing connection {self.connection_id} of "
+            f"{self.user.username if self.user else None}: send queue full"
+        )
+        await self._write(
+            encode(
+                {
+                    "type": WSMessageTypeServer.RESUME,
+                    "message": "Too far behind, resume with last_seq",
+                    "last_seq": delivered,
+                },
+                self.protocol,
+            )
+        )
+        await self.close(code=4008)
+
+    async def _send_frame(self, event, frame_type: str, key: str):
+        """Queue the event's pre-encoded frame to be written as is."""
+        frame = event.get("frame")
+        if frame is None:
+            # event from a sender that predates pre-encoded frames
+            frame = encode_frame(frame_type, **{key: event[key]})
+        if self.protocol != WSProtocol.JSON:
+            frame = transcode(frame, self.protocol)
+        if self.send_queue is None:
+            await self._write(frame)
+            return
+        await self.send_queue.put(
+            frame,
+            kind=event["type"],
+            channel_id=event.get("channel_id"),
+            seq=event.get("seq"),
+        )
 
     async def reaction_added(self, event):
         """Send reaction added event to WebSocket."""
@@ -713,15 +1113,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         try:
-            reaction = event["reaction"]
-            logger.info(f"Sending reaction added to client: {reaction['id']}")
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": WSMessageTypeServer.REACTION_NEW,
-                        "reaction": reaction,
-                    }
-                )
+            await self._send_frame(
+                event, WSMessageTypeServer.REACTION_NEW, "reaction"
             )
         except Exception as e:
             logger.error(f"Error in reaction_added: {str(e)}")
@@ -733,34 +1126,44 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         try:
-            reaction = event["reaction"]
-            logger.info(f"Sending reaction removed to client: {reaction['id']}")
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": WSMessageTypeServer.REACTION_DELETE,
-                        "reaction": reaction,
-                    }
-                )
+            await self._send_frame(
+                event, WSMessageTypeServer.REACTION_DELETE, "reaction"
             )
         except Exception as e:
             logger.error(f"Error in reaction_removed: {str(e)}")
 
+    async def message_updated(self, event):
+        if not self._is_connected:
+            logger.warning("Received message_updated while not connected")
+            return
+
+        try:
+            await self._send_frame(
+                event, WSMessageTypeServer.MESSAGE_UPDATED, "message"
+            )
+        except Exception as e:
+            logger.error(f"Error in message_updated: {str(e)}")
+
+    async def message_deleted(self, event):
+        if not self._is_connected:
+            logger.warning("Received message_deleted while not connected")
+            return
+
+        try:
+            await self._send_frame(
+                event, WSMessageTypeServer.MESSAGE_DELETED, "message"
+            )
+        except Exception as e:
+            logger.error(f"Error in message_deleted: {str(e)}")
+
     async def chat_message(self, event):
         if not self._is_connected:
             logger.warning("Received chat_message while not connected")
             return
 
         try:
-            message = event["message"]
-            logger.info(f"Sending message to client: {message['id']}")
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": WSMessageTypeServer.CHAT_MESSAGE,
-                        "message": message,
-                    }
-                )
+            await self._send_frame(
+                event, WSMessageTypeServer.CHAT_MESSAGE, "message"
             )
         except Exception as e:
             logger.error(f"Error in chat_message: {str(e)}")
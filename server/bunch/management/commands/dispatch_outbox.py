@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bunch.models import OutboxEvent
+from bunch.outbox import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the outbox's events to the channel layer, for "
+        "OUTBOX_DISPATCHER=command"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send what is in the outbox and exit, instead of polling",
+        )
+
+    def handle(self, *args, once=False, **options):
+        # one loop for all batches, keeping its channel layer connections
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        dispatcher = OutboxDispatcher(
+            batch_size=settings.OUTBOX_BATCH_SIZE,
+            poll_interval=settings.OUTBOX_POLL_INTERVAL,
+            retry_delay=settings.OUTBOX_RETRY_DELAY,
+            max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+            loop=loop,
+        )
+        if not once:
+            self.stdout.write("Dispatching the outbox")
+            dispatcher.run()
+
+        if not dispatcher.drain():
+            raise CommandError(
+                f"{OutboxEvent.objects.count()} events could not be sent"
+            )
+        self.stdout.write(self.style.SUCCESS("Outbox is empty"))
@@ -0,0 +1,118 @@
+from collections.abc import Iterator
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+
+from bunch.models import Reaction, ReactionCount
+
+Counts = dict[str, int]
+
+
+def expected_counts() -> Iterator[tuple[str, Counts]]:
+    """Counts aggregated from the reactions, by message id."""
+    totals = (
+        Reaction.objects.order_by("message_id")
+        .values_list("message_id", "emoji")
+        .annotate(count=models.Count("id"))
+    )
+    return by_message(totals)
+
+
+def stored_counts() -> Iterator[tuple[str, Counts]]:
+    """Non-zero ReactionCount rows, by message id."""
+    totals = (
+        ReactionCount.objects.filter(count__gt=0)
+        .order_by("message_id")
+        .values_list("message_id", "emoji", "count")
+    )
+    return by_message(totals)
+
+
+def by_message(totals) -> Iterator[tuple[str, Counts]]:
+    """``(message id, emoji, count)`` rows grouped into one dict per message."""
+    for message_id, rows in groupby(totals.iterator(), key=itemgetter(0)):
+        yield str(message_id), {emoji: count for _, emoji, count in rows}
+
+
+def mismatches() -> Iterator[tuple[str, str, int, int]]:
+    """(message id, emoji, expected, stored) for every count that is off."""
+    expected, stored = expected_counts(), stored_counts()
+    done = ("", {})
+    want, have = next(expected, done), next(stored, done)
+
+    while want is not done or have is not done:
+        # both streams are ordered by message id
+        if have is done or (want is not done and want[0] < have[0]):
+            message_id, want_counts, have_counts = *want, {}
+            want = next(expected, done)
+        elif want is done or have[0] < want[0]:
+            message_id, want_counts, have_counts = have[0], {}, have[1]
+            have = next(stored, done)
+        else:
+            message_id, want_counts, have_counts = *want, have[1]
+            want, have = next(expected, done), next(stored, done)
+
+        for emoji in want_counts.keys() | have_counts.keys():
+            if want_counts.get(emoji, 0) != have_counts.get(emoji, 0):
+                yield (
+                    message_id,
+                    emoji,
+                    want_counts.get(emoji, 0),
+                    have_counts.get(emoji, 0),
+                )
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-message reaction counts from the reactions and "
+        "verify they match"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only verify the counts, exit with an error if they are off",
+        )
+
+    def handle(self, *args, check=False, **options):
+        if not check:
+            self.rebuild()
+
+        off = 0
+        for message_id, emoji, want, have in mismatches():
+            off += 1
+            if off <= 20:
+                self.stderr.write(
+                    f"message {message_id} {emoji}: "
+                    f"counted {have}, expected {want}"
+                )
+
+        if off:
+            raise CommandError(f"{off} reaction counts are off")
+        self.stdout.write(self.style.SUCCESS("Reaction counts are consistent"))
+
+    def rebuild(self) -> None:
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # hold off reactions until the new counts are in
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"LOCK TABLE {Reaction._meta.db_table} IN SHARE MODE"
+                    )
+
+            ReactionCount.objects.all().delete()
+            created = ReactionCount.objects.bulk_create(
+                (
+                    ReactionCount(
+                        message_id=message_id, emoji=emoji, count=count
+                    )
+                    for message_id, counts in expected_counts()
+                    for emoji, count in counts.items()
+                ),
+                batch_size=1000,
+            )
+
+        self.stdout.write(f"Rebuilt {len(created)} reaction counts")
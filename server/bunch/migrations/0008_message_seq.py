@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 07:47
+
+from django.db import migrations, models
+
+
+def number_messages(apps, schema_editor):
+    """Number existing messages of each channel in creation order."""
+    Channel = apps.get_model("bunch", "Channel")
+    Message = apps.get_model("bunch", "Message")
+
+    for channel in Channel.objects.all().iterator():
+        messages = list(
+            Message.objects.filter(channel=channel).order_by("created_at", "id")
+        )
+        for seq, message in enumerate(messages, start=1):
+            message.seq = seq
+        Message.objects.bulk_update(messages, ["seq"], batch_size=1000)
+        Channel.objects.filter(pk=channel.pk).update(last_seq=len(messages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bunch', '0007_alter_reaction_emoji'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text="Sequence number of the channel's latest event"),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False, help_text='Sequence number in the channel, see Channel.allocate_seq', null=True),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('channel', 'seq'), name='unique_message_seq'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-17 08:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def count_reactions(apps, schema_editor):
+    """Count the existing reactions of each message by emoji."""
+    Reaction = apps.get_model("bunch", "Reaction")
+    ReactionCount = apps.get_model("bunch", "ReactionCount")
+
+    totals = (
+        Reaction.objects.order_by()
+        .values("message_id", "emoji")
+        .annotate(count=models.Count("id"))
+    )
+    ReactionCount.objects.bulk_create(
+        (ReactionCount(**total) for total in totals.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bunch', '0009_message_channel_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emoji', models.CharField(max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_totals', to='bunch.message')),
+            ],
+            options={
+                'verbose_name': 'Reaction count',
+                'verbose_name_plural': 'Reaction counts',
+                'constraints': [models.UniqueConstraint(fields=('message', 'emoji'), name='unique_reaction_count')],
+            },
+        ),
+        migrations.RunPython(count_reactions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bunch', '0010_reaction_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('bunch_id', models.UUIDField()),
+                ('channel_id', models.UUIDField()),
+                ('event', models.JSONField(help_text='Channel layer event, with its frame')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Outbox event',
+                'verbose_name_plural': 'Outbox events',
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-17 11:20
+
+from django.db import migrations
+
+
+def clear_deleted_content(apps, schema_editor):
+    """Clear the content soft deleted messages kept."""
+    Message = apps.get_model("bunch", "Message")
+    Message.objects.filter(deleted=True).exclude(content="").update(content="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bunch', '0011_outbox_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_deleted_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bunch', '0012_clear_deleted_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='group',
+            field=models.CharField(blank=True, help_text="Group of a bunch or user event, empty for a channel's", max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='channel_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
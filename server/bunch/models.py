@@ -1,9 +1,13 @@
 import random
 import uuid
+from datetime import datetime
 from typing import TYPE_CHECKING, override
 
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
 
 from users.models import User
 
@@ -172,6 +176,11 @@ class Channel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_private = models.BooleanField(default=False)
     position = models.IntegerField(default=0)
+    last_seq = models.PositiveBigIntegerField(
+        default=0,
+        editable=False,
+        help_text="Sequence number of the channel's latest event",
+    )
 
     class Meta:
         ordering = ["position"]
@@ -182,10 +191,68 @@ class Channel(models.Model):
     def __str__(self):
         return f"{self.name} in {self.bunch.name}"
 
+    @classmethod
+    def allocate_seq(cls, channel_id, count: int = 1) -> int:
+        """
+        The next event sequence number of the channel, or the last of the
+        next ``count`` numbers.
+
+        Call inside a transaction: the channel row stays locked until it
+        commits, so numbers are handed out in commit order.
+        """
+        if connection.vendor in ("postgresql", "sqlite"):
+            # bump and read back in one statement
+            quote = connection.ops.quote_name
+            table = quote(cls._meta.db_table)
+            seq = quote(cls._meta.get_field("last_seq").column)
+            pk = quote(cls._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET {seq} = {seq} + %s WHERE {pk} = %s "
+                    f"RETURNING {seq}",
+                    [
+                        count,
+                        cls._meta.pk.get_db_prep_value(channel_id, connection),
+                    ],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                raise cls.DoesNotExist("Channel matching query does not exist.")
+            return row[0]
+
+        cls.objects.filter(pk=channel_id).update(
+            last_seq=models.F("last_seq") + count
+        )
+        return (
+            cls.objects.filter(pk=channel_id)
+            .values_list("last_seq", flat=True)
+            .get()
+        )
+
     if TYPE_CHECKING:
         messages: models.QuerySet["Message"]
 
 
+def reply_count() -> models.Func:
+    """
+    Number of replies of each message, for ``annotate(reply_count=...)``.
+
+    A correlated subquery rather than ``Count("replies")``: the aggregate
+    groups every matching message before a page is cut from them, while the
+    subquery only runs for the rows that are returned.
+    """
+    return Coalesce(
+        models.Subquery(
+            Message.objects.filter(reply_to=models.OuterRef("pk"))
+            .order_by()
+            .values("reply_to")
+            .annotate(count=models.Count("*"))
+            .values("count")
+        ),
+        0,
+    )
+
+
 class MessageManager(models.Manager["Message"]):
     def get_queryset(self):
         return super().get_queryset()
@@ -216,7 +283,7 @@ class MessageManager(models.Manager["Message"]):
 
     def with_replies(self):
         """Returns messages with their reply count."""
-        return self.get_queryset().annotate(reply_count=models.Count("replies"))
+        return self.get_queryset().annotate(reply_count=reply_count())
 
     def top_level(self):
         """Returns only top-level messages (not replies)."""
@@ -226,6 +293,62 @@ class MessageManager(models.Manager["Message"]):
         """Returns replies to a specific message."""
         return self.get_queryset().filter(reply_to_id=message_id)
 
+    def edit(
+        self, message_id, content: str, **conditions
+    ) -> tuple[int, datetime] | None:
+        """
+        Replace the content of a message that isn't deleted, in one
+        conditional UPDATE. ``conditions`` narrow down the messages that may
+        be edited, e.g. ``author_id=...``.
+
+        Returns the new edit count and update time, or ``None`` if no message
+        matched: missing, deleted (perhaps concurrently) or not allowed.
+        """
+        now = timezone.now()
+        messages = self.active().filter(id=message_id, **conditions)
+        values = {
+            "content": content,
+            "edit_count": models.F("edit_count") + 1,
+            "updated_at": now,
+        }
+        if connection.vendor not in ("postgresql", "sqlite"):
+            with transaction.atomic():
+                if not messages.update(**values):
+                    return None
+                edit_count = (
+                    self.filter(id=message_id)
+                    .values_list("edit_count", flat=True)
+                    .get()
+                )
+            return edit_count, now
+
+        # update and read back the count in one statement
+        query = messages.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        sql, params = query.get_compiler(messages.db).as_sql()
+        edit_count = connection.ops.quote_name(
+            self.model._meta.get_field("edit_count").column
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} RETURNING {edit_count}", params)
+            row = cursor.fetchone()
+        return None if row is None else (row[0], now)
+
+    def soft_delete(self, message_id, **conditions) -> datetime | None:
+        """
+        Mark a message deleted and clear its content, in one conditional
+        UPDATE, leaving the row for its replies and reactions. Returns the
+        deletion time, or ``None`` if no message matched (see :meth:`edit`).
+        """
+        now = timezone.now()
+        if not (
+            self.active()
+            .filter(id=message_id, **conditions)
+            .update(content="", deleted=True, deleted_at=now, updated_at=now)
+        ):
+            return None
+        return now
+
 
 class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -257,6 +380,11 @@ class Message(models.Model):
         related_name="replies",
         help_text="Message this is a reply to",
     )
+    seq = models.PositiveBigIntegerField(
+        null=True,
+        editable=False,
+        help_text="Sequence number in the channel, see Channel.allocate_seq",
+    )
 
     objects: "MessageManager" = MessageManager()
 
@@ -264,6 +392,18 @@ class Message(models.Model):
         verbose_name = "Message"
         verbose_name_plural = "Messages"
         ordering = ["created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["channel", "seq"], name="unique_message_seq"
+            ),
+        ]
+        indexes = [
+            # keyset pagination of a channel, see MessagePagination
+            models.Index(
+                fields=["channel", "created_at", "id"],
+                name="message_channel_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Message by {self.author.user.username} in {self.channel.name}"
@@ -275,6 +415,12 @@ class Message(models.Model):
         if self.created_at is not None:
             self.edit_count += 1
 
+        if self._state.adding and self.seq is None:
+            with transaction.atomic():
+                self.seq = Channel.allocate_seq(self.channel_id)
+                super().save(*args, **kwargs)
+            return
+
         super().save(*args, **kwargs)
 
     if TYPE_CHECKING:
@@ -352,6 +498,18 @@ class Reaction(models.Model):
     def __str__(self):
         return f"{self.user.username} reacted {self.emoji} to message {self.message.id}"
 
+    @override
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        # counted in the same transaction, see ReactionCount. A failed insert
+        # rolls back the caller's transaction (or savepoint) as usual.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            ReactionCount.objects.change(self.message_id, self.emoji, 1)
+
     def clean(self):
         """Validate that the user has access to the message's channel/bunch."""
         super().clean()
@@ -364,3 +522,94 @@ class Reaction(models.Model):
             raise ValidationError(
                 "User must be a member of the bunch to react to messages."
             )
+
+
+class ReactionCountManager(models.Manager["ReactionCount"]):
+    def change(self, message_id, emoji: str, delta: int) -> None:
+        """Add ``delta`` to the count of ``emoji`` on the message."""
+        counts = self.get_queryset().filter(message_id=message_id, emoji=emoji)
+        if delta < 0:
+            # never below zero, even if the counts were out of sync
+            counts = counts.filter(count__gte=-delta)
+        if counts.update(count=models.F("count") + delta) or delta < 0:
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(message_id=message_id, emoji=emoji, count=delta)
+        except IntegrityError:
+            # created by a concurrent reaction in the meantime
+            counts.update(count=models.F("count") + delta)
+
+    def for_messages(self, message_ids):
+        """Non-zero counts of the messages, most used emoji first."""
+        return (
+            self.get_queryset()
+            .filter(message_id__in=message_ids, count__gt=0)
+            .order_by("-count", "emoji")
+        )
+
+
+class ReactionCount(models.Model):
+    """
+    Number of reactions of each emoji on a message.
+
+    Kept in step with Reaction rows as they are added and removed, in the
+    same transaction, so counts are read without aggregating reactions.
+    Rows are left at zero when the last reaction goes, rather than deleted.
+    ``manage.py rebuild_reaction_counts`` recomputes them.
+    """
+
+    message = models.ForeignKey["Message"](
+        Message,
+        on_delete=models.CASCADE,
+        related_name="reaction_totals",
+    )
+    emoji = models.CharField(max_length=10)
+    count = models.PositiveIntegerField(default=0)
+
+    objects: "ReactionCountManager" = ReactionCountManager()
+
+    class Meta:
+        verbose_name = "Reaction count"
+        verbose_name_plural = "Reaction counts"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["message", "emoji"], name="unique_reaction_count"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.count} {self.emoji} on message {self.message_id}"
+
+
+class OutboxEvent(models.Model):
+    """
+    A channel event waiting to be broadcast, or a bunch or user event to
+    its group, see bunch.outbox.
+
+    Written in the transaction of the change it announces, so the event is
+    sent if and only if the change commits, and deleted once it was sent.
+    """
+
+    # the order events of a channel are sent in: seqs are allocated under
+    # the channel's row lock, so its events are written in seq order
+    id = models.BigAutoField(primary_key=True)
+    bunch_id = models.UUIDField()
+    channel_id = models.UUIDField(null=True, blank=True)
+    group = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Group of a bunch or user event, empty for a channel's",
+    )
+    event = models.JSONField(help_text="Channel layer event, with its frame")
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Outbox event"
+        verbose_name_plural = "Outbox events"
+
+    def __str__(self):
+        target = self.group or f"channel {self.channel_id}"
+        return f"{self.event.get('type')} to {target}"
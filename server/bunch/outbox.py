@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import cache
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import receiver
+
+from bunch.broadcast import abroadcast, agroup_send
+from bunch.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# seconds a batch may take to send on the server's loop
+SEND_TIMEOUT = 30
+
+
+def enqueue(bunch_id, channel_id, event: dict) -> None:
+    """
+    Broadcast ``event`` to the channel once the current transaction commits.
+
+    The event is written to the outbox in the transaction, so call this in
+    the ``atomic`` block of the change it announces: it is then sent if and
+    only if the change commits, without the request waiting on the channel
+    layer.
+    """
+    _write(OutboxEvent(bunch_id=bunch_id, channel_id=channel_id, event=event))
+
+
+def enqueue_group(bunch_id, group: str, event: dict) -> None:
+    """
+    Send ``event`` to a bunch's or user's group (bunch.broadcast.bunch_group,
+    user_group) once the current transaction commits, as :func:`enqueue`.
+    """
+    _write(OutboxEvent(bunch_id=bunch_id, group=group, event=event))
+
+
+def _write(event: OutboxEvent) -> None:
+    event.save(force_insert=True)
+    dispatcher = get_outbox_dispatcher()
+    if dispatcher is not None:
+        transaction.on_commit(dispatcher.wake)
+
+
+class OutboxDispatcher:
+    """
+    Sends outbox events to the channel layer, oldest first, and deletes them
+    once sent.
+
+    Delivery is at least once: an event is deleted only after it was sent,
+    so one sent just before a crash is sent again (clients drop duplicates
+    by seq). Each channel's events are sent in order, and bunch and user
+    events in the order they were written, as a connection joins a bunch's
+    group on the ``membership.changed`` sent before the bunch's own events.
+    A channel (or the group events) whose event fails to send is held back
+    until the next attempt, and an event is given up on after
+    ``max_attempts``.
+
+    The database work is done on a thread of the dispatcher's own, the
+    sending on ``loop``: by default the event loop of the server whose view
+    woke the dispatcher, where its consumers and channel layer connections
+    are.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        poll_interval: float = 1.0,
+        retry_delay: float = 0.5,
+        max_attempts: int = 10,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.loop = loop
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def wake(self) -> None:
+        """Dispatch now, starting the dispatcher's thread if need be."""
+        if self.loop is None or self.loop.is_closed():
+            self.loop = _server_loop()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self.run, name="outbox-dispatcher", daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+    def run(self) -> None:
+        """Dispatch forever, woken by :meth:`wake` or every poll interval."""
+        failures = 0
+        while True:
+            self._wakeup.wait(
+                self.poll_interval
+                if not failures
+                else min(self.retry_delay * 2 ** (failures - 1), 30)
+            )
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                failures = 0 if self.drain() else failures + 1
+            # the thread outlives a failed round (database away, ...), the
+            # events stay in the outbox for the next one
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Error dispatching the outbox: {e}")
+                failures += 1
+
+    def drain(self) -> bool:
+        """Send batches until the outbox is empty, ``False`` on a failure."""
+        while True:
+            sent, failed = self.dispatch()
+            if failed:
+                return False
+            if sent < self.batch_size:
+                return True
+
+    def dispatch(self) -> tuple[int, int]:
+        """Send one batch, returns how many events were sent and failed."""
+        # the batch's rows stay locked until sent, so dispatchers of several
+        # processes take turns. Without row locks (sqlite) the transaction
+        # would only lock out writers.
+        locking = connection.features.has_select_for_update
+        with transaction.atomic() if locking else nullcontext():
+            events = list(
+                OutboxEvent.objects.select_for_update().order_by("id")[
+                    : self.batch_size
+                ]
+            )
+            if not events:
+                return 0, 0
+            sent, failed = self._send_batch(events)
+
+            with transaction.atomic():
+                OutboxEvent.objects.filter(id__in=sent).delete()
+                for event in failed:
+                    event.attempts += 1
+                    if event.attempts >= self.max_attempts:
+                        logger.error(
+                            f"Giving up on outbox event {event.id} ({event}) "
+                            f"after {event.attempts} attempts"
+                        )
+                        event.delete()
+                    else:
+                        event.save(update_fields=["attempts"])
+        return len(sent), len(failed)
+
+    def _send_batch(
+        self, events: list[OutboxEvent]
+    ) -> tuple[list[int], list[OutboxEvent]]:
+        loop = self.loop
+        if loop is None or not loop.is_running():
+            return async_to_sync(self._send)(events)
+        return asyncio.run_coroutine_threadsafe(
+            self._send(events), loop
+        ).result(timeout=SEND_TIMEOUT)
+
+    async def _send(
+        self, events: list[OutboxEvent]
+    ) -> tuple[list[int], list[OutboxEvent]]:
+        # group events all in one sequence
+        by_channel: dict[str, list[OutboxEvent]] = defaultdict(list)
+        for event in events:
+            by_channel["" if event.group else str(event.channel_id)].append(
+                event
+            )
+        sent: list[int] = []
+        failed: list[OutboxEvent] = []
+
+        async def send_channel(channel_events: list[OutboxEvent]):
+            for event in channel_events:
+                try:
+                    if event.group:
+                        await agroup_send(event.group, event.event)
+                    else:
+                        await abroadcast(
+                            event.bunch_id, event.channel_id, event.event
+                        )
+                # whatever the channel layer raised, the event is retried
+                except Exception as e:  # noqa: BLE001
+                    logger.warning(
+                        f"Failed to send outbox event {event.id}: {e}"
+                    )
+                    # the channel's later events wait for this one
+                    failed.append(event)
+                    return
+                sent.append(event.id)
+
+        # channels concurrently, each channel's events in order
+        await asyncio.gather(
+            *(send_channel(channel) for channel in by_channel.values())
+        )
+        return sent, failed
+
+
+async def _running_loop() -> asyncio.AbstractEventLoop:
+    return asyncio.get_running_loop()
+
+
+def _server_loop() -> asyncio.AbstractEventLoop | None:
+    """
+    The event loop of the ASGI server running the calling view, ``None``
+    outside of one: async_to_sync then runs on a loop of its own, closed
+    once it returns.
+    """
+    loop = async_to_sync(_running_loop)()
+    return None if loop.is_closed() else loop
+
+
+@cache
+def get_outbox_dispatcher() -> OutboxDispatcher | None:
+    """
+    The process's dispatcher, or ``None`` if the outbox is dispatched by
+    ``manage.py dispatch_outbox`` instead (``OUTBOX_DISPATCHER=command``).
+    """
+    if settings.OUTBOX_DISPATCHER != "thread":
+        return None
+    return OutboxDispatcher(
+        batch_size=settings.OUTBOX_BATCH_SIZE,
+        poll_interval=settings.OUTBOX_POLL_INTERVAL,
+        retry_delay=settings.OUTBOX_RETRY_DELAY,
+        max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    )
+
+
+@receiver(setting_changed)
+def _reset_outbox_dispatcher(setting: str, **kwargs):
+    if setting.startswith("OUTBOX_"):
+        get_outbox_dispatcher.cache_clear()
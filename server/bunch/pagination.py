@@ -0,0 +1,182 @@
+import uuid
+from collections import OrderedDict
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MessagePagination(BasePagination):
+    """
+    Keyset pagination of messages on ``(created_at, id)``.
+
+    Pages are found by seeking the ``(channel, created_at, id)`` index from
+    an anchor message, so deep pages cost the same as the first one and no
+    ``COUNT(*)`` is run. Anchors are message ids:
+
+    - no anchor: the newest messages
+    - ``before=<id>``: the messages just before ``id``
+    - ``after=<id>``: the messages just after ``id``
+    - ``around=<id>``: ``id`` with the messages on either side of it, e.g.
+      to jump to a replied-to message
+
+    Pages are lists of messages, or of dicts with their ``id`` if the
+    queryset is a ``.values()`` one. Results are always oldest first.
+    ``previous``/``next`` link to the adjacent pages, or are null when there
+    is nothing more that way (``next`` of the newest page is null; poll it
+    with ``after=<last id>``).
+    """
+
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    anchor_query_params = ("before", "after", "around")
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+
+        anchors = [
+            (param, request.query_params[param])
+            for param in self.anchor_query_params
+            if param in request.query_params
+        ]
+        if len(anchors) > 1:
+            raise ValidationError(
+                "Only one of before, after and around can be given."
+            )
+
+        if not anchors:
+            self.page, self.has_previous = self._before(queryset, None, size)
+            self.has_next = False
+            return self.page
+
+        param, anchor_id = anchors[0]
+        key = self._anchor_key(queryset, anchor_id)
+
+        if param == "before":
+            self.page, self.has_previous = self._before(queryset, key, size)
+            self.has_next = True
+        elif param == "after":
+            self.page, self.has_next = self._after(queryset, key, size)
+            self.has_previous = True
+        else:
+            earlier, self.has_previous = self._before(
+                queryset, key, (size - 1) // 2
+            )
+            anchor = list(queryset.filter(pk=key[1]))
+            later, self.has_next = self._after(
+                queryset, key, size - 1 - len(earlier)
+            )
+            self.page = earlier + anchor + later
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {
+                    "type": "string",
+                    "nullable": True,
+                    "format": "uri",
+                },
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next or not self.page:
+            return None
+        return self._link("after", row_id(self.page[-1]))
+
+    def get_previous_link(self) -> str | None:
+        if not self.has_previous or not self.page:
+            return None
+        return self._link("before", row_id(self.page[0]))
+
+    def _link(self, param: str, message_id) -> str:
+        url = self.request.build_absolute_uri()
+        for anchor in self.anchor_query_params:
+            url = remove_query_param(url, anchor)
+        return replace_query_param(url, param, str(message_id))
+
+    def _anchor_key(self, queryset: QuerySet, anchor_id: str):
+        try:
+            anchor_id = uuid.UUID(anchor_id)
+        except ValueError:
+            raise ValidationError("Invalid message id.") from None
+
+        key = (
+            queryset.order_by()
+            .filter(pk=anchor_id)
+            .values_list("created_at", "id")
+            .first()
+        )
+        if key is None:
+            raise NotFound("Message not found.")
+        return key
+
+    def _before(self, queryset: QuerySet, key, size: int):
+        """Up to ``size`` messages before ``key``, and if there are more."""
+        if key is not None:
+            queryset = queryset.filter(before_key(key))
+        if size <= 0:
+            return [], queryset.exists()
+        rows = list(queryset.order_by("-created_at", "-id")[: size + 1])
+        return rows[:size][::-1], len(rows) > size
+
+    def _after(self, queryset: QuerySet, key, size: int):
+        """Up to ``size`` messages after ``key``, and if there are more."""
+        queryset = queryset.filter(after_key(key))
+        if size <= 0:
+            return [], queryset.exists()
+        rows = list(queryset.order_by("created_at", "id")[: size + 1])
+        return rows[:size], len(rows) > size
+
+
+def before_key(key) -> Q:
+    """
+    Messages ordered before ``key = (created_at, id)``.
+
+    Written as a range on ``created_at`` minus the ties at or after ``id``,
+    rather than an OR of the two cases, so the database can seek the index.
+    """
+    created_at, message_id = key
+    return Q(created_at__lte=created_at) & ~Q(
+        created_at=created_at, id__gte=message_id
+    )
+
+
+def after_key(key) -> Q:
+    """Messages ordered after ``key = (created_at, id)``, see before_key."""
+    created_at, message_id = key
+    return Q(created_at__gte=created_at) & ~Q(
+        created_at=created_at, id__lte=message_id
+    )
+
+
+def row_id(row):
+    """The id of a page's message or ``.values()`` row."""
+    return row["id"] if isinstance(row, dict) else row.pk
@@ -135,4 +135,4 @@ class IsMessageAuthor(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        return obj.author == request.user
+        return obj.author.user_id == request.user.id
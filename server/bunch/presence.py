@@ -0,0 +1,388 @@
+import asyncio
+import heapq
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from functools import cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from orchard.redis_clients import LoopRedisClient
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceStore(ABC):
+    """
+    Which users are online, over all server processes.
+
+    Tracks user -> connection id with a heartbeat ttl: a connection that is
+    not refreshed with :meth:`heartbeat` within its ttl is expired by
+    :meth:`sweep`, which a timer runs every ``sweep_interval`` seconds (see
+    :meth:`start_sweeper`). A user is online in every bunch they were a
+    member of when their first connection came up, so per-bunch online
+    counts are kept up to date incrementally and reading them is O(1).
+    """
+
+    def __init__(self, sweep_interval: float = 30.0):
+        self.sweep_interval = sweep_interval
+        self._sweepers: dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+
+    @abstractmethod
+    async def connect(
+        self,
+        user_id: str,
+        connection_id: str,
+        ttl: float,
+        bunch_ids: Iterable[str] = (),
+    ) -> None: ...
+
+    @abstractmethod
+    async def heartbeat(
+        self, user_id: str, connection_id: str, ttl: float
+    ) -> bool:
+        """Extend a connection's ttl, ``False`` if it is not registered."""
+
+    @abstractmethod
+    async def disconnect(self, user_id: str, connection_id: str) -> None: ...
+
+    @abstractmethod
+    async def connections(self, user_id: str) -> dict[str, float]:
+        """Live connections of ``user_id``, connection id -> expiry time."""
+
+    @abstractmethod
+    async def online_count(self, bunch_id: str) -> int: ...
+
+    @abstractmethod
+    async def sweep(self) -> int:
+        """Expire connections past their ttl, returns how many."""
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    def start_sweeper(self) -> None:
+        """Run :meth:`sweep` periodically on the running event loop."""
+        loop = asyncio.get_running_loop()
+        task = self._sweepers.get(loop)
+        if task is not None and not task.done():
+            return
+
+        # drop sweepers of loops that are gone (e.g. async_to_sync calls)
+        self._sweepers = {
+            other: task
+            for other, task in self._sweepers.items()
+            if not other.is_closed()
+        }
+        self._sweepers[loop] = loop.create_task(self._sweep_forever())
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                expired = await self.sweep()
+            # whatever failed (redis away, ...), the next sweep runs
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Presence sweep failed: {e}")
+            else:
+                if expired:
+                    logger.info(f"Expired {expired} stale connections")
+
+
+class MemoryPresenceStore(PresenceStore):
+    """
+    Per-process presence, for a single server process.
+
+    Expiry times are kept in a min-heap. A heartbeat pushes a new entry and
+    leaves the old one behind, so a sweep pops exactly the expired entries
+    (stale ones included) and never looks at live connections.
+    """
+
+    def __init__(self, sweep_interval: float = 30.0):
+        super().__init__(sweep_interval)
+        # user_id -> {connection_id: expires_at}
+        self._connections: dict[str, dict[str, float]] = {}
+        # bunches a user is counted as online in
+        self._user_bunches: dict[str, frozenset[str]] = {}
+        self._online: dict[str, int] = {}
+        self._expiries: list[tuple[float, str, str]] = []
+
+    async def connect(self, user_id, connection_id, ttl, bunch_ids=()):
+        connections = self._connections.get(user_id)
+        if connections is None:
+            connections = self._connections[user_id] = {}
+            bunches = frozenset(str(bunch_id) for bunch_id in bunch_ids)
+            self._user_bunches[user_id] = bunches
+            for bunch_id in bunches:
+                self._online[bunch_id] = self._online.get(bunch_id, 0) + 1
+
+        self._set_expiry(connections, user_id, connection_id, ttl)
+
+    async def heartbeat(self, user_id, connection_id, ttl):
+        connections = self._connections.get(user_id)
+        if not connections or connection_id not in connections:
+            return False
+
+        self._set_expiry(connections, user_id, connection_id, ttl)
+        return True
+
+    async def disconnect(self, user_id, connection_id):
+        self._remove(user_id, connection_id)
+
+    async def connections(self, user_id):
+        now = time.time()
+        return {
+            connection_id: expires_at
+            for connection_id, expires_at in self._connections.get(
+                user_id, {}
+            ).items()
+            if expires_at > now
+        }
+
+    async def online_count(self, bunch_id):
+        return self._online.get(str(bunch_id), 0)
+
+    async def sweep(self):
+        now = time.time()
+        expired = 0
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, user_id, connection_id = heapq.heappop(self._expiries)
+            connections = self._connections.get(user_id)
+            # skip entries superseded by a heartbeat or a disconnect
+            if connections and connections.get(connection_id) == expires_at:
+                self._remove(user_id, connection_id)
+                expired += 1
+        return expired
+
+    async def clear(self):
+        self._connections.clear()
+        self._user_bunches.clear()
+        self._online.clear()
+        self._expiries.clear()
+
+    def _set_expiry(self, connections, user_id, connection_id, ttl):
+        expires_at = time.time() + ttl
+        connections[connection_id] = expires_at
+        heapq.heappush(self._expiries, (expires_at, user_id, connection_id))
+
+    def _remove(self, user_id: str, connection_id: str) -> None:
+        connections = self._connections.get(user_id)
+        if connections is None or connections.pop(connection_id, None) is None:
+            return
+        if connections:
+            return
+
+        # the user's last connection is gone
+        del self._connections[user_id]
+        for bunch_id in self._user_bunches.pop(user_id, ()):
+            count = self._online.get(bunch_id, 0) - 1
+            if count > 0:
+                self._online[bunch_id] = count
+            else:
+                self._online.pop(bunch_id, None)
+
+
+# KEYS: user hash, user bunches set, expiries zset
+# ARGV: user_id, connection_id, expires_at, key prefix, bunch ids...
+CONNECT_SCRIPT = """
+local first = redis.call("EXISTS", KEYS[1]) == 0
+redis.call("HSET", KEYS[1], ARGV[2], ARGV[3])
+redis.call("ZADD", KEYS[3], ARGV[3], ARGV[1] .. "|" .. ARGV[2])
+if first then
+    redis.call("DEL", KEYS[2])
+    for i = 5, #ARGV do
+        redis.call("SADD", KEYS[2], ARGV[i])
+        redis.call("SADD", ARGV[4] .. "online:" .. ARGV[i], ARGV[1])
+    end
+end
+return first and 1 or 0
+"""
+
+# KEYS: user hash, expiries zset
+# ARGV: user_id, connection_id, expires_at
+HEARTBEAT_SCRIPT = """
+if redis.call("HEXISTS", KEYS[1], ARGV[2]) == 0 then
+    return 0
+end
+redis.call("HSET", KEYS[1], ARGV[2], ARGV[3])
+redis.call("ZADD", KEYS[2], ARGV[3], ARGV[1] .. "|" .. ARGV[2])
+return 1
+"""
+
+# removes user_id|connection_id, and the user from their bunches' online
+# sets when it was their last connection
+REMOVE_FUNCTION = """
+local function remove(prefix, expiries, user_id, connection_id)
+    local user_key = prefix .. "user:" .. user_id
+    redis.call("ZREM", expiries, user_id .. "|" .. connection_id)
+    if redis.call("HDEL", user_key, connection_id) == 0 then
+        return 0
+    end
+    if redis.call("HLEN", user_key) == 0 then
+        local bunches_key = prefix .. "bunches:" .. user_id
+        for _, bunch_id in ipairs(redis.call("SMEMBERS", bunches_key)) do
+            redis.call("SREM", prefix .. "online:" .. bunch_id, user_id)
+        end
+        redis.call("DEL", bunches_key)
+    end
+    return 1
+end
+"""
+
+# KEYS: expiries zset
+# ARGV: key prefix, user_id, connection_id
+DISCONNECT_SCRIPT = (
+    REMOVE_FUNCTION
+    + """
+return remove(ARGV[1], KEYS[1], ARGV[2], ARGV[3])
+"""
+)
+
+# KEYS: expiries zset
+# ARGV: key prefix, now, batch size
+SWEEP_SCRIPT = (
+    REMOVE_FUNCTION
+    + """
+local expired = redis.call(
+    "ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[2], "LIMIT", 0, ARGV[3]
+)
+local removed = 0
+for _, member in ipairs(expired) do
+    local sep = string.find(member, "|", 1, true)
+    removed = removed + remove(
+        ARGV[1],
+        KEYS[1],
+        string.sub(member, 1, sep - 1),
+        string.sub(member, sep + 1)
+    )
+end
+return {#expired, removed}
+"""
+)
+
+
+class RedisPresenceStore(PresenceStore):
+    """
+    Presence shared by all server processes through redis.
+
+    Every connection is a member of one sorted set scored by its expiry time,
+    so a sweep (from any process) reads only the expired range. Each user
+    has a hash of their connections, and each bunch a set of online users,
+    whose SCARD is the online count. Every update runs as a lua script, so
+    concurrent processes never see a half-registered user.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "presence:",
+        sweep_interval: float = 30.0,
+        sweep_batch: int = 1000,
+    ):
+        super().__init__(sweep_interval)
+        self.url = url
+        self.prefix = prefix
+        self.sweep_batch = sweep_batch
+        self._client = LoopRedisClient(url)
+
+    @property
+    def client(self):
+        return self._client.get()
+
+    def _script(self, source: str):
+        return self._client.script(source)
+
+    @property
+    def _expiries(self) -> str:
+        return f"{self.prefix}expiries"
+
+    def _user_key(self, user_id: str) -> str:
+        return f"{self.prefix}user:{user_id}"
+
+    async def connect(self, user_id, connection_id, ttl, bunch_ids=()):
+        await self._script(CONNECT_SCRIPT)(
+            keys=[
+                self._user_key(user_id),
+                f"{self.prefix}bunches:{user_id}",
+                self._expiries,
+            ],
+            args=[
+                user_id,
+                connection_id,
+                time.time() + ttl,
+                self.prefix,
+                *(str(bunch_id) for bunch_id in bunch_ids),
+            ],
+        )
+
+    async def heartbeat(self, user_id, connection_id, ttl):
+        refreshed = await self._script(HEARTBEAT_SCRIPT)(
+            keys=[self._user_key(user_id), self._expiries],
+            args=[user_id, connection_id, time.time() + ttl],
+        )
+        return bool(refreshed)
+
+    async def disconnect(self, user_id, connection_id):
+        await self._script(DISCONNECT_SCRIPT)(
+            keys=[self._expiries],
+            args=[self.prefix, user_id, connection_id],
+        )
+
+    async def connections(self, user_id):
+        now = time.time()
+        entries = await self.client.hgetall(self._user_key(user_id))
+        connections = {
+            connection_id.decode(): float(expires_at)
+            for connection_id, expires_at in entries.items()
+        }
+        return {
+            connection_id: expires_at
+            for connection_id, expires_at in connections.items()
+            if expires_at > now
+        }
+
+    async def online_count(self, bunch_id):
+        return await self.client.scard(f"{self.prefix}online:{bunch_id}")
+
+    async def sweep(self):
+        expired = 0
+        while True:
+            found, removed = await self._script(SWEEP_SCRIPT)(
+                keys=[self._expiries],
+                args=[self.prefix, time.time(), self.sweep_batch],
+            )
+            expired += removed
+            if found < self.sweep_batch:
+                return expired
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(f"{self.prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+@cache
+def get_presence_store() -> PresenceStore:
+    """
+    The process-wide store named by ``PRESENCE_STORE``: ``"memory"``,
+    ``"redis"`` or the dotted path of a :class:`PresenceStore` subclass.
+    """
+    if settings.PRESENCE_STORE == "memory":
+        return MemoryPresenceStore(
+            sweep_interval=settings.PRESENCE_SWEEP_INTERVAL
+        )
+    if settings.PRESENCE_STORE == "redis":
+        return RedisPresenceStore(
+            url=settings.PRESENCE_REDIS_URL,
+            sweep_interval=settings.PRESENCE_SWEEP_INTERVAL,
+        )
+    return import_string(settings.PRESENCE_STORE)()
+
+
+@receiver(setting_changed)
+def _reset_presence_store(setting: str, **kwargs):
+    if setting.startswith("PRESENCE_"):
+        get_presence_store.cache_clear()
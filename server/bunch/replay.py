@@ -0,0 +1,128 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from functools import cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from orchard.redis_clients import LoopRedisClient
+
+
+class ReplayBuffer(ABC):
+    """
+    The last ``size`` broadcast frames of each channel, by sequence number,
+    so a reconnecting client can be sent what it missed.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    @abstractmethod
+    async def append(self, channel_id: str, seq: int, frame: str) -> None: ...
+
+    @abstractmethod
+    async def since(self, channel_id: str, seq: int) -> list[str] | None:
+        """
+        Frames after ``seq``, in order, or ``None`` if the buffer does not go
+        back that far.
+        """
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+
+class MemoryReplayBuffer(ReplayBuffer):
+    """Per-process buffer, for at most ``max_channels`` channels (LRU)."""
+
+    def __init__(self, size: int = 256, max_channels: int = 10_000):
+        super().__init__(size)
+        self.max_channels = max_channels
+        self._channels: OrderedDict[str, deque[tuple[int, str]]] = OrderedDict()
+
+    async def append(self, channel_id, seq, frame):
+        frames = self._channels.get(channel_id)
+        if frames is None:
+            frames = self._channels[channel_id] = deque(maxlen=self.size)
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(channel_id)
+        frames.append((seq, frame))
+
+    async def since(self, channel_id, seq):
+        frames = self._channels.get(channel_id)
+        if not frames or min(s for s, _ in frames) > seq + 1:
+            return None
+        # broadcasts may be appended slightly out of order
+        return [frame for s, frame in sorted(frames) if s > seq]
+
+    async def clear(self):
+        self._channels.clear()
+
+
+class RedisReplayBuffer(ReplayBuffer):
+    """
+    Buffer shared by all server processes: a sorted set of frames scored by
+    sequence number per channel, trimmed to ``size`` and dropped after
+    ``ttl`` seconds without broadcasts.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        size: int = 256,
+        prefix: str = "replay:",
+        ttl: int = 86400,
+    ):
+        super().__init__(size)
+        self.prefix = prefix
+        self.ttl = ttl
+        self._client = LoopRedisClient(url)
+
+    async def append(self, channel_id, seq, frame):
+        key = f"{self.prefix}{channel_id}"
+        async with self._client.get().pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {frame: seq})
+            pipe.zremrangebyrank(key, 0, -self.size - 1)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def since(self, channel_id, seq):
+        key = f"{self.prefix}{channel_id}"
+        async with self._client.get().pipeline(transaction=True) as pipe:
+            pipe.zrange(key, 0, 0, withscores=True)
+            pipe.zrangebyscore(key, f"({seq}", "+inf")
+            oldest, frames = await pipe.execute()
+
+        if not oldest or oldest[0][1] > seq + 1:
+            return None
+        return [frame.decode() for frame in frames]
+
+    async def clear(self):
+        client = self._client.get()
+        keys = [key async for key in client.scan_iter(f"{self.prefix}*")]
+        if keys:
+            await client.delete(*keys)
+
+
+@cache
+def get_replay_buffer() -> ReplayBuffer:
+    """
+    The process-wide buffer named by ``REPLAY_BUFFER``: ``"memory"``,
+    ``"redis"`` or the dotted path of a :class:`ReplayBuffer` subclass.
+    """
+    if settings.REPLAY_BUFFER == "memory":
+        return MemoryReplayBuffer(size=settings.REPLAY_BUFFER_SIZE)
+    if settings.REPLAY_BUFFER == "redis":
+        return RedisReplayBuffer(
+            url=settings.REPLAY_REDIS_URL, size=settings.REPLAY_BUFFER_SIZE
+        )
+    return import_string(settings.REPLAY_BUFFER)()
+
+
+@receiver(setting_changed)
+def _reset_replay_buffer(setting: str, **kwargs):
+    if setting.startswith("REPLAY_"):
+        get_replay_buffer.cache_clear()
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from typing import Any, NamedTuple
+from weakref import WeakSet
+
+logger = logging.getLogger(__name__)
+
+# frame kinds a connection that falls behind can do without: transient state
+# superseded by the next such frame. Chat messages and reactions are never
+# dropped, a client missing one would have to resync.
+DROPPABLE_KINDS = frozenset({"presence", "typing"})
+
+# overflow policies, see SendQueue
+DISCONNECT = "disconnect"
+BLOCK = "block"
+
+# live queues and lifetime counters of the process, see metrics()
+_queues: "WeakSet[SendQueue]" = WeakSet()
+_counters: Counter[str] = Counter()
+
+
+class Frame(NamedTuple):
+    data: str | bytes
+    kind: str | None = None
+    channel_id: str | None = None
+    seq: int | None = None
+
+
+class SendQueue:
+    """
+    Bounded queue of the frames to one websocket, written out by a task of
+    its own.
+
+    Frames queue up here while a slow client holds up ``send``, so the
+    connection's channel layer handlers return right away instead of the
+    layer's queue filling up and silently dropping events. Once
+    ``max_frames`` are waiting, frames of :data:`DROPPABLE_KINDS` are dropped,
+    oldest first. With only frames that must be delivered left, the queue
+    overflows: under the ``"disconnect"`` policy the pending frames are
+    discarded and ``on_overflow`` is called with :attr:`delivered`, to tell
+    the client where to resume; under ``"block"`` :meth:`put` waits for room,
+    pushing back on the channel layer.
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[None]],
+        max_frames: int = 256,
+        policy: str = DISCONNECT,
+        on_overflow: Callable[[dict[str, int]], Awaitable[None]] | None = None,
+    ):
+        if policy not in (DISCONNECT, BLOCK):
+            raise ValueError(f"Unknown send queue policy {policy!r}")
+        self._send = send
+        self.max_frames = max_frames
+        self.policy = policy
+        self._on_overflow = on_overflow
+        self._frames: deque[Frame] = deque()
+        self._ready = asyncio.Event()
+        self._room = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        # channel_id -> seq of the last sequenced frame written to the socket
+        self.delivered: dict[str, int] = {}
+        self.dropped = 0
+        self.overflowed = False
+        self.stopped = False
+        _queues.add(self)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    async def put(
+        self,
+        data: str | bytes,
+        kind: str | None = None,
+        channel_id: str | None = None,
+        seq: int | None = None,
+    ) -> bool:
+        """Queue a frame, ``False`` if it was dropped or the queue stopped."""
+        frame = Frame(data, kind, channel_id, seq)
+        while not self.stopped and len(self._frames) >= self.max_frames:
+            if frame.kind in DROPPABLE_KINDS:
+                self._dropped()
+                return False
+            if self._drop_oldest():
+                break
+            if self.policy == BLOCK:
+                self._room.clear()
+                await self._room.wait()
+                continue
+            await self._overflow()
+
+        if self.stopped:
+            return False
+
+        self._frames.append(frame)
+        self._ready.set()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+        return True
+
+    async def stop(self) -> None:
+        """Stop writing, discarding anything still queued."""
+        self.stopped = True
+        self._frames.clear()
+        self._room.set()  # release blocked put()s
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        _queues.discard(self)
+
+    async def _write(self) -> None:
+        while True:
+            while not self._frames:
+                self._ready.clear()
+                await self._ready.wait()
+            frame = self._frames.popleft()
+            self._room.set()
+            try:
+                await self._send(frame.data)
+            # a frame the socket wouldn't take mustn't stop the writer
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Error writing to websocket: {e}")
+                continue
+            if frame.seq is not None and frame.channel_id is not None:
+                self.delivered[frame.channel_id] = frame.seq
+
+    def _drop_oldest(self) -> bool:
+        """Drop the oldest droppable frame, ``False`` if there is none."""
+        for i, queued in enumerate(self._frames):
+            if queued.kind in DROPPABLE_KINDS:
+                del self._frames[i]
+                self._dropped()
+                return True
+        return False
+
+    def _dropped(self) -> None:
+        self.dropped += 1
+        _counters["dropped"] += 1
+
+    async def _overflow(self) -> None:
+        self.overflowed = True
+        _counters["overflows"] += 1
+        logger.warning(
+            f"Send queue overflowed with {len(self._frames)} frames waiting"
+        )
+        await self.stop()
+        if self._on_overflow is not None:
+            await self._on_overflow(dict(self.delivered))
+
+
+def metrics() -> dict[str, Any]:
+    """Send queue depths of this process's connections, and drop counts."""
+    depths = [len(queue) for queue in list(_queues)]
+    return {
+        "connections": len(depths),
+        "queued": sum(depths),
+        "max_queued": max(depths, default=0),
+        "dropped": _counters["dropped"],
+        "overflows": _counters["overflows"],
+    }
@@ -3,7 +3,15 @@ from typing import override
 from django.urls import reverse
 from rest_framework import serializers
 
-from bunch.models import Bunch, Channel, Member, Message, Reaction
+from bunch.models import (
+    Bunch,
+    Channel,
+    Member,
+    Message,
+    Reaction,
+    ReactionCount,
+)
+from bunch.projections import reply_preview
 from users.serializers import UserSerializer
 
 
@@ -125,7 +133,7 @@ class MemberSerializer(serializers.ModelSerializer):
 class ReactionSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField()
     user = UserSerializer(read_only=True)
-    message_id = serializers.UUIDField(source="message.id", read_only=True)
+    message_id = serializers.UUIDField(read_only=True)
 
     class Meta:
         model = Reaction
@@ -152,7 +160,7 @@ class ReactionSerializer(serializers.ModelSerializer):
             reverse(
                 "bunch:bunch-reaction-detail",
                 kwargs={
-                    "bunch_id": obj.message.channel.bunch.id,
+                    "bunch_id": obj.message.channel.bunch_id,
                     "id": obj.id,
                 },
             )
@@ -188,13 +196,11 @@ class ReactionSerializer(serializers.ModelSerializer):
 
 class MessageSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField()
-    channel_id = serializers.UUIDField(source="channel.id", read_only=True)
-    author_id = serializers.UUIDField(source="author.id", read_only=True)
+    channel_id = serializers.UUIDField(read_only=True)
+    author_id = serializers.UUIDField(read_only=True)
     reactions = ReactionSerializer(many=True, read_only=True)
     reaction_counts = serializers.SerializerMethodField()
-    reply_to_id = serializers.UUIDField(
-        source="reply_to.id", read_only=True, allow_null=True
-    )
+    reply_to_id = serializers.UUIDField(read_only=True, allow_null=True)
     reply_count = serializers.IntegerField(read_only=True)
 
     # Nested serializer for the replied-to message preview
@@ -205,6 +211,7 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = [
             "url",
             "id",
+            "seq",
             "content",
             "channel_id",
             "author_id",
@@ -221,6 +228,7 @@ class MessageSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             "id",
+            "seq",
             "channel_id",
             "author_id",
             "reply_to_id",
@@ -236,32 +244,26 @@ class MessageSerializer(serializers.ModelSerializer):
         ]
 
     def get_reaction_counts(self, obj: Message) -> dict:
-        """Get aggregated reaction counts by emoji."""
-        from django.db.models import Count
-
-        reaction_counts = (
-            obj.reactions.values("emoji")
-            .annotate(count=Count("emoji"))
-            .order_by("-count")
-        )
-        return {item["emoji"]: item["count"] for item in reaction_counts}
+        """Get reaction counts by emoji, most used first."""
+        if "reaction_totals" in getattr(obj, "_prefetched_objects_cache", {}):
+            totals = obj.reaction_totals.all()
+        else:
+            totals = ReactionCount.objects.for_messages([obj.id])
+        return {total.emoji: total.count for total in totals}
 
     def get_reply_to_preview(self, obj: Message) -> dict | None:
         """Get a preview of the message being replied to."""
-        if not obj.reply_to:
+        reply_to = obj.reply_to
+        if not reply_to:
             return None
 
-        return {
-            "id": str(obj.reply_to.id),
-            "content": obj.reply_to.content[:100] + "..."
-            if len(obj.reply_to.content) > 100
-            else obj.reply_to.content,
-            "author": {
-                "id": str(obj.reply_to.author.id),
-                "username": obj.reply_to.author.user.username,
-            },
-            "created_at": obj.reply_to.created_at,
-        }
+        return reply_preview(
+            reply_to.id,
+            reply_to.content,
+            reply_to.created_at,
+            reply_to.author_id,
+            reply_to.author.user.username,
+        )
 
     def get_url(self, obj: Message) -> str | None:
         request = self.context.get("request")
@@ -271,7 +273,7 @@ class MessageSerializer(serializers.ModelSerializer):
             reverse(
                 "bunch:bunch-message-detail",
                 kwargs={
-                    "bunch_id": obj.channel.bunch.id,
+                    "bunch_id": obj.channel.bunch_id,
                     "id": obj.id,
                 },
             )
@@ -1,7 +1,16 @@
-from django.db.models.signals import post_save
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from bunch.models import Bunch, Member, RoleChoices
+from bunch.models import (
+    Bunch,
+    Channel,
+    Member,
+    Message,
+    Reaction,
+    ReactionCount,
+    RoleChoices,
+)
 
 
 @receiver(post_save, sender=Bunch)
@@ -27,3 +36,14 @@ def create_owner_member(sender, instance: Bunch, created, **kwargs):
             user=owner_user,
             role=RoleChoices.OWNER,
         )
+
+
+@receiver(post_delete, sender=Reaction)
+def uncount_reaction(sender, instance: Reaction, origin=None, **kwargs):
+    # deleting the message (or its channel or bunch) deletes its counts too
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model in (Message, Channel, Bunch):
+        return
+
+    # post_delete runs in the deletion's transaction
+    ReactionCount.objects.change(instance.message_id, instance.emoji, -1)
@@ -0,0 +1,118 @@
+import asyncio
+import uuid
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from bunch import batching
+from bunch.batching import MessageBatcher, save_messages
+from bunch.models import Bunch, Channel, Message
+from users.models import User
+
+
+class MessageBatcherTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="user_id", email="user@example.com", password=None
+        )
+        self.bunch = Bunch.objects.create(name="Test Bunch", owner=self.user)
+        self.member = self.bunch.members.get(user=self.user)
+        self.member.user = self.user
+        self.general = Channel.objects.create(bunch=self.bunch, name="general")
+        self.random = Channel.objects.create(bunch=self.bunch, name="random")
+
+    def message(self, channel, content):
+        return Message(content=content, author=self.member, channel=channel)
+
+    def test_save_messages(self):
+        Message.objects.create(
+            content="before", author=self.member, channel=self.general
+        )
+        messages = [
+            self.message(self.general, "one"),
+            self.message(self.random, "two"),
+            self.message(self.general, "three"),
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            save_messages(messages)
+
+        # a seq range per channel, one INSERT (and sqlite's BEGIN/COMMIT)
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in queries
+                if query["sql"] not in ("BEGIN", "COMMIT")
+            ],
+            ["UPDATE", "UPDATE", "INSERT"],
+        )
+
+        self.assertEqual([message.seq for message in messages], [2, 1, 3])
+        self.assertEqual(
+            list(
+                Message.objects.filter(channel=self.general)
+                .order_by("seq")
+                .values_list("content", flat=True)
+            ),
+            ["before", "one", "three"],
+        )
+        self.general.refresh_from_db()
+        self.assertEqual(self.general.last_seq, 3)
+
+    async def test_gathers_a_batch(self):
+        batcher = MessageBatcher(max_size=10, max_delay=0.01)
+
+        with patch.object(
+            batching, "save_messages", side_effect=save_messages
+        ) as save:
+            payloads = await asyncio.gather(
+                *(
+                    batcher.save(self.member, self.general.id, f"message {i}")
+                    for i in range(5)
+                )
+            )
+
+        save.assert_called_once()
+        self.assertEqual(
+            [(payload["seq"], payload["content"]) for payload in payloads],
+            [(i + 1, f"message {i}") for i in range(5)],
+        )
+        self.assertEqual(await Message.objects.acount(), 5)
+
+    async def test_flushes_when_full(self):
+        batcher = MessageBatcher(max_size=2, max_delay=60)
+
+        with patch.object(
+            batching, "save_messages", side_effect=save_messages
+        ) as save:
+            payloads = await asyncio.wait_for(
+                asyncio.gather(
+                    *(
+                        batcher.save(self.member, self.general.id, "hi")
+                        for _ in range(4)
+                    )
+                ),
+                timeout=5,
+            )
+
+        self.assertEqual(save.call_count, 2)
+        self.assertEqual([payload["seq"] for payload in payloads], [1, 2, 3, 4])
+
+    async def test_failed_message_fails_alone(self):
+        batcher = MessageBatcher(max_size=10, max_delay=0.01)
+
+        results = await asyncio.gather(
+            batcher.save(self.member, self.general.id, "kept"),
+            batcher.save(self.member, uuid.uuid4(), "no such channel"),
+            return_exceptions=True,
+        )
+
+        self.assertEqual(results[0]["content"], "kept")
+        self.assertEqual(results[0]["seq"], 1)
+        self.assertIsInstance(results[1], Channel.DoesNotExist)
+        self.assertEqual(
+            [message.content async for message in Message.objects.all()],
+            ["kept"],
+        )
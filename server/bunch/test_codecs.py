@@ -0,0 +1,94 @@
+import json
+
+import cbor2
+import msgpack
+from django.test import SimpleTestCase
+
+from bunch.codecs import (
+    compact,
+    decode,
+    encode,
+    expand,
+    negotiate,
+    transcode,
+)
+from bunch.constants import COMPACT_KEYS, WSProtocol
+
+FRAME = {
+    "type": "chat.message",
+    "seq": 7,
+    "message": {
+        "id": "m1",
+        "author": {
+            "user": {"id": "u1", "username": "someone"},
+            "joined_at": "2025-01-01T12:00:00+00:00",
+        },
+        "content": "hello",
+        "created_at": "2025-01-01T12:00:01.500000+00:00",
+        "deleted_at": None,
+        "reactions": [{"emoji": "👍"}],
+    },
+}
+
+
+class CodecTest(SimpleTestCase):
+    def test_compact_keys_are_unambiguous(self):
+        shorts = list(COMPACT_KEYS.values())
+        self.assertEqual(len(shorts), len(set(shorts)))
+        self.assertFalse(set(shorts) & set(COMPACT_KEYS))
+
+    def test_compact(self):
+        self.assertEqual(
+            compact(FRAME),
+            {
+                "t": "chat.message",
+                "s": 7,
+                "m": {
+                    "i": "m1",
+                    "a": {
+                        "u": {"i": "u1", "n": "someone"},
+                        "ja": 1735732800000,
+                    },
+                    "co": "hello",
+                    "ca": 1735732801500,
+                    "da": None,
+                    "reactions": [{"e": "👍"}],
+                },
+            },
+        )
+
+    def test_round_trip(self):
+        for protocol, loads in (
+            (WSProtocol.MSGPACK, msgpack.unpackb),
+            (WSProtocol.CBOR, cbor2.loads),
+        ):
+            with self.subTest(protocol):
+                data = encode(FRAME, protocol)
+                self.assertEqual(loads(data), compact(FRAME))
+                self.assertEqual(transcode(json.dumps(FRAME), protocol), data)
+                # client frames come back with their full field names
+                request = {"type": "message.new", "content": "hi"}
+                self.assertEqual(
+                    decode(encode(request, protocol), protocol), request
+                )
+
+        self.assertEqual(expand(compact({"type": "ping"})), {"type": "ping"})
+        self.assertEqual(json.loads(encode(FRAME, WSProtocol.JSON)), FRAME)
+
+    def test_negotiate(self):
+        def scope(query=b"", subprotocols=()):
+            return {"query_string": query, "subprotocols": list(subprotocols)}
+
+        self.assertEqual(negotiate(scope()), (WSProtocol.JSON, None))
+        self.assertEqual(
+            negotiate(scope(b"token=x&protocol=msgpack")),
+            (WSProtocol.MSGPACK, None),
+        )
+        self.assertEqual(
+            negotiate(scope(subprotocols=["other", "bunch.cbor"])),
+            (WSProtocol.CBOR, "bunch.cbor"),
+        )
+        self.assertEqual(
+            negotiate(scope(b"protocol=xml", ["bunch.xml"])),
+            (WSProtocol.JSON, None),
+        )
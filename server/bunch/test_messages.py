@@ -1,11 +1,24 @@
+import json
 import logging
 from typing import override
 
+from django.contrib.auth.models import Group
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient, APITestCase
 
-from bunch.models import Bunch, Channel, Member, Message, RoleChoices
+from bunch.models import (
+    Bunch,
+    Channel,
+    Member,
+    Message,
+    Reaction,
+    RoleChoices,
+)
+from bunch.serializers import MessageSerializer
 from bunch.test_common import OTHER_TOKEN, ROOT_TOKEN, USER_TOKEN, get_mocks
+from bunch.views import MessageViewSet
 from users.models import User
 
 logger = logging.getLogger(__name__)
@@ -713,3 +726,167 @@ class MessagesTest(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def create_channel_messages(self, count):
+        """``count`` messages in general, oldest first, half sharing a time"""
+        messages = [
+            Message.objects.create(
+                content=f"Message {i}",
+                channel=self.channel_general_1,
+                author=self.member_member_1,
+            )
+            for i in range(count)
+        ]
+        # ties on created_at are ordered by id
+        tied = messages[: count // 2]
+        Message.objects.filter(id__in=[m.id for m in tied]).update(
+            created_at=tied[0].created_at
+        )
+        return [str(m.id) for m in sorted(tied, key=lambda m: m.id)] + [
+            str(m.id) for m in messages[count // 2 :]
+        ]
+
+    def list_page(self, **params):
+        response = self.client.get(
+            self.messages_list_url_1,
+            {"channel": str(self.channel_general_1.id), **params},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [m["id"] for m in response.data["results"]], response.data
+
+    def test_list_messages_keyset_pagination(self):
+        """Test paging back and forth through a channel by anchor"""
+        ids = self.create_channel_messages(10)
+        self.authenticate_user(self.other_token)
+
+        page, data = self.list_page(page_size=4)
+        self.assertEqual(page, ids[6:], "Should start at the newest messages")
+        self.assertNotIn("count", data)
+        self.assertIsNone(data["next"])
+
+        page, data = self.list_page(page_size=4, before=ids[6])
+        self.assertEqual(page, ids[2:6])
+        self.assertIn(f"after={ids[5]}", data["next"])
+
+        page, data = self.list_page(page_size=4, before=ids[2])
+        self.assertEqual(page, ids[:2])
+        self.assertIsNone(data["previous"])
+
+        page, data = self.list_page(page_size=4, after=ids[1])
+        self.assertEqual(page, ids[2:6])
+        self.assertIn(f"before={ids[2]}", data["previous"])
+        self.assertNotIn("after", data["previous"])
+
+        page, data = self.list_page(page_size=4, after=ids[5])
+        self.assertEqual(page, ids[6:])
+        self.assertIsNone(data["next"])
+
+    def test_list_messages_around(self):
+        """Test jumping to a message with its neighbours"""
+        ids = self.create_channel_messages(10)
+        self.authenticate_user(self.other_token)
+
+        page, data = self.list_page(page_size=5, around=ids[4])
+        self.assertEqual(page, ids[2:7])
+        self.assertIn(f"before={ids[2]}", data["previous"])
+        self.assertIn(f"after={ids[6]}", data["next"])
+
+        page, data = self.list_page(page_size=5, around=ids[0])
+        self.assertEqual(page, ids[:5])
+        self.assertIsNone(data["previous"])
+
+    def test_list_messages_invalid_anchor(self):
+        """Test anchors must be messages of the bunch"""
+        self.authenticate_user(self.user_token)
+        other_bunch_message = Message.objects.create(
+            content="Elsewhere",
+            channel=self.channel_general_2,
+            author=self.owner_member_2,
+        )
+
+        response = self.client.get(
+            self.messages_list_url_1, {"before": "not-a-uuid"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(
+            self.messages_list_url_1, {"around": str(other_bunch_message.id)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(
+            self.messages_list_url_1,
+            {"before": str(other_bunch_message.id), "after": "x"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def serialized(self, response, messages):
+        """``messages`` as MessageSerializer renders them for ``response``"""
+        queryset = (
+            MessageViewSet()
+            .with_related(
+                Message.objects.filter(id__in=[m["id"] for m in messages])
+            )
+            .order_by("created_at", "id")
+        )
+        data = MessageSerializer(
+            queryset, many=True, context={"request": response.wsgi_request}
+        ).data
+        return json.loads(JSONRenderer().render(data))
+
+    def test_list_matches_serializer(self):
+        """Test lists render the same JSON as MessageSerializer"""
+        group = Group.objects.create(name="testers")
+        self.other_user.groups.add(group)
+        User.objects.filter(id=self.user.id).update(
+            avatar="avatars/user.png", bio="Hi"
+        )
+        original = Message.objects.create(
+            content="x" * 150,
+            channel=self.channel_general_1,
+            author=self.owner_member_1,
+        )
+        for i, author in enumerate(
+            (self.member_member_1, self.admin_member_1, self.member_member_1)
+        ):
+            Message.objects.create(
+                content=f"Reply {i}",
+                channel=self.channel_general_1,
+                author=author,
+                reply_to=original,
+                deleted=i == 2,
+                deleted_at=timezone.now() if i == 2 else None,
+            )
+        Message.objects.filter(id=original.id).update(
+            edit_count=1, updated_at=timezone.now()
+        )
+        for user, emoji in (
+            (self.user, "👍"),
+            (self.other_user, "👍"),
+            (self.other_user, "🎉"),
+        ):
+            Reaction.objects.create(message=original, user=user, emoji=emoji)
+        self.authenticate_user(self.other_token)
+
+        response = self.client.get(
+            self.messages_list_url_1,
+            {"channel": str(self.channel_general_1.id)},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results, self.serialized(response, results))
+        self.assertEqual(results[0]["reply_count"], 3)
+        self.assertEqual(results[0]["reaction_counts"], {"👍": 2, "🎉": 1})
+        self.assertEqual(
+            results[0]["reactions"][1]["user"]["groups"], [group.id]
+        )
+
+        self.authenticate_user(self.user_token)
+        response = self.client.get(
+            f"{self.messages_list_url_1}{original.id}/replies/"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results, self.serialized(response, results))
@@ -581,3 +581,32 @@ class MessageModelTest(TestCase):
             0,
             "Messages should be deleted when bunch is deleted",
         )
+
+    def test_message_seq(self):
+        """Test messages are numbered per channel in order"""
+        messages = [
+            Message.objects.create(
+                channel=channel,
+                author=self.member,
+                content=f"Message {i}",
+            )
+            for i in range(3)
+            for channel in (self.channel_general, self.channel_other)
+        ]
+
+        self.assertEqual(
+            [message.seq for message in messages],
+            [1, 1, 2, 2, 3, 3],
+            "Messages should be numbered per channel",
+        )
+        self.channel_general.refresh_from_db()
+        self.assertEqual(
+            self.channel_general.last_seq,
+            3,
+            "Channel last_seq should be the last message's seq",
+        )
+        self.assertEqual(
+            Channel.allocate_seq(self.channel_general.id),
+            4,
+            "Channel should hand out the next seq",
+        )
@@ -0,0 +1,142 @@
+import uuid
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from bunch.models import OutboxEvent
+from bunch.outbox import OutboxDispatcher, enqueue, enqueue_group
+
+
+class FlakyChannelLayer:
+    """Records what is broadcast, failing the events in ``failing``."""
+
+    def __init__(self, failing=()):
+        self.sent: list[tuple[str, int]] = []
+        self.failing = set(failing)
+
+    async def abroadcast(self, bunch_id, channel_id, event):
+        if event["seq"] in self.failing:
+            raise ConnectionError("channel layer unavailable")
+        self.sent.append((str(channel_id), event["seq"]))
+
+    async def agroup_send(self, group, event):
+        if event["seq"] in self.failing:
+            raise ConnectionError("channel layer unavailable")
+        self.sent.append((group, event["seq"]))
+
+
+@override_settings(OUTBOX_DISPATCHER="command")
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.bunch_id = uuid.uuid4()
+        self.channels = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    def enqueue(self, channel_id, seq):
+        enqueue(self.bunch_id, channel_id, {"type": "chat.message", "seq": seq})
+
+    def test_written_with_the_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.enqueue(self.channels[0], 1)
+            raise RuntimeError("rolled back")
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        with transaction.atomic():
+            self.enqueue(self.channels[0], 1)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    @override_settings(OUTBOX_DISPATCHER="thread")
+    def test_woken_on_commit(self):
+        with (
+            patch.object(OutboxDispatcher, "wake") as wake,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self.enqueue(self.channels[0], 1)
+            wake.assert_not_called()
+        wake.assert_called_once()
+
+    def test_sends_in_order_per_channel(self):
+        for seq in range(1, 7):
+            self.enqueue(self.channels[seq % 2], seq)
+        layer = FlakyChannelLayer()
+
+        with patch("bunch.outbox.abroadcast", layer.abroadcast):
+            self.assertTrue(OutboxDispatcher(batch_size=4).drain())
+
+        for channel_id in self.channels:
+            seqs = [seq for channel, seq in layer.sent if channel == channel_id]
+            self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(len(layer.sent), 6)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_retries_failed_channel(self):
+        for seq in range(1, 7):
+            self.enqueue(self.channels[seq % 2], seq)
+        dispatcher = OutboxDispatcher(max_attempts=2)
+        layer = FlakyChannelLayer(failing={3})
+
+        with patch("bunch.outbox.abroadcast", layer.abroadcast):
+            self.assertFalse(dispatcher.drain())
+            # the other channel went out, this one is held back from 3 on
+            self.assertEqual(sorted(seq for _, seq in layer.sent), [1, 2, 4, 6])
+            self.assertEqual(
+                list(
+                    OutboxEvent.objects.order_by("id").values_list(
+                        "event__seq", "attempts"
+                    )
+                ),
+                [(3, 1), (5, 0)],
+            )
+
+            layer.failing.clear()
+            self.assertTrue(dispatcher.drain())
+        self.assertEqual([seq for _, seq in layer.sent][-2:], [3, 5])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_group_events_in_order(self):
+        enqueue_group(self.bunch_id, "user_1", {"type": "m", "seq": 1})
+        self.enqueue(self.channels[0], 2)
+        enqueue_group(self.bunch_id, "bunch_1", {"type": "b", "seq": 3})
+        enqueue_group(self.bunch_id, "bunch_1", {"type": "b", "seq": 4})
+        dispatcher = OutboxDispatcher()
+        layer = FlakyChannelLayer(failing={1})
+
+        with (
+            patch("bunch.outbox.abroadcast", layer.abroadcast),
+            patch("bunch.outbox.agroup_send", layer.agroup_send),
+        ):
+            # the bunch's events wait for the user's
+            self.assertFalse(dispatcher.drain())
+            self.assertEqual(layer.sent, [(self.channels[0], 2)])
+
+            layer.failing.clear()
+            self.assertTrue(dispatcher.drain())
+        self.assertEqual(
+            layer.sent[1:], [("user_1", 1), ("bunch_1", 3), ("bunch_1", 4)]
+        )
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_gives_up(self):
+        self.enqueue(self.channels[0], 1)
+        self.enqueue(self.channels[0], 2)
+        dispatcher = OutboxDispatcher(max_attempts=2)
+        layer = FlakyChannelLayer(failing={1})
+
+        with (
+            patch("bunch.outbox.abroadcast", layer.abroadcast),
+            self.assertLogs("bunch.outbox", "ERROR"),
+        ):
+            self.assertFalse(dispatcher.drain())
+            self.assertFalse(dispatcher.drain())
+            self.assertTrue(dispatcher.drain())
+        self.assertEqual(layer.sent, [(self.channels[0], 2)])
+
+    def test_command(self):
+        self.enqueue(self.channels[0], 1)
+        layer = FlakyChannelLayer()
+
+        with patch("bunch.outbox.abroadcast", layer.abroadcast):
+            call_command("dispatch_outbox", "--once", stdout=StringIO())
+        self.assertEqual(layer.sent, [(self.channels[0], 1)])
@@ -0,0 +1,197 @@
+import importlib.util
+import logging
+import unittest
+import uuid
+from typing import override
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from bunch.models import Bunch
+from bunch.presence import (
+    MemoryPresenceStore,
+    PresenceStore,
+    RedisPresenceStore,
+    get_presence_store,
+)
+from bunch.test_common import OTHER_TOKEN, ROOT_TOKEN, USER_TOKEN, get_mocks
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceStoreTests:
+    """Behaviour shared by every presence store."""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+        self.now = 1_000_000.0
+        self.clock = patch("bunch.presence.time.time", lambda: self.now)
+        self.clock.start()
+        self.addCleanup(self.clock.stop)
+
+    async def test_connections(self):
+        await self.store.connect("u1", "c1", 120, ["b1"])
+        await self.store.connect("u1", "c2", 600, ["b1"])
+
+        self.assertEqual(
+            await self.store.connections("u1"),
+            {"c1": self.now + 120, "c2": self.now + 600},
+        )
+        self.assertEqual(await self.store.connections("u2"), {})
+
+    async def test_online_counts_users_once(self):
+        await self.store.connect("u1", "c1", 120, ["b1", "b2"])
+        await self.store.connect("u1", "c2", 120, ["b1", "b2"])
+        await self.store.connect("u2", "c3", 120, ["b1"])
+
+        self.assertEqual(await self.store.online_count("b1"), 2)
+        self.assertEqual(await self.store.online_count("b2"), 1)
+        self.assertEqual(await self.store.online_count("b3"), 0)
+
+        await self.store.disconnect("u1", "c1")
+        self.assertEqual(await self.store.online_count("b2"), 1)
+
+        await self.store.disconnect("u1", "c2")
+        self.assertEqual(await self.store.online_count("b1"), 1)
+        self.assertEqual(await self.store.online_count("b2"), 0)
+
+        # disconnecting twice is harmless
+        await self.store.disconnect("u1", "c2")
+        self.assertEqual(await self.store.online_count("b1"), 1)
+
+    async def test_sweep_expires_stale_connections(self):
+        await self.store.connect("u1", "c1", 120, ["b1"])
+        await self.store.connect("u2", "c2", 120, ["b1"])
+        await self.store.connect("u2", "c3", 600, ["b1"])
+
+        self.now += 100
+        self.assertTrue(await self.store.heartbeat("u1", "c1", 120))
+
+        self.now += 50
+        self.assertEqual(await self.store.sweep(), 1)
+        self.assertEqual(set(await self.store.connections("u1")), {"c1"})
+        self.assertEqual(set(await self.store.connections("u2")), {"c3"})
+        self.assertEqual(await self.store.online_count("b1"), 2)
+
+        self.now += 100
+        self.assertEqual(await self.store.sweep(), 1)
+        self.assertEqual(await self.store.online_count("b1"), 1)
+        self.assertFalse(await self.store.heartbeat("u1", "c1", 120))
+
+    async def test_sweep_without_expired(self):
+        await self.store.connect("u1", "c1", 120)
+
+        self.assertEqual(await self.store.sweep(), 0)
+        self.assertEqual(set(await self.store.connections("u1")), {"c1"})
+
+
+class IncompletePresenceStoreTest(SimpleTestCase):
+    def test_not_instantiable(self):
+        class NoSweep(PresenceStore):
+            async def connect(self, user_id, connection_id, ttl, bunch_ids=()):
+                pass
+
+            async def heartbeat(self, user_id, connection_id, ttl):
+                return False
+
+            async def disconnect(self, user_id, connection_id):
+                pass
+
+            async def connections(self, user_id):
+                return {}
+
+            async def online_count(self, bunch_id):
+                return 0
+
+            async def clear(self):
+                pass
+
+        with self.assertRaises(TypeError):
+            NoSweep()
+
+
+class MemoryPresenceStoreTest(PresenceStoreTests, SimpleTestCase):
+    def make_store(self):
+        return MemoryPresenceStore()
+
+    async def test_sweep_only_pops_expired(self):
+        for i in range(100):
+            await self.store.connect(f"u{i}", "c", 120 if i < 10 else 600)
+
+        self.now += 121
+        self.assertEqual(await self.store.sweep(), 10)
+        # live connections were never popped
+        self.assertEqual(len(self.store._expiries), 90)
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("fakeredis"), "fakeredis is not installed"
+)
+class RedisPresenceStoreTest(PresenceStoreTests, SimpleTestCase):
+    def make_store(self):
+        return RedisPresenceStore(
+            url=f"fakeredis://{uuid.uuid4()}", sweep_batch=2
+        )
+
+
+@override_settings(PRESENCE_STORE="memory")
+class OnlineCountTest(APITestCase):
+    @override
+    def __init__(self, methodName: str = "runTest") -> None:
+        super().__init__(methodName)
+        self.client: APIClient = APIClient()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.root_token = ROOT_TOKEN
+        cls.user_token = USER_TOKEN
+        cls.other_token = OTHER_TOKEN
+
+        cls.root_user = User.objects.create_superuser(
+            username="root_id", email="root@example.com", password="rootpass"
+        )
+        cls.user = User.objects.create_user(
+            username="user_id", email="user@example.com", password="userpass"
+        )
+        cls.other_user = User.objects.create_user(
+            username="other_id",
+            email="other@example.com",
+            password="otherpass",
+        )
+
+        cls.patches = get_mocks(logger, cls)
+        for mock in cls.patches:
+            mock.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for mock in cls.patches:
+            mock.stop()
+        super().tearDownClass()
+
+    def test_online_count(self):
+        bunch = Bunch.objects.create(name="Test Bunch", owner=self.user)
+        store = get_presence_store()
+        store._online[str(bunch.id)] = 3
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {USER_TOKEN}")
+        response = self.client.get(f"/api/v1/bunch/{bunch.id}/online/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"online": 3})
+
+    def test_online_count_requires_membership(self):
+        bunch = Bunch.objects.create(name="Test Bunch", owner=self.user)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {OTHER_TOKEN}")
+        response = self.client.get(f"/api/v1/bunch/{bunch.id}/online/")
+
+        self.assertNotEqual(response.status_code, status.HTTP_200_OK)
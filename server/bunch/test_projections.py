@@ -0,0 +1,63 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from bunch.models import Bunch, Channel, Message
+from bunch.projections import (
+    MESSAGE_VALUES,
+    message_payload,
+    message_payloads,
+)
+from bunch.serializers import MessageSerializer
+from users.models import User
+
+
+class MessagePayloadTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(
+            username="user_id", email="user@example.com", password=None
+        )
+        bunch = Bunch.objects.create(name="Test Bunch", owner=user)
+        channel = Channel.objects.create(bunch=bunch, name="general")
+        member = bunch.members.get(user=user)
+        cls.original = Message.objects.create(
+            channel=channel, author=member, content="x" * 150
+        )
+        cls.reply = Message.objects.create(
+            channel=channel,
+            author=member,
+            content="reply",
+            reply_to=cls.original,
+            deleted=True,
+            deleted_at=timezone.now(),
+        )
+
+    def test_instances_and_values_agree(self):
+        messages = Message.objects.order_by("seq")
+        loaded = list(
+            messages.select_related("author__user", "reply_to__author__user")
+        )
+
+        with self.assertNumQueries(0):
+            payloads = [message_payload(message) for message in loaded]
+        with self.assertNumQueries(1):
+            from_values = message_payloads(messages.values(*MESSAGE_VALUES))
+
+        self.assertEqual(payloads, from_values)
+        reply = payloads[1]
+        self.assertEqual(reply["reply_to_id"], str(self.original.id))
+        self.assertTrue(reply["deleted"])
+        self.assertEqual(reply["deleted_at"], self.reply.deleted_at.isoformat())
+
+    def test_reply_preview_matches_rest(self):
+        reply = Message.objects.select_related(
+            "author__user", "reply_to__author__user"
+        ).get(id=self.reply.id)
+        preview = message_payload(reply)["reply_to_preview"]
+        rest = MessageSerializer(reply).data["reply_to_preview"]
+
+        self.assertEqual(preview["content"], "x" * 100 + "...")
+        self.assertEqual(
+            {**preview, "created_at": None}, {**rest, "created_at": None}
+        )
+        self.assertEqual(preview["created_at"], rest["created_at"].isoformat())
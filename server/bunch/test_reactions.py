@@ -1,8 +1,22 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from bunch.models import Bunch, Channel, Member, Message, Reaction, RoleChoices
+from bunch.models import (
+    Bunch,
+    Channel,
+    Member,
+    Message,
+    Reaction,
+    ReactionCount,
+    RoleChoices,
+)
 
 User = get_user_model()
 
@@ -162,6 +176,123 @@ class ReactionsTestCase(APITestCase):
         self.assertEqual(message_data["reaction_counts"]["👍"], 2)
         self.assertEqual(message_data["reaction_counts"]["❤️"], 1)
 
+    def list_messages_queries(self, page_size):
+        """Queries to list a page of ``page_size`` reacted-to replies."""
+        group, _ = Group.objects.get_or_create(name="testers")
+        self.member.groups.add(group)
+        for i in range(page_size):
+            message = Message.objects.create(
+                content=f"Message {i}",
+                author=self.member_member,
+                channel=self.channel,
+                reply_to=self.message,
+            )
+            Reaction.objects.create(
+                message=message, user=self.owner, emoji="👍"
+            )
+            Reaction.objects.create(
+                message=message, user=self.member, emoji="👍"
+            )
+            Reaction.objects.create(
+                message=message, user=self.member, emoji="❤️"
+            )
+
+        self.client.force_authenticate(user=self.member)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f"/api/v1/bunch/{self.bunch.id}/messages/",
+                {"channel": str(self.channel.id), "page_size": page_size},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(len(results), page_size)
+        self.assertEqual(results[-1]["reaction_counts"], {"👍": 2, "❤️": 1})
+        self.assertEqual(
+            results[-1]["reply_to_preview"]["id"], str(self.message.id)
+        )
+        self.assertEqual(
+            results[-1]["reactions"][1]["user"]["groups"], [group.id]
+        )
+        return len(queries)
+
+    def test_list_messages_query_count(self):
+        """Test listing messages with reactions takes a fixed number of
+        queries, whatever the page size."""
+        small = self.list_messages_queries(page_size=5)
+        Message.objects.filter(reply_to__isnull=False).delete()
+        large = self.list_messages_queries(page_size=50)
+
+        self.assertEqual(small, large)
+        # page, reactions, reactors' groups, reaction counts
+        self.assertEqual(large, 4)
+
+    def counts(self):
+        return dict(
+            ReactionCount.objects.filter(message=self.message).values_list(
+                "emoji", "count"
+            )
+        )
+
+    def test_reaction_counts_follow_reactions(self):
+        """Test reaction counts are kept up to date as reactions change."""
+        self.client.force_authenticate(user=self.member)
+        url = f"/api/v1/bunch/{self.bunch.id}/reactions/"
+        data = {"message_id": str(self.message.id), "emoji": "👍"}
+
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.counts(), {"👍": 1})
+
+        self.client.force_authenticate(user=self.owner)
+        self.client.post(f"{url}toggle/", data, format="json")
+        self.assertEqual(self.counts(), {"👍": 2})
+
+        self.client.post(f"{url}toggle/", data, format="json")
+        self.assertEqual(self.counts(), {"👍": 1})
+
+        Reaction.objects.get(id=response.data["id"]).delete()
+        self.assertEqual(self.counts(), {"👍": 0})
+
+        # a duplicate is rejected without being counted
+        Reaction.objects.create(
+            message=self.message, user=self.member, emoji="🔥"
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Reaction.objects.create(
+                message=self.message, user=self.member, emoji="🔥"
+            )
+        self.assertEqual(self.counts(), {"👍": 0, "🔥": 1})
+
+        # reactions of deleted users are uncounted
+        self.member.delete()
+        self.assertEqual(self.counts(), {"👍": 0, "🔥": 0})
+
+    def test_rebuild_reaction_counts(self):
+        """Test the counts can be verified and rebuilt from reactions."""
+        Reaction.objects.create(
+            message=self.message, user=self.owner, emoji="👍"
+        )
+        Reaction.objects.create(
+            message=self.message, user=self.member, emoji="👍"
+        )
+        call_command("rebuild_reaction_counts", "--check", stdout=StringIO())
+
+        ReactionCount.objects.filter(emoji="👍").update(count=5)
+        ReactionCount.objects.create(message=self.message, emoji="🔥", count=1)
+        with self.assertRaisesMessage(
+            CommandError, "2 reaction counts are off"
+        ):
+            call_command(
+                "rebuild_reaction_counts",
+                "--check",
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+
+        call_command("rebuild_reaction_counts", stdout=StringIO())
+        self.assertEqual(self.counts(), {"👍": 2})
+
     def test_non_member_cannot_react(self):
         """Test that non-members cannot add reactions."""
         non_member = User.objects.create_user(
@@ -0,0 +1,92 @@
+import importlib.util
+import unittest
+import uuid
+
+from django.test import SimpleTestCase
+
+from bunch.replay import MemoryReplayBuffer, RedisReplayBuffer, ReplayBuffer
+
+
+class ReplayBufferTests:
+    """Behaviour shared by every replay buffer."""
+
+    def make_buffer(self, size):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.buffer = self.make_buffer(size=3)
+
+    async def test_since(self):
+        for seq in (1, 2, 3):
+            await self.buffer.append("c1", seq, f"frame {seq}")
+
+        self.assertEqual(
+            await self.buffer.since("c1", 1), ["frame 2", "frame 3"]
+        )
+        self.assertEqual(
+            await self.buffer.since("c1", 0),
+            ["frame 1", "frame 2", "frame 3"],
+        )
+        self.assertEqual(await self.buffer.since("c1", 3), [])
+        self.assertIsNone(await self.buffer.since("c2", 0))
+
+    async def test_since_beyond_buffer(self):
+        for seq in range(1, 6):
+            await self.buffer.append("c1", seq, f"frame {seq}")
+
+        # frames 1 and 2 were trimmed
+        self.assertIsNone(await self.buffer.since("c1", 0))
+        self.assertIsNone(await self.buffer.since("c1", 1))
+        self.assertEqual(
+            await self.buffer.since("c1", 2),
+            ["frame 3", "frame 4", "frame 5"],
+        )
+
+    async def test_out_of_order_appends(self):
+        for seq in (1, 3, 2):
+            await self.buffer.append("c1", seq, f"frame {seq}")
+
+        self.assertEqual(
+            await self.buffer.since("c1", 1), ["frame 2", "frame 3"]
+        )
+
+    async def test_clear(self):
+        await self.buffer.append("c1", 1, "frame 1")
+        await self.buffer.clear()
+
+        self.assertIsNone(await self.buffer.since("c1", 0))
+
+
+class IncompleteReplayBufferTest(SimpleTestCase):
+    def test_not_instantiable(self):
+        class NoClear(ReplayBuffer):
+            async def append(self, channel_id, seq, frame):
+                pass
+
+            async def since(self, channel_id, seq):
+                return None
+
+        with self.assertRaises(TypeError):
+            NoClear()
+
+
+class MemoryReplayBufferTest(ReplayBufferTests, SimpleTestCase):
+    def make_buffer(self, size):
+        return MemoryReplayBuffer(size=size, max_channels=2)
+
+    async def test_evicts_least_recent_channel(self):
+        await self.buffer.append("c1", 1, "frame 1")
+        await self.buffer.append("c2", 1, "frame 1")
+        await self.buffer.append("c1", 2, "frame 2")
+        await self.buffer.append("c3", 1, "frame 1")
+
+        self.assertIsNone(await self.buffer.since("c2", 0))
+        self.assertEqual(await self.buffer.since("c1", 1), ["frame 2"])
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("fakeredis"), "fakeredis is not installed"
+)
+class RedisReplayBufferTest(ReplayBufferTests, SimpleTestCase):
+    def make_buffer(self, size):
+        return RedisReplayBuffer(url=f"fakeredis://{uuid.uuid4()}", size=size)
@@ -0,0 +1,155 @@
+import asyncio
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from bunch import send_queue
+from bunch.send_queue import BLOCK, SendQueue
+
+
+class SlowSocket:
+    """A client that reads only while ``open`` is set."""
+
+    def __init__(self):
+        self.written: list[str] = []
+        self.open = asyncio.Event()
+        self.open.set()
+
+    async def send(self, text_data):
+        await self.open.wait()
+        self.written.append(text_data)
+
+
+async def settle():
+    """Let the queue's writer run."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class SendQueueTest(SimpleTestCase):
+    async def test_writes_in_order(self):
+        socket = SlowSocket()
+        queue = SendQueue(socket.send)
+
+        await queue.put("a", channel_id="c1", seq=1)
+        await queue.put("b")
+        await queue.put("c", channel_id="c1", seq=2)
+        await settle()
+
+        self.assertEqual(socket.written, ["a", "b", "c"])
+        self.assertEqual(queue.delivered, {"c1": 2})
+        await queue.stop()
+
+    async def test_drops_droppable_frames_first(self):
+        socket = SlowSocket()
+        queue = SendQueue(socket.send, max_frames=3)
+        socket.open.clear()
+        await queue.put("in flight")
+        await settle()
+
+        await queue.put("typing 1", kind="typing")
+        await queue.put("message 1", kind="chat.message")
+        await queue.put("presence 1", kind="presence")
+        # full: the oldest droppable frame makes room
+        self.assertTrue(await queue.put("message 2", kind="chat.message"))
+        # a droppable frame is dropped rather than make room
+        self.assertFalse(await queue.put("typing 2", kind="typing"))
+
+        socket.open.set()
+        await settle()
+        self.assertEqual(
+            socket.written,
+            ["in flight", "message 1", "presence 1", "message 2"],
+        )
+        self.assertEqual(queue.dropped, 2)
+        self.assertFalse(queue.overflowed)
+        await queue.stop()
+
+    async def test_overflow_disconnects(self):
+        socket = SlowSocket()
+        overflows = []
+
+        async def on_overflow(delivered):
+            overflows.append(delivered)
+
+        queue = SendQueue(socket.send, max_frames=2, on_overflow=on_overflow)
+        await queue.put("message 1", channel_id="c1", seq=1)
+        await settle()
+        socket.open.clear()
+        await queue.put("message 2", channel_id="c1", seq=2)
+        await settle()  # in flight
+        for seq in (3, 4):
+            self.assertTrue(await queue.put(f"message {seq}", seq=seq))
+
+        # chat messages are never dropped
+        self.assertFalse(await queue.put("message 5", channel_id="c1", seq=5))
+
+        self.assertEqual(overflows, [{"c1": 1}])
+        self.assertTrue(queue.overflowed)
+        self.assertEqual(len(queue), 0)
+        self.assertFalse(await queue.put("message 6"))
+        socket.open.set()
+        await settle()
+        self.assertEqual(socket.written, ["message 1"])
+
+    async def test_block_policy_waits(self):
+        socket = SlowSocket()
+        queue = SendQueue(socket.send, max_frames=1, policy=BLOCK)
+        socket.open.clear()
+        await queue.put("in flight")
+        await settle()
+        await queue.put("queued")
+
+        put = asyncio.ensure_future(queue.put("waiting"))
+        await settle()
+        self.assertFalse(put.done())
+
+        socket.open.set()
+        self.assertTrue(await asyncio.wait_for(put, timeout=1))
+        await settle()
+        self.assertEqual(socket.written, ["in flight", "queued", "waiting"])
+        await queue.stop()
+
+    async def test_metrics(self):
+        socket = SlowSocket()
+        socket.open.clear()
+        queues = [SendQueue(socket.send) for _ in range(2)]
+        for i, queue in enumerate(queues):
+            for _ in range(i + 3):  # one of them in flight
+                await queue.put("frame")
+        await settle()
+
+        metrics = send_queue.metrics()
+        self.assertGreaterEqual(metrics["connections"], 2)
+        self.assertGreaterEqual(metrics["queued"], 5)
+        self.assertGreaterEqual(metrics["max_queued"], 3)
+
+        for queue in queues:
+            await queue.stop()
+
+
+class SocketMetricsTest(APITestCase):
+    def test_admin_only(self):
+        User = get_user_model()
+        user = User.objects.create_user(
+            username="user", email="user@example.com", password="password"
+        )
+        admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="password"
+        )
+        url = reverse("bunch:ws-metrics")
+
+        self.client.force_authenticate(user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data),
+            {"connections", "queued", "max_queued", "dropped", "overflows"},
+        )
@@ -27,6 +27,7 @@ bunch_router.register(
 )
 
 urlpatterns = [
+    path("ws-metrics/", views.socket_metrics, name="ws-metrics"),
     path("", include(router.urls)),
     path("<uuid:bunch_id>/", include(bunch_router.urls)),
 ]
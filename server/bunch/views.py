@@ -1,17 +1,40 @@
 import logging
 from typing import override
 
-from channels.layers import get_channel_layer
-from django.db import models
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from rest_framework import permissions, status, viewsets
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
-from bunch.constants import WSMessageTypeServer
-from bunch.models import Bunch, Channel, Member, Message, Reaction, RoleChoices
+from bunch import send_queue
+from bunch.broadcast import (
+    channel_created,
+    channel_deleted,
+    channel_updated,
+    chat_message_event,
+    member_joined,
+    member_left,
+    member_updated,
+    membership_changed,
+    message_deleted_event,
+    message_updated_event,
+)
+from bunch.models import (
+    Bunch,
+    Channel,
+    Member,
+    Message,
+    Reaction,
+    ReactionCount,
+    RoleChoices,
+    reply_count,
+)
+from bunch.outbox import enqueue
+from bunch.pagination import MessagePagination
 from bunch.permissions import (
     AuthedHttpRequest,
     IsBunchAdmin,
@@ -21,6 +44,12 @@ from bunch.permissions import (
     IsMessageAuthor,
     IsSelfMember,
 )
+from bunch.presence import get_presence_store
+from bunch.projections import (
+    MESSAGE_LIST_VALUES,
+    message_list_items,
+    message_payload,
+)
 from bunch.serializers import (
     BunchSerializer,
     ChannelSerializer,
@@ -47,7 +76,7 @@ class BunchViewSet(viewsets.ModelViewSet):
         if self.request.user and self.request.user.is_superuser:
             return Bunch.objects.all()
 
-        if self.action in ("list", "destroy", "retrieve"):
+        if self.action in ("list", "destroy", "retrieve", "online"):
             # return all bunches the user is in
             queryset = Bunch.objects.filter(members__user=self.request.user)
         elif self.action == "join" or self.action == "leave":
@@ -96,7 +125,7 @@ class BunchViewSet(viewsets.ModelViewSet):
             ]
         elif self.action == "join":
             self.permission_classes = [permissions.IsAuthenticated]
-        elif self.action == "leave":
+        elif self.action == "leave" or self.action == "online":
             self.permission_classes = [
                 permissions.IsAuthenticated,
                 IsBunchMember,
@@ -116,6 +145,7 @@ class BunchViewSet(viewsets.ModelViewSet):
             bunch=bunch,
             role="owner",
         )
+        membership_changed(self.request.user.id, bunch.id)
 
     @action(
         detail=False,
@@ -163,6 +193,7 @@ class BunchViewSet(viewsets.ModelViewSet):
         member = Member.objects.create(
             user=request.user, bunch=bunch, role="member"
         )
+        member_joined(member)
         serializer = MemberSerializer(member, context={"request": request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -177,7 +208,9 @@ class BunchViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        member_id = member.id  # cleared by delete()
         member.delete()
+        member_left(bunch.id, member_id, request.user.id)
         return Response(
             {
                 "status": "success",
@@ -186,6 +219,12 @@ class BunchViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK,
         )
 
+    @action(detail=True, methods=["GET"])
+    def online(self, request, id=None):
+        bunch = self.get_object()
+        count = async_to_sync(get_presence_store().online_count)(str(bunch.id))
+        return Response({"online": count}, status=status.HTTP_200_OK)
+
 
 class MemberViewSet(viewsets.ModelViewSet):
     serializer_class = MemberSerializer
@@ -262,12 +301,18 @@ class MemberViewSet(viewsets.ModelViewSet):
         nickname = self.request.POST.get("nickname")
         role = self.request.POST.get("role")
 
-        serializer.save(
+        member = serializer.save(
             bunch=bunch,
             user=user,
             nickname=nickname,
             role=role,
         )
+        member_joined(member)
+
+    def perform_destroy(self, instance: Member):
+        member_id = instance.id  # cleared by delete()
+        super().perform_destroy(instance)
+        member_left(instance.bunch_id, member_id, instance.user_id)
 
     @action(detail=True, methods=["post"])
     def update_role(self, request, bunch_id=None, id=None):
@@ -289,6 +334,7 @@ class MemberViewSet(viewsets.ModelViewSet):
 
         member.role = new_role
         member.save()
+        member_updated(member)
 
         # Return serialized member with updated role
         serializer = MemberSerializer(member, context={"request": request})
@@ -351,31 +397,42 @@ class ChannelViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         bunch = get_object_or_404(Bunch, id=self.kwargs.get("bunch_id"))
-        serializer.save(bunch=bunch)
+        channel_created(serializer.save(bunch=bunch))
+
+    def perform_update(self, serializer):
+        channel_updated(serializer.save())
+
+    def perform_destroy(self, instance: Channel):
+        channel_id = instance.id  # cleared by delete()
+        super().perform_destroy(instance)
+        channel_deleted(instance.bunch_id, channel_id)
 
     @action(detail=True, methods=["post"])
     def send_message(self, request, bunch_id=None, id=None):
         channel: Channel = self.get_object()
         member: Member = get_object_or_404(
-            Member, user=request.user, bunch__id=bunch_id
+            Member.objects.select_related("user"),
+            user=request.user,
+            bunch__id=bunch_id,
         )
 
-        message = Message.objects.create(
-            channel=channel,
-            author=member,
-            content=request.data.get("content"),
-        )
+        with transaction.atomic():
+            message = Message.objects.create(
+                channel=channel,
+                author=member,
+                content=request.data.get("content"),
+            )
+            # every sequenced message is broadcast, so replays have no holes
+            enqueue(
+                channel.bunch_id,
+                channel.id,
+                chat_message_event(message_payload(message)),
+            )
 
         serializer = MessageSerializer(message, context={"request": request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class MessagePagination(PageNumberPagination):
-    page_size = 100
-    page_size_query_param = "page_size"
-    max_page_size = 1000
-
-
 class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [
@@ -387,12 +444,12 @@ class MessageViewSet(viewsets.ModelViewSet):
     pagination_class = MessagePagination
 
     def get_queryset(self):
+        return self.with_related(self.messages())
+
+    def messages(self):
+        """The bunch's messages, filtered by the query params, in order."""
         bunch_id = self.kwargs.get("bunch_id")
-        queryset = (
-            Message.objects.for_bunch(bunch_id)
-            .select_related("author__user", "reply_to__author__user")
-            .annotate(reply_count=models.Count("replies"))
-        )
+        queryset = Message.objects.for_bunch(bunch_id)
 
         # Filter by channel if specified
         channel_id = self.request.query_params.get("channel")
@@ -404,7 +461,54 @@ class MessageViewSet(viewsets.ModelViewSet):
         if top_level and top_level.lower() == "true":
             queryset = queryset.filter(reply_to__isnull=True)
 
-        return queryset.order_by("created_at")
+        return queryset.order_by("created_at", "id")
+
+    def with_related(self, queryset):
+        """
+        ``queryset`` with everything MessageSerializer reads loaded up front,
+        so a page costs the same few queries whatever its size.
+        """
+        return (
+            queryset.select_related(
+                "channel", "author__user", "reply_to__author__user"
+            )
+            .annotate(reply_count=reply_count())
+            .prefetch_related(
+                Prefetch(
+                    "reactions",
+                    queryset=Reaction.objects.select_related("user")
+                    .prefetch_related("user__groups")
+                    .order_by("created_at"),
+                ),
+                Prefetch(
+                    "reaction_totals",
+                    queryset=ReactionCount.objects.filter(count__gt=0).order_by(
+                        "-count", "emoji"
+                    ),
+                ),
+            )
+        )
+
+    def list_response(self, queryset) -> Response:
+        """
+        A page of ``queryset`` as MessageSerializer would list it, read with
+        ``.values()`` and rendered by ``message_list_items`` instead: lists
+        are the hot path, and model instances and serializer fields cost
+        several times the CPU (see benchmarks.rendering).
+        """
+        rows = queryset.annotate(reply_count=reply_count()).values(
+            *MESSAGE_LIST_VALUES
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                message_list_items(page, self.request)
+            )
+        return Response(message_list_items(list(rows), self.request))
+
+    @override
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.messages())
 
     @override
     def get_permissions(self):
@@ -455,112 +559,72 @@ class MessageViewSet(viewsets.ModelViewSet):
 
         channel = get_object_or_404(Channel, id=channel_id, bunch_id=bunch_id)
         member = get_object_or_404(
-            Member, user=self.request.user, bunch_id=bunch_id
+            Member.objects.select_related("user"),
+            user=self.request.user,
+            bunch_id=bunch_id,
         )
 
         reply_to = None
         if reply_to_id:
             reply_to = get_object_or_404(
-                Message,
+                Message.objects.select_related("author__user"),
                 id=reply_to_id,
                 channel__bunch_id=bunch_id,
                 deleted=False,  # Can't reply to deleted messages
             )
 
-        message = serializer.save(
-            channel=channel, author=member, reply_to=reply_to
-        )
-        self._broadcast_message_via_websocket(
-            message, channel, member, bunch_id
-        )
+        with transaction.atomic():
+            message = serializer.save(
+                channel=channel, author=member, reply_to=reply_to
+            )
+            enqueue(
+                bunch_id,
+                channel.id,
+                chat_message_event(message_payload(message)),
+            )
 
-    def _broadcast_message_via_websocket(
-        self, message, channel, member, bunch_id
-    ):
-        """Broadcast message to WebSocket consumers for live updates"""
-        try:
-            message_data = {
-                "id": str(message.id),
-                "channel": str(channel.id),
-                "author": {
-                    "id": str(member.id),
-                    "bunch": str(bunch_id),
-                    "user": {
-                        "id": str(member.user.id),
-                        "username": member.user.username,
-                    },
-                    "role": member.role,
-                    "joined_at": member.joined_at.isoformat(),
-                },
-                "content": message.content,
-                "created_at": message.created_at.isoformat(),
-                "updated_at": message.updated_at.isoformat(),
-                "edit_count": message.edit_count,
-                "deleted": message.deleted,
-                "deleted_at": message.deleted_at.isoformat()
-                if message.deleted_at
-                else None,
-                "reply_to_id": str(message.reply_to_id)
-                if message.reply_to_id
-                else None,
-                "reply_to_preview": self._get_reply_preview(message.reply_to)
-                if message.reply_to
-                else None,
-                "reply_count": 0,  # New message, no replies yet
-            }
-            channel_layer = get_channel_layer()
-            assert channel_layer is not None
-
-            room_group_name = f"chat_{bunch_id}_{channel.id}"
-
-            from asgiref.sync import async_to_sync
-
-            async_to_sync(channel_layer.group_send)(
-                room_group_name,
-                {
-                    "type": WSMessageTypeServer.CHAT_MESSAGE,
-                    "message": message_data,
-                },
+    def perform_update(self, serializer: MessageSerializer):
+        message = serializer.instance
+        content = serializer.validated_data.get("content", message.content)
+        with transaction.atomic():
+            edited = Message.objects.edit(message.id, content)
+            if edited is None:
+                raise ValidationError("Deleted messages can't be edited.")
+            seq = Channel.allocate_seq(message.channel_id)
+            enqueue(
+                message.channel.bunch_id,
+                message.channel_id,
+                message_updated_event(
+                    message.id, message.channel_id, seq, content, *edited
+                ),
+            )
+
+        message.content = content
+        message.edit_count, message.updated_at = edited
+
+    def perform_destroy(self, instance: Message):
+        """Soft delete, replies and reactions stay."""
+        with transaction.atomic():
+            deleted_at = Message.objects.soft_delete(instance.id)
+            if deleted_at is None:
+                return  # already deleted
+            seq = Channel.allocate_seq(instance.channel_id)
+            enqueue(
+                instance.channel.bunch_id,
+                instance.channel_id,
+                message_deleted_event(
+                    instance.id, instance.channel_id, seq, deleted_at
+                ),
             )
-        except Exception as e:
-            # Log the error but don't fail the message creation
-            logger.error(f"Failed to broadcast message via WebSocket: {str(e)}")
-
-    def _get_reply_preview(self, reply_to_message):
-        """Generate reply preview data for a replied-to message"""
-        if not reply_to_message:
-            return None
-
-        return {
-            "id": str(reply_to_message.id),
-            "content": reply_to_message.content,
-            "created_at": reply_to_message.created_at.isoformat(),
-            "author": {
-                "id": str(reply_to_message.author.user.id),
-                "username": reply_to_message.author.user.username,
-            },
-        }
 
     @action(detail=True, methods=["get"])
     def replies(self, request, bunch_id=None, id=None):
         """Get all replies to a specific message."""
         message = self.get_object()
-        replies = (
-            Message.objects.replies_to(message.id)
-            .select_related("author__user", "reply_to__author__user")
-            .annotate(reply_count=models.Count("replies"))
-            .order_by("created_at")
+        return self.list_response(
+            Message.objects.replies_to(message.id).order_by("created_at", "id")
         )
 
-        # Paginate the replies
-        page = self.paginate_queryset(replies)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(replies, many=True)
-        return Response(serializer.data)
-
 
 class ReactionViewSet(viewsets.ModelViewSet):
     """
@@ -687,3 +751,10 @@ class ReactionViewSet(viewsets.ModelViewSet):
                 {"action": "added", "reaction": serializer.data},
                 status=status.HTTP_201_CREATED,
             )
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def socket_metrics(request):
+    """Websocket send queue depths and drops of the serving process."""
+    return Response(send_queue.metrics())
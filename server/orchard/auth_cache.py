@@ -0,0 +1,133 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cache
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+if TYPE_CHECKING:
+    from orchard.tokens import TokenClaims
+    from users.models import User
+
+
+def token_fingerprint(token: str) -> bytes:
+    """Cache key for a token, so raw tokens are never kept in memory."""
+    return hashlib.sha256(token.encode()).digest()
+
+
+@dataclass(slots=True)
+class _Entry:
+    user: "User"
+    claims: "TokenClaims"
+    expires_at: float
+
+
+class TokenUserCache:
+    """
+    Bounded LRU cache of verified token -> (user, claims).
+
+    Entries expire at the token's ``exp`` or after ``ttl`` seconds, whichever
+    comes first. The cache is per process; :mod:`users.signals` drops a
+    user's entries whenever the user is saved or deleted.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, _Entry] = OrderedDict()
+        self._by_user: dict[str, set[bytes]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> tuple["User", "TokenClaims"] | None:
+        key = token_fingerprint(token)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry.expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        # callers may mutate the user (e.g. onboarding), keep ours pristine
+        return copy.copy(entry.user), entry.claims
+
+    def set(self, token: str, user: "User", claims: "TokenClaims") -> None:
+        if self.maxsize <= 0:
+            return
+
+        key = token_fingerprint(token)
+        expires_at = min(claims.expires_at, time.time() + self.ttl)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = _Entry(copy.copy(user), claims, expires_at)
+            self._by_user.setdefault(str(user.pk), set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id) -> None:
+        with self._lock:
+            for key in self._by_user.pop(str(user_id), ()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remove(self, key: bytes) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        user_id = str(entry.user.pk)
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+
+@cache
+def get_token_user_cache() -> TokenUserCache:
+    return TokenUserCache(
+        maxsize=settings.AUTH_USER_CACHE_SIZE,
+        ttl=settings.AUTH_USER_CACHE_TTL,
+    )
+
+
+@receiver(setting_changed)
+def _reset_token_user_cache(setting: str, **kwargs):
+    if setting.startswith("AUTH_USER_CACHE_"):
+        get_token_user_cache.cache_clear()
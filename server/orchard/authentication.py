@@ -1,17 +1,34 @@
 import logging
+from dataclasses import dataclass
 from typing import override
 
 from django.contrib.auth.backends import BaseBackend
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractBaseUser
+from django.db import IntegrityError, transaction
 from django.http import HttpRequest
 from rest_framework import authentication, exceptions
-from supabase import AuthError
 
+from orchard.auth_cache import get_token_user_cache
 from orchard.services import SupabaseService
+from orchard.throttling import (
+    get_auth_failure_limiter,
+    get_negative_token_cache,
+)
+from orchard.tokens import (
+    TokenClaims,
+    TokenError,
+    TokenVerificationUnavailable,
+    averify_token,
+    verify_token,
+)
 from users.models import User
 
 logger = logging.getLogger(__name__)
 
+# request attribute holding the memoized BearerAuthResult
+REQUEST_AUTH_ATTR = "_supabase_auth"
+
 
 # probably unused for now, since we aren't using django's auth, so ignore implementation
 class SupabaseAuth(BaseBackend):
@@ -61,49 +78,242 @@ class SupabaseAuth(BaseBackend):
             return None
 
 
-class SupabaseJWTAuthentication(authentication.BaseAuthentication):
+@dataclass(frozen=True, slots=True)
+class BearerAuthResult:
     """
-    Verifies user JWT authentication using supabase for rest API and channels consumers
+    Outcome of authenticating a request's bearer token.
+
+    Either ``user`` and ``claims`` are set, or ``error`` says why not.
     """
 
-    @override
-    def authenticate(self, request):
-        logger.debug("Authenticating user via JWT")
+    user: User | None = None
+    claims: TokenClaims | None = None
+    error: str | None = None
+    # set when the client is rejected for failing too often
+    retry_after: float | None = None
 
-        auth_header = request.META.get("HTTP_AUTHORIZATION")
 
-        if not auth_header or not auth_header.startswith("Bearer "):
-            logger.debug("No valid JWT token provided")
-            return None
+def get_bearer_token(request: HttpRequest) -> str | None:
+    auth_header = request.META.get("HTTP_AUTHORIZATION")
+
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+
+    return auth_header.split(" ")[1] or None
+
+
+def _throttled(client: str | None) -> BearerAuthResult | None:
+    limiter = get_auth_failure_limiter()
+    if limiter.allowed(client):
+        return None
+
+    logger.debug(f"Too many failed authentication attempts from {client}")
+    return BearerAuthResult(
+        error="Too many failed authentication attempts",
+        retry_after=limiter.retry_after(client),
+    )
+
+
+def _from_user_cache(token: str) -> BearerAuthResult | None:
+    logger.debug(f"JWT token received: {token[:20]}...")
+
+    if cached := get_token_user_cache().get(token):
+        user, claims = cached
+        if not user.is_active:
+            return BearerAuthResult(error="User inactive or deleted")
+        return BearerAuthResult(user=user, claims=claims)
+
+    return None
+
+
+def _from_negative_cache(token: str) -> BearerAuthResult | None:
+    if error := get_negative_token_cache().get(token):
+        return BearerAuthResult(error=error)
+    return None
+
+
+def _verification_failed(token: str, e: TokenError) -> BearerAuthResult:
+    if isinstance(e, TokenVerificationUnavailable):
+        # transient (no key, jwks down), don't remember it
+        logger.warning(f"Token could not be verified: {e}")
+    else:
+        logger.debug(f"Token error: {e}")
+        get_negative_token_cache().add(token, "Token error")
+
+    return BearerAuthResult(error="Token error")
+
+
+def _new_user_fields(claims: TokenClaims) -> dict:
+    # Create a new user if they don't exist with fields we have already
+    return {
+        "id": claims.user_id,
+        "username": claims.user_metadata.get("username"),
+        "display_name": claims.user_metadata.get("display_name"),
+        "email": claims.email,
+        "password": make_password(None),
+    }
+
+
+def _resolved(token: str, user: User, claims: TokenClaims) -> BearerAuthResult:
+    get_token_user_cache().set(token, user, claims)
+
+    if not user.is_active:
+        return BearerAuthResult(error="User inactive or deleted")
+
+    return BearerAuthResult(user=user, claims=claims)
+
+
+def _user_not_created(claims: TokenClaims) -> BearerAuthResult:
+    logger.warning(f"Could not create user {claims.user_id}")
+    return BearerAuthResult(error="User not found. Please complete onboarding")
+
+
+def authenticate_token(
+    token: str, client: str | None = None
+) -> BearerAuthResult:
+    """
+    Resolve a bearer token to its shadow user, creating it on first sight.
+
+    ``client`` (usually the remote address) is rate limited on failures, see
+    :class:`orchard.throttling.AuthFailureLimiter`. Tokens already resolved
+    are let through regardless: the client may be a proxy or NAT shared with
+    whoever is failing.
+    """
+    if cached := _from_user_cache(token):
+        return cached
+    if throttled := _throttled(client):
+        return throttled
+
+    result = _resolve_token(token)
+    if result.error:
+        get_auth_failure_limiter().record_failure(client)
+
+    return result
+
 
-        token = auth_header.split(" ")[1]
-        logger.debug(f"JWT token received: {token[:20]}...")
+def _resolve_token(token: str) -> BearerAuthResult:
+    if failed := _from_negative_cache(token):
+        return failed
 
-        supabase = SupabaseService()
+    try:
+        claims = verify_token(token)
+    except TokenError as e:
+        return _verification_failed(token, e)
+
+    logger.debug(f"User ID: {claims.user_id}")
+
+    if not claims.email:
+        return BearerAuthResult(error="Email not found in token")
+
+    # We find a 'shadow' user in Django's DB
+    try:
+        user = User.objects.get(id=claims.user_id)
+    except User.DoesNotExist:
+        logger.debug("user does not exist, creating")
         try:
-            token_user = supabase.get_user(token)
-        except AuthError as e:
-            logger.debug(f"Token error: {e}")
-            raise exceptions.AuthenticationFailed("Token error")
+            with transaction.atomic():
+                user = User.objects.create(**_new_user_fields(claims))
+        except IntegrityError:
+            return _user_not_created(claims)
+
+    return _resolved(token, user, claims)
+
+
+async def aauthenticate_token(
+    token: str, client: str | None = None
+) -> BearerAuthResult:
+    """
+    Async version of :func:`authenticate_token` for channels.
+
+    Cache hits and local verification run on the event loop; only a remote
+    check or a JWKS refresh goes to a thread, and the user is loaded with
+    the async ORM.
+    """
+    if cached := _from_user_cache(token):
+        return cached
+    if throttled := _throttled(client):
+        return throttled
+
+    result = await _aresolve_token(token)
+    if result.error:
+        get_auth_failure_limiter().record_failure(client)
 
-        if not token_user:
-            raise exceptions.AuthenticationFailed("Token user not found")
+    return result
 
-        user_id = token_user.user.id
-        email = token_user.user.email
 
-        logger.debug(f"User ID: {user_id}")
-        logger.debug(f"Email: {email}")
+async def _aresolve_token(token: str) -> BearerAuthResult:
+    if failed := _from_negative_cache(token):
+        return failed
 
-        if not email:
-            raise exceptions.AuthenticationFailed("Email not found in token")
+    try:
+        claims = await averify_token(token)
+    except TokenError as e:
+        return _verification_failed(token, e)
 
-        # We find a 'shadow' user in Django's DB
+    logger.debug(f"User ID: {claims.user_id}")
+
+    if not claims.email:
+        return BearerAuthResult(error="Email not found in token")
+
+    try:
+        user = await User.objects.aget(id=claims.user_id)
+    except User.DoesNotExist:
+        logger.debug("user does not exist, creating")
         try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            raise exceptions.AuthenticationFailed(
-                "User not found. Please complete onboarding"
-            )
+            user = await User.objects.acreate(**_new_user_fields(claims))
+        except IntegrityError:
+            return _user_not_created(claims)
+
+    return _resolved(token, user, claims)
+
+
+def authenticate_request(request: HttpRequest) -> BearerAuthResult | None:
+    """
+    Authenticate the bearer token of ``request`` at most once.
+
+    The result is kept on the request, so :class:`SupabaseAuthMiddleware`,
+    :class:`SupabaseJWTAuthentication` and :class:`SupabaseSessionMiddleware`
+    all share a single verification and user lookup.
+
+    Returns:
+        None if the request has no bearer token
+    """
+    if REQUEST_AUTH_ATTR in request.__dict__:
+        return request.__dict__[REQUEST_AUTH_ATTR]
+
+    token = get_bearer_token(request)
+    result = (
+        authenticate_token(token, request.META.get("REMOTE_ADDR"))
+        if token
+        else None
+    )
+
+    setattr(request, REQUEST_AUTH_ATTR, result)
+    return result
+
+
+class SupabaseJWTAuthentication(authentication.BaseAuthentication):
+    """
+    Verifies user JWT authentication using supabase for rest API and channels consumers
+
+    Tokens are verified locally by default, see :func:`orchard.tokens.verify_token`.
+    """
+
+    @override
+    def authenticate(self, request):
+        logger.debug("Authenticating user via JWT")
+
+        # reuse the pass already done by SupabaseAuthMiddleware
+        result = authenticate_request(getattr(request, "_request", request))
+
+        if result is None:
+            logger.debug("No valid JWT token provided")
+            return None
+
+        if result.retry_after is not None:
+            raise exceptions.Throttled(wait=result.retry_after)
+
+        if result.error:
+            raise exceptions.AuthenticationFailed(result.error)
 
-        return (user, None)
+        return (result.user, result.claims)
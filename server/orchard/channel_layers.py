@@ -0,0 +1,77 @@
+import bisect
+import hashlib
+from typing import Any
+
+from channels_redis.core import RedisChannelLayer
+from channels_redis.utils import create_pool
+
+from orchard.redis_clients import FAKE_REDIS_SCHEME, fake_redis_pool
+
+
+class HashRing:
+    """
+    Consistent hash ring over ``nodes``, with ``replicas`` virtual points per
+    node.
+
+    Unlike channels_redis' crc32 bucketing, adding or removing a node only
+    moves the keys of that node's arcs (~1/n of all keys) to other nodes.
+    """
+
+    def __init__(self, nodes: list[str], replicas: int = 160):
+        points = sorted(
+            (self._hash(f"{node}#{replica}"), index)
+            for index, node in enumerate(nodes)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._indexes = [index for _, index in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def get(self, key: str) -> int:
+        """Index of the node owning ``key``."""
+        position = bisect.bisect(self._hashes, self._hash(key))
+        return self._indexes[position % len(self._indexes)]
+
+
+def host_name(host: dict[str, Any]) -> str:
+    """Stable identity of a decoded channels_redis host, used on the ring."""
+    if "address" in host:
+        return host["address"]
+    if "master_name" in host:
+        return f"sentinel:{host['master_name']}"
+    return f"{host.get('host', 'localhost')}:{host.get('port', 6379)}"
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    :class:`RedisChannelLayer` that shards channels and groups across its
+    hosts on a :class:`HashRing`, so resizing the redis pool only reshuffles
+    a fraction of the groups.
+
+    A ``fakeredis://<name>`` host is served by an in-process fakeredis server,
+    for tests without a redis.
+    """
+
+    def __init__(self, *args, ring_replicas: int = 160, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ring = HashRing(
+            [host_name(host) for host in self.hosts], replicas=ring_replicas
+        )
+
+    def consistent_hash(self, value) -> int:
+        if self.ring_size == 1:
+            return 0
+        if isinstance(value, bytes):
+            value = value.decode()
+        return self.ring.get(value)
+
+    def create_pool(self, index):
+        host = self.hosts[index]
+        address = host.get("address", "")
+        if not address.startswith(FAKE_REDIS_SCHEME):
+            return create_pool(host)
+
+        return fake_redis_pool(address.removeprefix(FAKE_REDIS_SCHEME))
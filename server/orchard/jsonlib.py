@@ -0,0 +1,134 @@
+"""
+JSON encoding and decoding for the REST API (orchard.renderers,
+orchard.parsers) and websocket frames, by the library ``JSON_BACKEND``
+names: orjson, ujson or the standard library's json.
+
+Every backend writes compact UTF-8 JSON, and anything its library can't
+encode natively is encoded as DRF's JSONEncoder does, so they render the
+same JSON: UUIDs as strings, UTC datetimes ending in ``Z``, lazy strings,
+decimals and the rest.
+"""
+
+import importlib.util
+import json
+import logging
+from functools import cache
+from typing import Any
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("orjson", "ujson", "json")
+
+# what the libraries don't encode themselves
+_default = JSONEncoder().default
+
+
+def available(backend: str) -> bool:
+    """Whether the backend's library is installed."""
+    return backend == "json" or importlib.util.find_spec(backend) is not None
+
+
+class JSONBackend:
+    """The standard library's json, with DRF's encoder."""
+
+    name = "json"
+
+    def __init__(self):
+        self._encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(self, value: Any) -> str:
+        return self._encoder.encode(value)
+
+    def dumpb(self, value: Any) -> bytes:
+        return self.dumps(value).encode()
+
+    def loads(self, data: str | bytes) -> Any:
+        return json.loads(data)
+
+
+class UJSONBackend(JSONBackend):
+    """ujson: no UUIDs or datetimes, those go through DRF's encoder."""
+
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+
+        self._ujson = ujson
+
+    def dumps(self, value: Any) -> str:
+        return self._ujson.dumps(
+            value,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+            default=_default,
+        )
+
+    def loads(self, data: str | bytes) -> Any:
+        return self._ujson.loads(data)
+
+
+class ORJSONBackend(JSONBackend):
+    """
+    orjson: UUIDs and datetimes natively, UTC as ``Z``. It writes bytes, so
+    :meth:`dumpb` is the fast one.
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, value: Any) -> str:
+        return self.dumpb(value).decode()
+
+    def dumpb(self, value: Any) -> bytes:
+        return self._orjson.dumps(value, default=_default, option=self._option)
+
+    def loads(self, data: str | bytes) -> Any:
+        return self._orjson.loads(data)
+
+
+_BACKEND_CLASSES = {
+    "orjson": ORJSONBackend,
+    "ujson": UJSONBackend,
+    "json": JSONBackend,
+}
+
+
+@cache
+def get_json_backend() -> JSONBackend:
+    """
+    The backend ``JSON_BACKEND`` names, or the standard library's if its
+    library isn't installed.
+    """
+    name = settings.JSON_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name!r}")
+    if not available(name):
+        logger.warning(f"JSON backend {name} isn't installed, using json")
+        name = "json"
+    return _BACKEND_CLASSES[name]()
+
+
+def dumps(value: Any) -> str:
+    """``value`` as JSON text, e.g. a websocket text frame."""
+    return get_json_backend().dumps(value)
+
+
+def loads(data: str | bytes) -> Any:
+    return get_json_backend().loads(data)
+
+
+@receiver(setting_changed)
+def _reset_json_backend(setting: str, **kwargs):
+    if setting == "JSON_BACKEND":
+        get_json_backend.cache_clear()
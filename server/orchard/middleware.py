@@ -1,15 +1,12 @@
 import logging
 from urllib.parse import parse_qs
 
-from channels.db import database_sync_to_async
-from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AnonymousUser
 from django.http.request import HttpRequest
 from django.utils.deprecation import MiddlewareMixin
-from supabase import AuthError
 
+from orchard.authentication import aauthenticate_token, authenticate_request
 from orchard.services import SupabaseService
-from users.models import User
 
 logger = logging.getLogger(__name__)
 
@@ -19,13 +16,15 @@ class SupabaseAuthMiddleware:
     Middleware to handle Supabase authentication.
 
     Tries to get the current user from Bearer JWT token, if valid, or creates a new shadow user.
+    The result is shared with DRF's :class:`SupabaseJWTAuthentication` through
+    :func:`authenticate_request`, so each request is authenticated once.
+    Bearer requests are stateless, nothing is written to the session.
     """
 
     def __init__(self, get_response):
         logger.debug("SupabaseAuthMiddleware")
 
         self.get_response = get_response
-        self.supabase = SupabaseService()
 
     def __call__(self, request: HttpRequest):
         # Skip middleware if user is already authenticated
@@ -33,57 +32,19 @@ class SupabaseAuthMiddleware:
             logger.debug("user is authenticated")
             return self.get_response(request)
 
-        auth_header = request.META.get("HTTP_AUTHORIZATION")
+        result = authenticate_request(request)
 
-        if not auth_header or not auth_header.startswith("Bearer "):
+        if result is None:
             logger.debug("No valid JWT token provided")
             return self.get_response(request)
 
-        token = auth_header.split(" ")[1]
-        logger.debug(f"token is {token[:20]}...")
-
-        if token:
-            try:
-                # Verify the token
-                token_user = self.supabase.get_user(token)
-
-                # Get or create the user
-                if (
-                    token_user
-                    and (user_id := token_user.user.id)
-                    and (email := token_user.user.email)
-                ):
-                    try:
-                        logger.debug(f"user_id is {user_id}")
-                        user = User.objects.get(id=user_id)
-                    except User.DoesNotExist:
-                        logger.debug("user does not exist, creating")
-                        # Create a new user if they don't exist with fields we have already
-                        user = User.objects.create(
-                            id=user_id,
-                            username=token_user.user.user_metadata.get(
-                                "username"
-                            ),
-                            display_name=token_user.user.user_metadata.get(
-                                "display_name"
-                            ),
-                            email=email,
-                            password=make_password(None),
-                        )
-                        logger.debug(f"created user: {user}")
-
-                    request.user = user
-                    request.supabase_user = token_user
-                    request.session["supabase_token"] = token
-
-                    return self.get_response(request)
-                else:
-                    logger.debug("user with token not found or email not found")
-
-            except AuthError as e:
-                logger.debug(f"AuthError: {e.message}")
-
-        logger.debug("user is anonymous")
+        if result.user is not None:
+            request.user = result.user
+            request.supabase_user = result.claims
+
+            return self.get_response(request)
+
+        logger.debug(f"user is anonymous: {result.error}")
         request.user = AnonymousUser()
 
         return self.get_response(request)
@@ -95,7 +56,10 @@ class SupabaseSessionMiddleware(MiddlewareMixin):
     """
 
     def process_request(self, request: HttpRequest):
-        if request.user.is_authenticated:
+        if authenticate_request(request) is not None:
+            # stateless bearer request, there is no supabase session to restore
+            request.supabase = SupabaseService()
+        elif request.user.is_authenticated:
             # print(request.session.items())
             session = request.session.get("supabase_session")
             logger.debug(f"session={session}")
@@ -110,49 +74,35 @@ class SupabaseSessionMiddleware(MiddlewareMixin):
             request.supabase = SupabaseService()
 
 
-@database_sync_to_async
-def get_supabase_user(user_id):
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        logger.error(f"User with id {user_id} not found")
-        raise Exception("User not found. Please complete onboarding")
-
-    return user
+def get_query_token(scope) -> str | None:
+    """Bearer token from the query string: ws://.../?token=XYZ"""
+    query_string = scope.get("query_string", b"").decode()
+    return parse_qs(query_string).get("token", [None])[0]
 
 
 class SupabaseChannelsAuthMiddleware:
     """
     Middleware to handle Supabase authentication for channels.
 
-    Tries to get the current user from Bearer JWT token, if valid.
+    Resolves the token once, before the consumer runs, without blocking the
+    event loop (see :func:`aauthenticate_token`). ``scope["user"]`` is the user
+    or :class:`AnonymousUser`, ``scope["auth"]`` the :class:`BearerAuthResult`
+    (``None`` without a token) so consumers can tell why it failed.
     """
 
     def __init__(self, app):
         self.app = app
 
     async def __call__(self, scope, receive, send):
-        # Extract token from query string: ws://.../?token=XYZ
-        query_string = scope.get("query_string", b"").decode()
-        query_params = parse_qs(query_string)
-        token = query_params.get("token", [None])[0]
-
-        if token:
-            try:
-                # Verify the token
-                token_user = self.supabase.get_user(token)
-
-                # Get or create the user
-                if (
-                    token_user
-                    and (user_id := token_user.user.id)
-                    and token_user.user.email
-                ):
-                    # Fetch/Create the Shadow User in the DB
-                    scope["user"] = await get_supabase_user(user_id)
-            except Exception:
-                scope["user"] = AnonymousUser()
-        else:
-            scope["user"] = AnonymousUser()
+        token = get_query_token(scope)
+        client = scope.get("client") or (None, None)
+
+        result = await aauthenticate_token(token, client[0]) if token else None
+
+        scope = dict(scope)
+        scope["auth"] = result
+        scope["user"] = (
+            result.user if result and result.user else AnonymousUser()
+        )
 
         return await self.app(scope, receive, send)
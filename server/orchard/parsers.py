@@ -0,0 +1,24 @@
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from orchard.jsonlib import get_json_backend
+from orchard.renderers import JSONRenderer
+
+
+class JSONParser(parsers.JSONParser):
+    """DRF's JSONParser, decoding with the JSON_BACKEND (see orchard.jsonlib)."""
+
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        try:
+            data = stream.read()
+            if encoding.lower() not in ("utf-8", "utf8"):
+                data = data.decode(encoding)
+            return get_json_backend().loads(data)
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {exc}") from None
@@ -0,0 +1,64 @@
+import asyncio
+
+FAKE_REDIS_SCHEME = "fakeredis://"
+
+# fakeredis://<name> -> in-process server, shared by every client in the process
+_fake_servers: dict[str, object] = {}
+
+
+def fake_redis_pool(name: str):
+    """Async connection pool to the in-process fakeredis server ``name``."""
+    import fakeredis
+    from redis.asyncio import ConnectionPool
+
+    server = _fake_servers.setdefault(name, fakeredis.FakeServer())
+    return ConnectionPool(
+        connection_class=fakeredis.FakeAsyncRedisConnection,
+        server=server,
+    )
+
+
+class LoopRedisClient:
+    """
+    Async redis client for ``url``, one per running event loop.
+
+    redis connections can't be shared between event loops, and sync code
+    (views) reaches async stores through async_to_sync, which runs each call
+    on a loop of its own. ``fakeredis://<name>`` urls are served in-process.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        # event loop -> (client, registered lua scripts)
+        self._clients: dict[asyncio.AbstractEventLoop, tuple] = {}
+
+    def get(self):
+        return self._entry()[0]
+
+    def script(self, source: str):
+        """``source`` registered as a lua script on this loop's client."""
+        client, scripts = self._entry()
+        script = scripts.get(source)
+        if script is None:
+            script = scripts[source] = client.register_script(source)
+        return script
+
+    def _entry(self):
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            self._clients = {
+                other: entry
+                for other, entry in self._clients.items()
+                if not other.is_closed()
+            }
+            entry = self._clients[loop] = (self._create_client(), {})
+        return entry
+
+    def _create_client(self):
+        from redis.asyncio import Redis
+
+        if self.url.startswith(FAKE_REDIS_SCHEME):
+            name = self.url.removeprefix(FAKE_REDIS_SCHEME)
+            return Redis(connection_pool=fake_redis_pool(name))
+        return Redis.from_url(self.url)
@@ -0,0 +1,27 @@
+from rest_framework import renderers
+
+from orchard.jsonlib import get_json_backend
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    DRF's JSONRenderer, encoding with the JSON_BACKEND (see orchard.jsonlib).
+
+    Indented JSON, asked for with ``Accept: application/json; indent=4`` or
+    by the browsable API, is left to DRF's.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = get_json_backend().dumpb(data)
+        # escaped like DRF's, so the JSON is a strict javascript subset
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
@@ -1,7 +1,12 @@
 import logging
+from functools import cache
 
+import httpx
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from supabase import Client, create_client
+from supabase.lib.client_options import SyncClientOptions
 from supabase_auth.types import (
     AdminUserAttributes,
     UserAttributes,
@@ -11,22 +16,82 @@ from supabase_auth.types import (
 logger = logging.getLogger(__name__)
 
 
+@cache
+def get_http_client() -> httpx.Client:
+    """
+    Process-wide connection pool for all supabase calls.
+
+    Auth headers are sent per request, so it is safe to share between the
+    service client and user-scoped clients.
+    """
+    return httpx.Client(
+        http2=True,
+        follow_redirects=True,
+        timeout=settings.SUPABASE_HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_HTTP_MAX_CONNECTIONS,
+        ),
+    )
+
+
+def _create_client() -> Client:
+    return create_client(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_SECRET_KEY,
+        options=SyncClientOptions(
+            httpx_client=get_http_client(),
+            # no background refresh timers or shared session storage
+            auto_refresh_token=False,
+            persist_session=False,
+        ),
+    )
+
+
+@cache
+def get_service_client() -> Client:
+    """
+    Shared, lazily created client for stateless calls (``get_user(jwt)``,
+    admin calls). Never set a session on it.
+    """
+    return _create_client()
+
+
+@receiver(setting_changed)
+def _reset_clients(setting: str, **kwargs):
+    if setting.startswith("SUPABASE_"):
+        get_service_client.cache_clear()
+        get_http_client.cache_clear()
+
+
 class SupabaseService:
     """
     Encapsulates Supabase service interactions. Only .get_user() is used for now.
+
+    Cheap to create per request: stateless calls go through the shared
+    service client, and a user-scoped client (which holds session state) is
+    only built, on the shared connection pool, when a call needs one.
     """
 
     def __init__(self, session=None):
-        self.supabase: Client = create_client(
-            settings.SUPABASE_URL, settings.SUPABASE_SECRET_KEY
-        )
-        if session:
-            self.supabase.auth.set_session(
-                session.get("access_token"), session.get("refresh_token")
-            )
-        self.service_client: Client = create_client(
-            settings.SUPABASE_URL, settings.SUPABASE_SECRET_KEY
-        )
+        self.session = session
+        self._supabase: Client | None = None
+
+    @property
+    def service_client(self) -> Client:
+        return get_service_client()
+
+    @property
+    def supabase(self) -> Client:
+        """User-scoped client, restored from ``session`` if there is one."""
+        if self._supabase is None:
+            self._supabase = _create_client()
+            if self.session:
+                self._supabase.auth.set_session(
+                    self.session.get("access_token"),
+                    self.session.get("refresh_token"),
+                )
+        return self._supabase
 
     def sign_up(self, email: str, password: str):
         """Sign up a new user"""
@@ -69,7 +134,9 @@ class SupabaseService:
 
     def get_user(self, jwt: str | None = None) -> UserResponse | None:
         """Get the current user's data."""
-        return self.supabase.auth.get_user(jwt)
+        if jwt:
+            return self.service_client.auth.get_user(jwt)
+        return self.supabase.auth.get_user()
 
     def update_user(self, data: UserAttributes):
         """Update a user's data."""
@@ -47,6 +47,37 @@ if SUPABASE_SECRET_KEY is None:
 # if SUPABASE_JWT_KEY is None:
 #     raise ValueError("SUPABASE_JWT_KEY environment variable is not set")
 
+# one pooled http client per process is shared by all supabase calls
+SUPABASE_HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "10"))
+SUPABASE_HTTP_MAX_CONNECTIONS = int(
+    os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20")
+)
+
+# "local" verifies access tokens in-process (SUPABASE_JWT_KEY for HS256,
+# the project JWKS for RS256/ES256), "remote" asks supabase auth every time
+SUPABASE_JWT_VERIFICATION = os.getenv("SUPABASE_JWT_VERIFICATION", "local")
+# ask supabase auth when a token can't be verified locally (no key, jwks down)
+SUPABASE_JWT_REMOTE_FALLBACK = (
+    os.getenv("SUPABASE_JWT_REMOTE_FALLBACK", "False") == "True"
+)
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWT_LEEWAY = int(os.getenv("SUPABASE_JWT_LEEWAY", "0"))
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL", f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json"
+)
+SUPABASE_JWKS_TTL = int(os.getenv("SUPABASE_JWKS_TTL", "600"))
+
+# per-process LRU cache of verified token -> user, see orchard.auth_cache
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
+# tokens that failed verification are rejected from memory for a while
+AUTH_NEGATIVE_CACHE_SIZE = int(os.getenv("AUTH_NEGATIVE_CACHE_SIZE", "10000"))
+AUTH_NEGATIVE_CACHE_TTL = float(os.getenv("AUTH_NEGATIVE_CACHE_TTL", "30"))
+# per-ip token bucket on failed authentications (burst, refill per second)
+AUTH_FAILURE_BURST = float(os.getenv("AUTH_FAILURE_BURST", "20"))
+AUTH_FAILURE_RATE = float(os.getenv("AUTH_FAILURE_RATE", "1"))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -182,6 +213,15 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "orchard.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "orchard.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "orchard.authentication.SupabaseJWTAuthentication",
         # "rest_framework.authentication.BasicAuthentication",
@@ -223,11 +263,99 @@ CSRF_COOKIE_SECURE = True
 
 # Channels
 ASGI_APPLICATION = "orchard.asgi.application"
+# comma separated redis urls, channels and groups are sharded across them on
+# a consistent hash ring. Without any, the in-memory layer is used, which only
+# delivers within a single process.
+CHANNEL_REDIS_HOSTS = [
+    host for host in os.getenv("CHANNEL_REDIS_HOSTS", "").split(",") if host
+]
+# tests use the in-memory layer unless e.g. redis://localhost:6379/15 or
+# fakeredis://test is given here
+if "test" in sys.argv:
+    CHANNEL_REDIS_HOSTS = [
+        host
+        for host in os.getenv("TEST_CHANNEL_REDIS_HOSTS", "").split(",")
+        if host
+    ]
+# messages buffered per channel before sends fail with ChannelFull
+CHANNEL_LAYER_CAPACITY = int(os.getenv("CHANNEL_LAYER_CAPACITY", "100"))
+# seconds an undelivered message is kept
+CHANNEL_LAYER_EXPIRY = int(os.getenv("CHANNEL_LAYER_EXPIRY", "60"))
+# seconds a channel stays in a group without being re-added
+CHANNEL_LAYER_GROUP_EXPIRY = int(
+    os.getenv("CHANNEL_LAYER_GROUP_EXPIRY", "86400")
+)
+CHANNEL_LAYER_PREFIX = os.getenv("CHANNEL_LAYER_PREFIX", "asgi")
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        "BACKEND": "orchard.channel_layers.ShardedRedisChannelLayer",
+        "CONFIG": {
+            "hosts": CHANNEL_REDIS_HOSTS,
+            "capacity": CHANNEL_LAYER_CAPACITY,
+            "expiry": CHANNEL_LAYER_EXPIRY,
+            "group_expiry": CHANNEL_LAYER_GROUP_EXPIRY,
+            "prefix": CHANNEL_LAYER_PREFIX,
+        },
     }
 }
+if not CHANNEL_REDIS_HOSTS:
+    CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    }
+
+# who is online, see bunch.presence. "memory" only sees the sockets of its
+# own process, "redis" is shared by all processes (defaults to the first
+# channel layer host)
+PRESENCE_REDIS_URL = os.getenv(
+    "PRESENCE_REDIS_URL", next(iter(CHANNEL_REDIS_HOSTS), "")
+)
+PRESENCE_STORE = os.getenv(
+    "PRESENCE_STORE", "redis" if PRESENCE_REDIS_URL else "memory"
+)
+# seconds a connection stays online without a ping (keepalive connections)
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "120"))
+PRESENCE_KEEPALIVE_TTL = float(os.getenv("PRESENCE_KEEPALIVE_TTL", "600"))
+# seconds between sweeps of expired connections
+PRESENCE_SWEEP_INTERVAL = float(os.getenv("PRESENCE_SWEEP_INTERVAL", "30"))
+
+# Recent broadcasts per channel, replayed to clients resubscribing with
+# last_seq: "memory" (per process), "redis" or a dotted ReplayBuffer path
+REPLAY_REDIS_URL = os.getenv("REPLAY_REDIS_URL", PRESENCE_REDIS_URL)
+REPLAY_BUFFER = os.getenv(
+    "REPLAY_BUFFER", "redis" if REPLAY_REDIS_URL else "memory"
+)
+REPLAY_BUFFER_SIZE = int(os.getenv("REPLAY_BUFFER_SIZE", "256"))
+# most messages replayed from the database past the buffer, before the
+# client is told to resync instead
+REPLAY_DB_LIMIT = int(os.getenv("REPLAY_DB_LIMIT", "500"))
+
+# Write-behind saving of websocket messages, see bunch.batching: messages
+# arriving within MESSAGE_BATCH_MAX_DELAY seconds, up to MESSAGE_BATCH_MAX_SIZE,
+# are inserted together and broadcast once their batch commits
+MESSAGE_BATCHING = os.getenv("MESSAGE_BATCHING", "False") == "True"
+MESSAGE_BATCH_MAX_SIZE = int(os.getenv("MESSAGE_BATCH_MAX_SIZE", "100"))
+MESSAGE_BATCH_MAX_DELAY = float(os.getenv("MESSAGE_BATCH_MAX_DELAY", "0.005"))
+
+# Frames waiting to be written to one websocket, see bunch.send_queue. Past
+# the bound presence/typing frames are dropped, then "disconnect" closes the
+# connection with a resume hint and "block" holds up the channel layer
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_SEND_QUEUE_POLICY = os.getenv("WS_SEND_QUEUE_POLICY", "disconnect")
+
+# Library encoding the REST API's JSON and websocket frames, see
+# orchard.jsonlib: "orjson" (the orjson extra), "ujson" or "json" (the
+# standard library's, also used when the one named isn't installed)
+JSON_BACKEND = os.getenv("JSON_BACKEND", "ujson")
+
+# Broadcasts of REST changes go through an outbox table, see bunch.outbox:
+# "thread" dispatches from a thread of each web process, "command" leaves it
+# to `manage.py dispatch_outbox`. Failed sends are retried after
+# OUTBOX_RETRY_DELAY seconds, doubling, up to OUTBOX_MAX_ATTEMPTS times.
+OUTBOX_DISPATCHER = os.getenv("OUTBOX_DISPATCHER", "thread")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", "0.5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
 
 # Logging Configuration
 LOGGING = {
@@ -0,0 +1,661 @@
+import io
+import json
+import time
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import jwt
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from rest_framework import exceptions
+
+from orchard.auth_cache import TokenUserCache, get_token_user_cache
+from orchard.authentication import (
+    SupabaseJWTAuthentication,
+    aauthenticate_token,
+)
+from orchard.middleware import SupabaseChannelsAuthMiddleware
+from orchard.routing import websocket_urlpatterns
+from orchard.throttling import (
+    AuthFailureLimiter,
+    get_auth_failure_limiter,
+    get_negative_token_cache,
+)
+from orchard.tokens import TokenError, TokenVerifier, verify_token
+from users.models import User
+
+JWT_KEY = "test-jwt-secret-that-is-long-enough-for-hs256"
+
+
+def reset_auth_state():
+    get_token_user_cache().clear()
+    get_negative_token_cache().clear()
+    get_auth_failure_limiter().clear()
+
+
+def make_token(
+    user: User, key=JWT_KEY, algorithm="HS256", headers=None, **claims
+):
+    payload = {
+        "sub": str(user.id),
+        "email": user.email,
+        "aud": "authenticated",
+        "exp": int(time.time()) + 3600,
+        "user_metadata": {"username": user.username},
+        **claims,
+    }
+    payload = {k: v for k, v in payload.items() if v is not None}
+    return jwt.encode(payload, key, algorithm=algorithm, headers=headers)
+
+
+@override_settings(
+    SUPABASE_JWT_KEY=JWT_KEY,
+    SUPABASE_JWT_VERIFICATION="local",
+    SUPABASE_JWT_REMOTE_FALLBACK=False,
+    SUPABASE_JWKS_URL=None,
+)
+class LocalJWTAuthenticationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user_id",
+            email="user@example.com",
+            password="userpass",
+        )
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.auth = SupabaseJWTAuthentication()
+        reset_auth_state()
+        remote_patch = patch("orchard.tokens.SupabaseService.get_user")
+        self.remote_get_user = remote_patch.start()
+        self.addCleanup(remote_patch.stop)
+
+    def authenticate(self, token):
+        request = self.factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.auth.authenticate(request)
+
+    def test_valid_token_is_verified_locally(self):
+        user, claims = self.authenticate(make_token(self.user))
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(claims.user_id, str(self.user.id))
+        self.assertEqual(claims.user_metadata["username"], "user_id")
+        self.remote_get_user.assert_not_called()
+
+    def test_no_header(self):
+        request = self.factory.get("/")
+        self.assertIsNone(self.auth.authenticate(request))
+
+    def test_expired_token(self):
+        token = make_token(self.user, exp=int(time.time()) - 10)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+        self.remote_get_user.assert_not_called()
+
+    def test_wrong_audience(self):
+        token = make_token(self.user, aud="anon")
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_missing_subject(self):
+        token = make_token(self.user, sub=None)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_bad_signature(self):
+        token = make_token(self.user, key="some-other-secret-of-sufficient-len")
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_unknown_user_without_username(self):
+        stranger = User(id=uuid.uuid4(), email="nobody@example.com")
+        token = make_token(stranger, user_metadata={})
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_garbage_token(self):
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate("not-a-jwt")
+
+    @override_settings(SUPABASE_JWT_KEY=None)
+    def test_no_key_without_fallback(self):
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(make_token(self.user))
+        self.remote_get_user.assert_not_called()
+
+    @override_settings(SUPABASE_JWT_KEY=None, SUPABASE_JWT_REMOTE_FALLBACK=True)
+    def test_no_key_falls_back_to_remote(self):
+        self.remote_get_user.return_value = SimpleNamespace(
+            user=SimpleNamespace(
+                id=str(self.user.id),
+                email=self.user.email,
+                user_metadata={},
+            )
+        )
+
+        user, _ = self.authenticate(make_token(self.user))
+
+        self.assertEqual(user, self.user)
+        self.remote_get_user.assert_called_once()
+
+    @override_settings(SUPABASE_JWT_VERIFICATION="remote")
+    def test_remote_mode(self):
+        self.remote_get_user.return_value = SimpleNamespace(
+            user=SimpleNamespace(
+                id=str(self.user.id),
+                email=self.user.email,
+                user_metadata={},
+            )
+        )
+
+        user, claims = self.authenticate(make_token(self.user))
+
+        self.assertEqual(user, self.user)
+        self.assertFalse(claims.expired)
+        self.remote_get_user.assert_called_once()
+
+
+@override_settings(
+    SUPABASE_JWT_KEY=JWT_KEY,
+    SUPABASE_JWT_VERIFICATION="local",
+    AUTH_USER_CACHE_SIZE=100,
+    AUTH_USER_CACHE_TTL=60,
+)
+class TokenUserCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user_id",
+            email="user@example.com",
+            password="userpass",
+        )
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.auth = SupabaseJWTAuthentication()
+        self.cache = get_token_user_cache()
+        reset_auth_state()
+        self.token = make_token(self.user)
+
+    def authenticate(self):
+        request = self.factory.get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {self.token}"
+        )
+        return self.auth.authenticate(request)
+
+    def test_second_request_hits_cache(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_profile_edit_invalidates(self):
+        self.authenticate()
+
+        self.user.bio = "new bio"
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertEqual(user.bio, "new bio")
+
+    def test_deactivation_invalidates(self):
+        self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_cached_user_is_a_copy(self):
+        user, _ = self.authenticate()
+        user.bio = "mutated by a view"
+
+        user, _ = self.authenticate()
+        self.assertNotEqual(user.bio, "mutated by a view")
+
+    def test_entry_expires_with_token(self):
+        self.token = make_token(self.user, exp=int(time.time()) + 5)
+        self.authenticate()
+
+        with patch(
+            "orchard.auth_cache.time.time", return_value=time.time() + 6
+        ):
+            self.assertIsNone(self.cache.get(self.token))
+
+    def test_entry_expires_after_ttl(self):
+        cache = TokenUserCache(maxsize=10, ttl=1)
+        _, claims = self.authenticate()
+        cache.set(self.token, self.user, claims)
+
+        self.assertIsNotNone(cache.get(self.token))
+        with patch(
+            "orchard.auth_cache.time.time", return_value=time.time() + 2
+        ):
+            self.assertIsNone(cache.get(self.token))
+
+    def test_lru_bound(self):
+        cache = TokenUserCache(maxsize=2, ttl=60)
+        _, claims = self.authenticate()
+        tokens = [make_token(self.user, jti=str(i)) for i in range(3)]
+
+        for token in tokens:
+            cache.set(token, self.user, claims)
+        # touch the oldest so the second one is evicted instead
+        self.assertIsNone(cache.get(tokens[0]))
+        self.assertIsNotNone(cache.get(tokens[1]))
+
+        cache.set(tokens[0], self.user, claims)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(tokens[2]))
+
+
+@override_settings(
+    SUPABASE_JWT_KEY=JWT_KEY,
+    SUPABASE_JWT_VERIFICATION="local",
+    SUPABASE_JWT_REMOTE_FALLBACK=False,
+)
+class AuthPipelineTest(TestCase):
+    """
+    Full middleware + DRF stack, nothing mocked but supabase auth itself.
+    """
+
+    me_url = "/api/v1/user/me/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user_id",
+            email="user@example.com",
+            password="userpass",
+        )
+
+    def setUp(self):
+        reset_auth_state()
+        remote_patch = patch(
+            "orchard.tokens.SupabaseService.get_user",
+            return_value=SimpleNamespace(
+                user=SimpleNamespace(
+                    id=str(self.user.id),
+                    email=self.user.email,
+                    user_metadata={},
+                )
+            ),
+        )
+        self.remote_get_user = remote_patch.start()
+        self.addCleanup(remote_patch.stop)
+
+    def get_me(self, token):
+        return self.client.get(
+            self.me_url, HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+    def test_token_verified_once_per_request(self):
+        token = make_token(self.user)
+
+        with patch(
+            "orchard.authentication.verify_token", wraps=verify_token
+        ) as verify:
+            # user lookup + the serializer's groups
+            with self.assertNumQueries(2):
+                response = self.get_me(token)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], str(self.user.id))
+        verify.assert_called_once()
+
+    def test_cached_request_only_queries_view(self):
+        token = make_token(self.user)
+        self.get_me(token)
+
+        with patch("orchard.authentication.verify_token") as verify:
+            with self.assertNumQueries(1):
+                response = self.get_me(token)
+
+        self.assertEqual(response.status_code, 200)
+        verify.assert_not_called()
+
+    @override_settings(SUPABASE_JWT_VERIFICATION="remote")
+    def test_one_remote_call_per_request(self):
+        response = self.get_me(make_token(self.user))
+
+        self.assertEqual(response.status_code, 200)
+        self.remote_get_user.assert_called_once()
+
+    def test_no_session_write(self):
+        response = self.get_me(make_token(self.user))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_invalid_token_rejected(self):
+        token = make_token(self.user, exp=int(time.time()) - 10)
+
+        response = self.get_me(token)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["detail"], "Token error")
+
+    def test_unknown_user_is_created_once(self):
+        user_id = uuid.uuid4()
+        stranger = User(id=user_id, email="new@example.com", username="new")
+
+        response = self.get_me(make_token(stranger))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["username"], "new")
+        self.assertEqual(User.objects.filter(id=user_id).count(), 1)
+
+
+@override_settings(
+    SUPABASE_JWT_KEY=JWT_KEY,
+    SUPABASE_JWT_VERIFICATION="local",
+    AUTH_FAILURE_BURST=3,
+    AUTH_FAILURE_RATE=1,
+)
+class AuthFailureThrottlingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user_id",
+            email="user@example.com",
+            password="userpass",
+        )
+
+    def setUp(self):
+        reset_auth_state()
+        self.factory = RequestFactory()
+        self.auth = SupabaseJWTAuthentication()
+
+    def authenticate(self, token, ip="10.0.0.1"):
+        request = self.factory.get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {token}", REMOTE_ADDR=ip
+        )
+        return self.auth.authenticate(request)
+
+    def test_bad_token_is_verified_once(self):
+        token = make_token(self.user, exp=int(time.time()) - 10)
+
+        with patch(
+            "orchard.authentication.verify_token", wraps=verify_token
+        ) as verify:
+            for _ in range(3):
+                with self.assertRaises(exceptions.AuthenticationFailed):
+                    self.authenticate(token)
+
+        verify.assert_called_once()
+        self.assertEqual(get_negative_token_cache().hits, 2)
+
+    def test_repeated_failures_are_throttled(self):
+        for _ in range(3):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate("garbage")
+
+        # even a valid token is refused until the bucket refills
+        with self.assertRaises(exceptions.Throttled) as ctx:
+            self.authenticate(make_token(self.user))
+        self.assertGreater(ctx.exception.wait, 0)
+
+        # other clients are unaffected
+        user, _ = self.authenticate(make_token(self.user), ip="10.0.0.2")
+        self.assertEqual(user, self.user)
+
+    def test_cached_token_is_not_throttled(self):
+        token = make_token(self.user)
+        self.authenticate(token)
+        for _ in range(3):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate("garbage")
+
+        # someone else behind the same address is failing, not this token
+        user, _ = self.authenticate(token)
+        self.assertEqual(user, self.user)
+        with self.assertRaises(exceptions.Throttled):
+            self.authenticate(make_token(self.user, exp=int(time.time()) + 60))
+
+    def test_transient_failure_is_not_remembered(self):
+        token = make_token(self.user)
+
+        with override_settings(SUPABASE_JWT_KEY=None):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate(token)
+
+        user, _ = self.authenticate(token)
+        self.assertEqual(user, self.user)
+
+    def test_bucket_refills(self):
+        limiter = AuthFailureLimiter(burst=2, rate=10)
+        now = time.monotonic()
+
+        with patch("orchard.throttling.time.monotonic", return_value=now):
+            limiter.record_failure("ip")
+            limiter.record_failure("ip")
+            self.assertFalse(limiter.allowed("ip"))
+            self.assertAlmostEqual(limiter.retry_after("ip"), 0.1)
+
+        with patch("orchard.throttling.time.monotonic", return_value=now + 0.2):
+            self.assertTrue(limiter.allowed("ip"))
+
+    def test_limiter_is_bounded(self):
+        limiter = AuthFailureLimiter(burst=1, rate=0, max_clients=2)
+        for ip in ("a", "b", "c"):
+            limiter.record_failure(ip)
+
+        # "a" was evicted, so it starts over with a full bucket
+        self.assertTrue(limiter.allowed("a"))
+        self.assertFalse(limiter.allowed("c"))
+
+
+class JWKSTokenVerifierTest(TestCase):
+    def setUp(self):
+        self.private_key = ec.generate_private_key(ec.SECP256R1())
+        jwk = jwt.algorithms.ECAlgorithm.to_jwk(
+            self.private_key.public_key(), as_dict=True
+        )
+        jwk.update({"kid": "key-1", "alg": "ES256", "use": "sig"})
+        self.jwks = {"keys": [jwk]}
+        self.user = User(id=uuid.uuid4(), email="user@example.com")
+
+    def urlopen(self, *args, **kwargs):
+        return io.BytesIO(json.dumps(self.jwks).encode())
+
+    def test_es256_token_verified_with_cached_jwks(self):
+        verifier = TokenVerifier(jwks_url="https://example.invalid/jwks.json")
+
+        with patch(
+            "jwt.jwks_client.urllib.request.urlopen",
+            side_effect=self.urlopen,
+        ) as fetch:
+            for _ in range(3):
+                token = make_token(
+                    self.user,
+                    key=self.private_key,
+                    algorithm="ES256",
+                    headers={"kid": "key-1"},
+                )
+                claims = verifier.verify(token)
+                self.assertEqual(claims.user_id, str(self.user.id))
+
+        fetch.assert_called_once()
+
+    def test_es256_token_with_wrong_key(self):
+        verifier = TokenVerifier(jwks_url="https://example.invalid/jwks.json")
+        other_key = ec.generate_private_key(ec.SECP256R1())
+        token = make_token(
+            self.user,
+            key=other_key,
+            algorithm="ES256",
+            headers={"kid": "key-1"},
+        )
+
+        with patch(
+            "jwt.jwks_client.urllib.request.urlopen",
+            side_effect=self.urlopen,
+        ):
+            with self.assertRaises(TokenError):
+                verifier.verify(token)
+
+    @override_settings(
+        SUPABASE_JWT_KEY=None,
+        SUPABASE_JWT_VERIFICATION="local",
+        SUPABASE_JWT_REMOTE_FALLBACK=False,
+        SUPABASE_JWKS_URL=None,
+    )
+    def test_asymmetric_token_without_jwks(self):
+        token = make_token(
+            self.user,
+            key=self.private_key,
+            algorithm="ES256",
+            headers={"kid": "key-1"},
+        )
+        with self.assertRaises(TokenError):
+            verify_token(token)
+
+    def test_needs_network_until_jwks_is_cached(self):
+        verifier = TokenVerifier(jwks_url="https://example.invalid/jwks.json")
+        token = make_token(
+            self.user,
+            key=self.private_key,
+            algorithm="ES256",
+            headers={"kid": "key-1"},
+        )
+        unknown_kid = make_token(
+            self.user,
+            key=self.private_key,
+            algorithm="ES256",
+            headers={"kid": "key-2"},
+        )
+
+        self.assertTrue(verifier.needs_network(token))
+        with patch(
+            "jwt.jwks_client.urllib.request.urlopen",
+            side_effect=self.urlopen,
+        ):
+            verifier.verify(token)
+
+        self.assertFalse(verifier.needs_network(token))
+        self.assertTrue(verifier.needs_network(unknown_kid))
+        self.assertFalse(verifier.needs_network(make_token(self.user)))
+
+
+@override_settings(
+    SUPABASE_JWT_KEY=JWT_KEY,
+    SUPABASE_JWT_VERIFICATION="local",
+    SUPABASE_JWT_REMOTE_FALLBACK=False,
+    SUPABASE_JWKS_URL=None,
+)
+class ChannelsAuthTest(TransactionTestCase):
+    def setUp(self):
+        reset_auth_state()
+        self.user = User.objects.create_user(
+            username="user_id", email="user@example.com", password=None
+        )
+        self.application = SupabaseChannelsAuthMiddleware(
+            URLRouter(websocket_urlpatterns)
+        )
+
+    def communicator(self, token=None, client=("10.0.0.1", 1234)):
+        path = "/ws/bunch/?connection_id=conn-1"
+        if token:
+            path += f"&token={token}"
+        communicator = WebsocketCommunicator(self.application, path)
+        communicator.scope["client"] = client
+        return communicator
+
+    async def test_async_authentication(self):
+        result = await aauthenticate_token(make_token(self.user))
+
+        self.assertEqual(result.user, self.user)
+        self.assertIsNone(result.error)
+
+    async def test_async_authentication_creates_user(self):
+        new_user = User(
+            id=uuid.uuid4(), username="new_user", email="new@example.com"
+        )
+        result = await aauthenticate_token(make_token(new_user))
+
+        self.assertEqual(str(result.user.pk), str(new_user.id))
+        self.assertTrue(await User.objects.filter(id=new_user.id).aexists())
+
+    async def test_local_verification_does_not_use_a_thread(self):
+        with patch("orchard.tokens.sync_to_async") as to_thread:
+            result = await aauthenticate_token(make_token(self.user))
+
+        self.assertIsNotNone(result.user)
+        to_thread.assert_not_called()
+
+    async def test_middleware_resolves_scope_user(self):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        middleware = SupabaseChannelsAuthMiddleware(app)
+        token = make_token(self.user)
+
+        await middleware(
+            {"type": "websocket", "query_string": f"token={token}".encode()},
+            None,
+            None,
+        )
+        await middleware({"type": "websocket", "query_string": b""}, None, None)
+
+        self.assertEqual(scopes[0]["user"], self.user)
+        self.assertIsNone(scopes[0]["auth"].error)
+        self.assertFalse(scopes[1]["user"].is_authenticated)
+        self.assertIsNone(scopes[1]["auth"])
+
+    async def test_connect(self):
+        communicator = self.communicator(make_token(self.user))
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        response = await communicator.receive_json_from()
+        self.assertEqual(response["type"], "connection_established")
+
+        await communicator.disconnect()
+
+    async def test_connect_without_token(self):
+        communicator = self.communicator()
+
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+    async def test_connect_with_bad_token(self):
+        communicator = self.communicator(make_token(self.user, key="x" * 32))
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        output = await communicator.receive_output()
+        self.assertEqual(output, {"type": "websocket.close", "code": 4003})
+
+    @override_settings(AUTH_FAILURE_BURST=1)
+    async def test_connect_throttled_before_accept(self):
+        bad_token = make_token(self.user, key="x" * 32)
+
+        communicator = self.communicator(bad_token)
+        await communicator.connect()
+        await communicator.receive_output()
+
+        communicator = self.communicator(make_token(self.user))
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4029)
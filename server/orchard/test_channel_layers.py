@@ -0,0 +1,82 @@
+import importlib.util
+import unittest
+import uuid
+
+from django.test import SimpleTestCase
+
+from orchard.channel_layers import HashRing, ShardedRedisChannelLayer
+
+
+class HashRingTest(SimpleTestCase):
+    def setUp(self):
+        self.keys = [f"chat_{uuid.uuid4()}_{uuid.uuid4()}" for _ in range(5000)]
+
+    def test_lookup_is_stable(self):
+        ring = HashRing(["redis://a", "redis://b", "redis://c"])
+        other = HashRing(["redis://a", "redis://b", "redis://c"])
+
+        for key in self.keys[:100]:
+            self.assertEqual(ring.get(key), other.get(key))
+
+    def test_keys_are_spread(self):
+        ring = HashRing(["redis://a", "redis://b", "redis://c"])
+
+        counts = [0, 0, 0]
+        for key in self.keys:
+            counts[ring.get(key)] += 1
+
+        for count in counts:
+            self.assertGreater(count, len(self.keys) / 3 * 0.8)
+
+    def test_adding_a_node_moves_few_keys(self):
+        nodes = ["redis://a", "redis://b", "redis://c"]
+        before = HashRing(nodes)
+        after = HashRing([*nodes, "redis://d"])
+
+        moved = sum(before.get(k) != after.get(k) for k in self.keys)
+
+        # ~1/4 of the keys go to the new node, none move between old nodes
+        self.assertLess(moved / len(self.keys), 0.35)
+        for key in self.keys:
+            if before.get(key) != after.get(key):
+                self.assertEqual(after.get(key), 3)
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("fakeredis"), "fakeredis is not installed"
+)
+class ShardedRedisChannelLayerTest(SimpleTestCase):
+    def make_layer(self, name):
+        return ShardedRedisChannelLayer(
+            hosts=[f"fakeredis://{name}-a", f"fakeredis://{name}-b"],
+            prefix=f"test-{uuid.uuid4()}",
+        )
+
+    async def test_group_send_across_processes(self):
+        name = str(uuid.uuid4())
+        # two layers with the same config behave like two daphne processes
+        sender = self.make_layer(name)
+        receiver = self.make_layer(name)
+        receiver.prefix = sender.prefix
+
+        channels = [await receiver.new_channel() for _ in range(4)]
+        for channel in channels:
+            await receiver.group_add("chat_1_2", channel)
+
+        await sender.group_send("chat_1_2", {"type": "chat.message", "n": 1})
+
+        for channel in channels:
+            message = await receiver.receive(channel)
+            self.assertEqual(message, {"type": "chat.message", "n": 1})
+
+        await sender.flush()
+        await sender.close_pools()
+        await receiver.close_pools()
+
+    async def test_groups_are_sharded(self):
+        layer = self.make_layer(str(uuid.uuid4()))
+
+        shards = {layer.consistent_hash(f"chat_{i}_1") for i in range(50)}
+        self.assertEqual(shards, {0, 1})
+
+        await layer.close_pools()
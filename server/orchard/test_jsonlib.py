@@ -0,0 +1,78 @@
+import datetime
+import decimal
+import io
+import uuid
+import zoneinfo
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+
+from orchard.jsonlib import BACKENDS, available, get_json_backend
+from orchard.parsers import JSONParser
+from orchard.renderers import JSONRenderer
+
+DATA = {
+    "id": uuid.UUID("c0a80121-7ac0-4e1b-8f4a-3c5d6e7f8091"),
+    "created_at": datetime.datetime(
+        2025, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.UTC
+    ),
+    "local": datetime.datetime(
+        2025, 1, 2, 8, 34, 5, tzinfo=zoneinfo.ZoneInfo("Asia/Kolkata")
+    ),
+    "day": datetime.date(2025, 1, 2),
+    "price": decimal.Decimal("1.50"),
+    "label": gettext_lazy("Hello"),
+    "content": "héllo 👋 </script> ",
+    "counts": {"👍": 2},
+    "items": [1, 2.5, None, True, ("a", "b")],
+}
+
+
+class JSONBackendTest(SimpleTestCase):
+    def test_backends_render_like_drf(self):
+        expected = renderers.JSONRenderer().render(DATA)
+        for backend in BACKENDS:
+            if not available(backend):
+                continue
+            with (
+                self.subTest(backend),
+                override_settings(JSON_BACKEND=backend),
+            ):
+                self.assertEqual(get_json_backend().name, backend)
+                self.assertEqual(JSONRenderer().render(DATA), expected)
+                self.assertEqual(
+                    get_json_backend().loads(get_json_backend().dumps(DATA)),
+                    get_json_backend().loads(expected),
+                )
+
+    @override_settings(JSON_BACKEND="orjson")
+    def test_falls_back_to_json(self):
+        with (
+            patch("orchard.jsonlib.available", return_value=False),
+            self.assertLogs("orchard.jsonlib", "WARNING"),
+        ):
+            self.assertEqual(get_json_backend().name, "json")
+
+    @override_settings(JSON_BACKEND="simplejson")
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_json_backend()
+
+    def test_indent_left_to_drf(self):
+        data = {"a": [1, 2]}
+        self.assertEqual(
+            JSONRenderer().render(data, "application/json; indent=2"),
+            renderers.JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+    def test_parser(self):
+        parser = JSONParser()
+        self.assertEqual(
+            parser.parse(io.BytesIO('{"content": "héllo"}'.encode())),
+            {"content": "héllo"},
+        )
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"content": '))
@@ -0,0 +1,43 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from orchard.services import (
+    SupabaseService,
+    get_http_client,
+    get_service_client,
+)
+
+
+class SupabaseServiceTest(SimpleTestCase):
+    def test_construction_builds_no_client(self):
+        with patch("orchard.services.create_client") as create_client:
+            for _ in range(10):
+                SupabaseService()
+                SupabaseService({"access_token": "a", "refresh_token": "r"})
+
+        create_client.assert_not_called()
+
+    def test_service_client_is_shared(self):
+        self.assertIs(SupabaseService().service_client, get_service_client())
+        self.assertIs(SupabaseService().service_client, get_service_client())
+
+    def test_user_clients_share_the_connection_pool(self):
+        service = SupabaseService()
+
+        self.assertIsNot(service.supabase, get_service_client())
+        self.assertIs(service.supabase.options.httpx_client, get_http_client())
+        self.assertIs(
+            get_service_client().options.httpx_client, get_http_client()
+        )
+
+    def test_get_user_with_jwt_uses_service_client(self):
+        service = SupabaseService()
+
+        with patch.object(
+            get_service_client().auth, "get_user", return_value="user"
+        ) as get_user:
+            self.assertEqual(service.get_user("token"), "user")
+
+        get_user.assert_called_once_with("token")
+        self.assertIsNone(service._supabase)
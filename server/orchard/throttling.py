@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from orchard.auth_cache import token_fingerprint
+
+
+class NegativeTokenCache:
+    """
+    Short-lived, bounded memory of tokens that failed verification, so a
+    client retrying a bad or expired token is rejected without verifying it
+    (or calling supabase auth) again.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self._entries: OrderedDict[bytes, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> str | None:
+        """The cached failure reason for ``token``, if any."""
+        key = token_fingerprint(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            error, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self.hits += 1
+            return error
+
+    def add(self, token: str, error: str) -> None:
+        if self.maxsize <= 0:
+            return
+
+        key = token_fingerprint(token)
+        with self._lock:
+            self._entries[key] = (error, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+
+
+class AuthFailureLimiter:
+    """
+    Per-client token bucket over failed authentications.
+
+    Each failure spends one token, tokens refill at ``rate`` per second up to
+    ``burst``. A client with an empty bucket is rejected before its token is
+    even looked at. At most ``max_clients`` buckets are kept (LRU).
+    """
+
+    def __init__(
+        self,
+        burst: float = 20,
+        rate: float = 1.0,
+        max_clients: int = 10_000,
+    ):
+        self.burst = burst
+        self.rate = rate
+        self.max_clients = max_clients
+        # client -> [tokens, last refill time]
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, client: str, now: float) -> list[float]:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self._buckets[client] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(
+                self.burst, bucket[0] + (now - bucket[1]) * self.rate
+            )
+            bucket[1] = now
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def allowed(self, client: str | None) -> bool:
+        """Whether ``client`` may attempt to authenticate."""
+        if not client:
+            return True
+
+        with self._lock:
+            if client not in self._buckets:
+                return True
+            return self._bucket(client, time.monotonic())[0] >= 1
+
+    def retry_after(self, client: str) -> float:
+        """Seconds until ``client`` may try again."""
+        with self._lock:
+            tokens = self._bucket(client, time.monotonic())[0]
+        return max(0.0, (1 - tokens) / self.rate) if self.rate else 0.0
+
+    def record_failure(self, client: str | None) -> None:
+        if not client:
+            return
+
+        with self._lock:
+            bucket = self._bucket(client, time.monotonic())
+            bucket[0] = max(0.0, bucket[0] - 1)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+@cache
+def get_negative_token_cache() -> NegativeTokenCache:
+    return NegativeTokenCache(
+        maxsize=settings.AUTH_NEGATIVE_CACHE_SIZE,
+        ttl=settings.AUTH_NEGATIVE_CACHE_TTL,
+    )
+
+
+@cache
+def get_auth_failure_limiter() -> AuthFailureLimiter:
+    return AuthFailureLimiter(
+        burst=settings.AUTH_FAILURE_BURST,
+        rate=settings.AUTH_FAILURE_RATE,
+    )
+
+
+@receiver(setting_changed)
+def _reset_throttling(setting: str, **kwargs):
+    if setting.startswith("AUTH_NEGATIVE_CACHE_"):
+        get_negative_token_cache.cache_clear()
+    elif setting.startswith("AUTH_FAILURE_"):
+        get_auth_failure_limiter.cache_clear()
@@ -0,0 +1,251 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Any
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from supabase import AuthError
+
+from orchard.services import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+HMAC_ALGORITHMS = ("HS256",)
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+class TokenError(Exception):
+    """
+    The token is malformed, expired, or fails signature/claim checks.
+    """
+
+
+class TokenVerificationUnavailable(TokenError):
+    """
+    The token could not be checked locally, e.g. no key is configured or the
+    JWKS endpoint could not be reached.
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class TokenClaims:
+    """
+    The subset of a Supabase access token we care about.
+    """
+
+    user_id: str
+    email: str | None
+    expires_at: float
+    user_metadata: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_payload(cls, payload: dict[str, Any]) -> "TokenClaims":
+        return cls(
+            user_id=payload["sub"],
+            email=payload.get("email"),
+            expires_at=float(payload["exp"]),
+            user_metadata=payload.get("user_metadata") or {},
+        )
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.time()
+
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens without calling Supabase Auth.
+
+    HS256 tokens are checked against the project JWT secret, RS256/ES256
+    tokens against the project's JWKS, which is fetched lazily and refreshed
+    every ``jwks_lifespan`` seconds (or sooner, on an unknown ``kid``).
+    """
+
+    def __init__(
+        self,
+        jwt_key: str | None = None,
+        jwks_url: str | None = None,
+        audience: str = "authenticated",
+        jwks_lifespan: int = 600,
+        leeway: int = 0,
+    ):
+        self.jwt_key = jwt_key
+        self.audience = audience
+        self.leeway = leeway
+        self.jwks_client = (
+            jwt.PyJWKClient(
+                jwks_url,
+                cache_jwk_set=True,
+                lifespan=jwks_lifespan,
+                timeout=5,
+            )
+            if jwks_url
+            else None
+        )
+
+    def needs_network(self, token: str) -> bool:
+        """
+        Whether verifying ``token`` may fetch the JWKS, i.e. block on I/O.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError:
+            return False
+
+        if header.get("alg") not in ASYMMETRIC_ALGORITHMS:
+            return False
+        if self.jwks_client is None:
+            return False
+
+        jwk_set_cache = self.jwks_client.jwk_set_cache
+        jwk_set = jwk_set_cache.get() if jwk_set_cache is not None else None
+        if jwk_set is None:
+            return True
+
+        # the cache holds the raw JWKS, an unknown kid makes PyJWKClient
+        # refetch it
+        kid = header.get("kid")
+        return not any(key.get("kid") == kid for key in jwk_set.get("keys", []))
+
+    def verify(self, token: str) -> TokenClaims:
+        """Verify signature, ``exp``, ``aud`` and ``sub`` of ``token``."""
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise TokenError(f"Malformed token: {e}") from e
+
+        algorithm = header.get("alg")
+        if algorithm in HMAC_ALGORITHMS:
+            if not self.jwt_key:
+                raise TokenVerificationUnavailable("SUPABASE_JWT_KEY not set")
+            key: Any = self.jwt_key
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            if self.jwks_client is None:
+                raise TokenVerificationUnavailable("No JWKS url configured")
+            try:
+                key = self.jwks_client.get_signing_key_from_jwt(token).key
+            except jwt.PyJWKClientConnectionError as e:
+                raise TokenVerificationUnavailable(str(e)) from e
+            except jwt.PyJWKClientError as e:
+                # unknown kid, even after refreshing the key set
+                raise TokenVerificationUnavailable(str(e)) from e
+        else:
+            raise TokenError(f"Unsupported token algorithm: {algorithm}")
+
+        try:
+            payload = jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                leeway=self.leeway,
+                options={"require": ["exp", "sub", "aud"]},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise TokenError("Token expired") from e
+        except jwt.PyJWTError as e:
+            raise TokenError(str(e)) from e
+
+        if not payload.get("sub"):
+            raise TokenError("Token has no subject")
+
+        return TokenClaims.from_payload(payload)
+
+
+@cache
+def get_token_verifier() -> TokenVerifier:
+    """Process-wide verifier, so the JWKS cache is shared by all requests."""
+    return TokenVerifier(
+        jwt_key=settings.SUPABASE_JWT_KEY,
+        jwks_url=settings.SUPABASE_JWKS_URL,
+        audience=settings.SUPABASE_JWT_AUDIENCE,
+        jwks_lifespan=settings.SUPABASE_JWKS_TTL,
+        leeway=settings.SUPABASE_JWT_LEEWAY,
+    )
+
+
+@receiver(setting_changed)
+def _reset_token_verifier(setting: str, **kwargs):
+    if setting.startswith("SUPABASE_"):
+        get_token_verifier.cache_clear()
+
+
+def verify_token_remote(token: str) -> TokenClaims:
+    """Verify ``token`` by asking Supabase Auth (one network round-trip)."""
+    try:
+        response = SupabaseService().get_user(token)
+    except AuthError as e:
+        raise TokenError(e.message) from e
+
+    if not response or not response.user:
+        raise TokenError("Token user not found")
+
+    # supabase already checked the signature, we only need the expiry
+    payload = jwt.decode(token, options={"verify_signature": False})
+
+    return TokenClaims(
+        user_id=response.user.id,
+        email=response.user.email,
+        expires_at=float(payload.get("exp", 0)),
+        user_metadata=response.user.user_metadata or {},
+    )
+
+
+def verify_token(token: str) -> TokenClaims:
+    """
+    Verify a Supabase access token.
+
+    Uses local verification unless ``SUPABASE_JWT_VERIFICATION`` is
+    ``"remote"``. If local verification is not possible and
+    ``SUPABASE_JWT_REMOTE_FALLBACK`` is enabled, Supabase Auth is asked instead.
+
+    Raises:
+        TokenError: if the token is not valid
+    """
+    if settings.SUPABASE_JWT_VERIFICATION == "remote":
+        return verify_token_remote(token)
+
+    try:
+        return get_token_verifier().verify(token)
+    except TokenVerificationUnavailable as e:
+        if not settings.SUPABASE_JWT_REMOTE_FALLBACK:
+            raise
+
+        logger.warning(f"Local token verification unavailable: {e}")
+        return verify_token_remote(token)
+
+
+async def _averify_token_remote(token: str) -> TokenClaims:
+    return await sync_to_async(verify_token_remote, thread_sensitive=False)(
+        token
+    )
+
+
+async def averify_token(token: str) -> TokenClaims:
+    """
+    Async version of :func:`verify_token`.
+
+    Local verification is pure CPU and runs inline; a remote check or a JWKS
+    fetch runs in a thread so the event loop is never blocked on I/O.
+    """
+    if settings.SUPABASE_JWT_VERIFICATION == "remote":
+        return await _averify_token_remote(token)
+
+    verifier = get_token_verifier()
+    try:
+        if verifier.needs_network(token):
+            return await sync_to_async(verifier.verify, thread_sensitive=False)(
+                token
+            )
+        return verifier.verify(token)
+    except TokenVerificationUnavailable as e:
+        if not settings.SUPABASE_JWT_REMOTE_FALLBACK:
+            raise
+
+        logger.warning(f"Local token verification unavailable: {e}")
+        return await _averify_token_remote(token)
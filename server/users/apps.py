@@ -1,6 +1,14 @@
+from typing import override
+
 from django.apps import AppConfig
 
 
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    @override
+    def ready(self) -> None:
+        import users.signals  # noqa
+
+        return super().ready()
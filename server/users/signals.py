@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from orchard.auth_cache import get_token_user_cache
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_token_user_cache(sender, instance: User, **kwargs):
+    # profile edits, deactivation and deletion must not be served stale
+    get_token_user_cache().invalidate_user(instance.pk)
@@ -1,6 +1,6 @@
 import logging
 from typing import override
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from django.contrib.auth.models import AnonymousUser
 from django.urls import reverse
@@ -229,3 +229,25 @@ class UsersTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(User.objects.count(), 3)
         self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_onboard_only_sets_the_onboarded_flag(self):
+        service = Mock()
+
+        def mock_session_middleware(middleware, request):
+            request.supabase = service
+
+        self.authenticate_user(self.user_token)
+        with patch(
+            "orchard.middleware.SupabaseSessionMiddleware.process_request",
+            new=mock_session_middleware,
+        ):
+            response = self.client.post(
+                "/api/v1/user/onboard/", {"status": "Ready"}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        service.update_user_admin.assert_called_once_with(
+            str(self.user.id), {"user_metadata": {"onboarded": True}}
+        )
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.onboarded)
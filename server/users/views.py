@@ -5,9 +5,9 @@ from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.request import Request
 from rest_framework.response import Response
-from supabase_auth.types import UserResponse
 
 from orchard.services import SupabaseService
+from orchard.tokens import TokenClaims
 from users.models import ColorChoices, User
 from users.serializers import (
     UserSerializer,
@@ -19,7 +19,7 @@ logger = logging.getLogger(__name__)
 class AuthenticatedRequest(Request):
     user: User
     supabase: SupabaseService
-    supabase_user: UserResponse
+    supabase_user: TokenClaims
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -62,9 +62,10 @@ class UserViewSet(viewsets.ModelViewSet):
         data = request.data
         logger.debug(f"Onboarding payload: {data}")
 
-        metadata = request.supabase_user.user.user_metadata.copy()
-        logger.debug(f"Current user metadata: {metadata}")
-        metadata["onboarded"] = True
+        # Supabase merges user_metadata: only the flag is sent, so keys
+        # changed since the token was issued (its user_metadata is the
+        # token's snapshot) aren't written back
+        metadata = {"onboarded": True}
 
         usr_avatar = data.get("avatar", "")
         usr_status = data.get("status", request.user.status)